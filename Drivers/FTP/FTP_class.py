@@ -1,60 +1,96 @@
-import time
-import json
-import os
-from dotenv import load_dotenv
-
-class FTP():
-    def __init__(self):
-        
-        load_dotenv('/home/pi/.env')
-        self.duration = 0
-        self.power_data = [0]
-        self.ftp = os.environ.get("FTP_SCORE")
-        self.current_power = 0
-        
-    def set_ftp(self, ftp):
-        self.ftp = ftp    
-    
-    def get_ftp(self):
-        return self.ftp
-    
-    def get_duration(self):
-        return self.duration
-    
-    def set_duration(self, duration):
-        self.duration = duration
-        
-    def get_power_data(self) -> list:
-        return self.power_data
-    
-    def set_power_data(self, input_data) -> list:
-        self.power_data = []
-        for x in input_data:
-            self.power_data.append(x)
-    
-    def calculate_ftp(self):
-        avg_power = sum(self.power_data) / len(self.power_data)
-        self.set_ftp(avg_power * 0.95)  
-        
-    # This is a callback function is to be used a message is received via MQTT in the FTP_Workout.py script,
-    # Its use case is only for the FTP workout mode, and it is not to be used in any other context
-    def read_remote_data(self, client, userdata, msg):
-        payload = msg.payload.decode("utf-8")
-        try:
-            # Attempt to parse the payload as JSON in line with incline and resistance script output
-            dict_of_payload = json.loads(payload)
-            power_value = dict_of_payload["value"]
-            temp = self.power_data[-1]
-            if temp != power_value:
-                print("Received " + msg.topic + " " + str(msg.qos) + " " + str(msg.payload))      
-            self.current_power = power_value
-        except json.JSONDecodeError:
-            # treat it as a singular string value
-            power_value = payload
-        
-        
-
-        
-        
-
-
+import time
+import os
+import sys
+import logging
+from dotenv import load_dotenv
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from lib.streaming_stats import StreamingStats
+from lib.compact_payload import decode_samples
+from lib.ftp_analytics import PowerResampler, estimate_ftp, analyze_power
+from lib.driver_log import get_logger
+from lib.constants import STATS_RING_BUFFER_SIZE, PUBLISH_BATCH_TOPIC_SUFFIX
+
+log = get_logger('ftp')
+
+class FTP():
+    def __init__(self):
+        
+        load_dotenv('/home/pi/.env')
+        self.duration = 0
+        self.power_data = StreamingStats(STATS_RING_BUFFER_SIZE)
+        self.power_timeline = PowerResampler()
+        self.ftp = os.environ.get("FTP_SCORE")
+        self.current_power = 0
+        self.recording = False
+        
+    def set_ftp(self, ftp):
+        self.ftp = ftp    
+    
+    def get_ftp(self):
+        return self.ftp
+    
+    def get_duration(self):
+        return self.duration
+    
+    def set_duration(self, duration):
+        self.duration = duration
+        
+    # The latest recorded power samples, the statistics cover the whole test
+    def get_power_data(self) -> list:
+        return self.power_data.get_samples()
+    
+    def set_power_data(self, input_data) -> list:
+        # The samples are taken as one per second
+        self.power_data = StreamingStats(STATS_RING_BUFFER_SIZE)
+        self.power_timeline = PowerResampler()
+        for second, x in enumerate(input_data):
+            self.power_data.add(x, second)
+            self.power_timeline.add(second, x)
+    
+    # FTP is 95% of the best 20 minute power of the test, resampled onto a 1 second timeline
+    def calculate_ftp(self):
+        self.set_ftp(estimate_ftp(self.power_timeline.get_series()))
+        
+    # NP, best power, and IF/TSS against the previous FTP score when there is one
+    def get_power_summary(self, previous_ftp=None):
+        return analyze_power(self.power_timeline.get_series(), ftp=previous_ftp)
+        
+    # Called by the workout engine when the test starts, every power sample from then on is recorded
+    def start_phase(self, phase):
+        print("FTP test started for", int(phase.end - phase.start), "seconds")
+        self.recording = True
+        
+    def stop_recording(self):
+        self.recording = False
+        
+    # This is a callback function is to be used a message is received via MQTT in the FTP_Workout.py script,
+    # Its use case is only for the FTP workout mode, and it is not to be used in any other context
+    def read_remote_data(self, client, userdata, msg):
+        if not msg.topic.endswith(('/power', '/' + PUBLISH_BATCH_TOPIC_SUFFIX)):
+            return
+        try:
+            # Attempt to parse the payload as JSON in line with incline and resistance script output, or as a compact frame
+            # a batch frame holds the samples of several channels, only its power samples are used
+            power_samples = [(sample["value"], sample.get("timestamp", time.time())) for topic, sample in decode_samples(msg.topic, msg.payload) if topic.endswith('/power')]
+        except (ValueError, KeyError, TypeError):
+            # a truncated compact frame, malformed JSON or a payload without a value is dropped
+            log.limited(logging.WARNING, 'invalid payload', "Invalid power payload: %s", msg.payload)
+            return
+
+        for power_value, timestamp in power_samples:
+            if self.current_power != power_value:
+                log.debug("Received %s %s %s", msg.topic, msg.qos, msg.payload)
+            self.current_power = power_value
+            if self.recording:
+                self.power_data.add(power_value, timestamp)
+                self.power_timeline.add(timestamp, power_value)
+        
+        
+
+        
+        
+
+
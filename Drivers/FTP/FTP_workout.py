@@ -1,101 +1,115 @@
-#!/usr/bin/env python3
-#! bin/bash
-#! bin/sh
-import sys
-import time
-import os
-from mqtt_client import MQTTClient
-from FTP_class import FTP
-from dotenv import load_dotenv, set_key
-import argparse
-
-parser = argparse.ArgumentParser(description="Run a FTP workout.")
-parser.add_argument("-r", "--resistance", type=int, help="Initial resistance level", required=True)
-parser.add_argument("-t", "--time", type=int, help="Duration of the FTP test in minutes", default=20)
-args = parser.parse_args()
-
-
-def perform_ftp_test(ftp_object, resistence_level):
-    ## Reads previously saved FTP value from the .env file
-    print("Current FTP: ", ftp_object.get_ftp())
-    print("Starting FTP test in 5 seconds...")
-    time.sleep(5)
-    
-    start_time = time.time()
-    ## Starts with the specified resistence level
-    mqtt_client.publish(f"bike/000001/resistance/control", resistence_level)
-    try:
-        #NOTE: adding a value in the command line will set the duration of the test in minutes
-        while time.time() - start_time < (ftp_object.duration*60):
-            # Counts up to the duration set by the user 
-            time.sleep(1)
-            if(ftp_object.power_data != None): 
-                print("Current power: ", ftp_object.power_data[-1])
-                print("Current time: ", time.time() - start_time)
-                # adds the current power to the power data list in FTP object
-                ftp_object.power_data.append(ftp_object.current_power)
-            else:
-                print("No power data received")
-
-    except KeyboardInterrupt:
-        print("Test stopped")
-        print("Count of data points given: " + str(len(ftp_object.power_data)))
-        pass
-
-def set_workout_duration(ftp_object, duration) -> None:
-    ftp_object.duration = duration
-    print(f"Duration set to {duration} minutes")
-
-    
-def main():
-    try:
-        # Load environment variables from pi's .env file
-        # This is necessary to get the MQTT credentials
-        # The .env file is not included in the repository
-        
-        #Instantiate FTP object and initialize duration to user set parameter
-        env_path = '/home/pi/.env'
-        load_dotenv(env_path)
-        ftp_object = FTP()
-        ftp_object.__init__()
-        global mqtt_client
-        global deviceId
-        set_workout_duration(ftp_object, args.time)
-        
-        # Initialize MQTT client and subscribe to power topic
-        mqtt_client = MQTTClient(os.getenv('MQTT_HOSTNAME'), os.getenv('MQTT_USERNAME'), os.getenv('MQTT_PASSWORD'))
-        deviceId = os.getenv('DEVICE_ID')
-        topic = f'bike/{deviceId}/power'
-        print(deviceId)
-        print(topic)
-        mqtt_client.setup_mqtt_client()
-        mqtt_client.subscribe(topic)
-        mqtt_client.get_client().on_message = ftp_object.read_remote_data
-        mqtt_client.get_client().loop_start()
-
-        resistence_topic = f'bike/{deviceId}/resistance'
-        print(deviceId)
-        print(resistence_topic)
-        mqtt_client.setup_mqtt_client()
-        mqtt_client.subscribe(resistence_topic)
-        mqtt_client.get_client().on_message = ftp_object.read_remote_data
-        
-        # Start FTP test
-        print("Starting the FTP test...")
-        resistance_level = args.resistance
-        perform_ftp_test(ftp_object, resistance_level)
-        ftp_object.calculate_ftp()
-        result = ftp_object.get_ftp()
-        print(f"Your estimated FTP is: {result:.2f} watts")
-        print("Test complete, saving FTP to file...")
-        set_key(env_path, 'FTP_SCORE', str(result))
-        
-    except KeyboardInterrupt:
-        pass
-    mqtt_client.get_client().loop_stop()
-    
-if __name__ == "__main__":
-    main()
-
-
-
+#!/usr/bin/env python3
+#! bin/bash
+#! bin/sh
+import sys
+import time
+import os
+from mqtt_client import MQTTClient
+from FTP_class import FTP
+from dotenv import load_dotenv, set_key
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from lib.mqtt_mux import create_mqtt_client
+from lib.compact_payload import batch_topic
+from lib.workout_schedule import load_schedule, compile_schedule
+from lib.workout_engine import WorkoutEngine
+import argparse
+
+parser = argparse.ArgumentParser(description="Run a FTP workout.")
+parser.add_argument("-r", "--resistance", type=int, help="Initial resistance level", required=True)
+parser.add_argument("-t", "--time", type=int, help="Duration of the FTP test in minutes", default=20)
+args = parser.parse_args()
+
+FTP_SCHEDULE = os.path.join(root_folder, 'workout_engine', 'schedules', 'ftp.json')
+
+def perform_actions(target, level):
+    mqtt_client.publish(f"bike/{deviceId}/{target}/control", str(level))
+
+def perform_ftp_test(ftp_object, resistence_level):
+    ## Reads previously saved FTP value from the .env file
+    print("Current FTP: ", ftp_object.get_ftp())
+    print("Starting FTP test in 5 seconds...")
+    time.sleep(5)
+    
+    ## Starts with the specified resistence level, and records every power sample until the end of the test
+    #NOTE: adding a value in the command line will set the duration of the test in minutes
+    timeline = compile_schedule(load_schedule(FTP_SCHEDULE), {'resistance': resistence_level, 'time': ftp_object.duration})
+    engine = WorkoutEngine(timeline, perform_actions, on_phase=ftp_object.start_phase)
+    try:
+        engine.run()
+    except KeyboardInterrupt:
+        engine.stop()
+        print("Test stopped")
+        print("Count of data points given: " + str(len(ftp_object.power_data)))
+        pass
+    ftp_object.stop_recording()
+
+def print_power_summary(summary):
+    print(f"Average power: {summary['averagePower']:.1f} W, Normalized Power: {summary['normalizedPower']:.1f} W")
+    for duration, best in summary['bestPower'].items():
+        if best is not None:
+            print(f"Best {duration} second power: {best:.1f} W")
+    if 'intensityFactor' in summary:
+        print(f"IF: {summary['intensityFactor']:.2f}, TSS: {summary['trainingStressScore']:.1f}")
+
+def set_workout_duration(ftp_object, duration) -> None:
+    ftp_object.duration = duration
+    print(f"Duration set to {duration} minutes")
+
+    
+def main():
+    try:
+        # Load environment variables from pi's .env file
+        # This is necessary to get the MQTT credentials
+        # The .env file is not included in the repository
+        
+        #Instantiate FTP object and initialize duration to user set parameter
+        env_path = '/home/pi/.env'
+        load_dotenv(env_path)
+        ftp_object = FTP()
+        ftp_object.__init__()
+        global mqtt_client
+        global deviceId
+        set_workout_duration(ftp_object, args.time)
+        
+        # Initialize MQTT client and subscribe to power topic
+        mqtt_client = create_mqtt_client(MQTTClient, os.getenv('MQTT_HOSTNAME'), os.getenv('MQTT_USERNAME'), os.getenv('MQTT_PASSWORD'))
+        deviceId = os.getenv('DEVICE_ID')
+        topic = f'bike/{deviceId}/power'
+        print(deviceId)
+        print(topic)
+        mqtt_client.setup_mqtt_client()
+        mqtt_client.subscribe(topic)
+        # in the batch publish mode the power samples come in the batch frames of the bike
+        mqtt_client.subscribe(batch_topic(topic))
+
+        resistence_topic = f'bike/{deviceId}/resistance'
+        print(deviceId)
+        print(resistence_topic)
+        mqtt_client.subscribe(resistence_topic)
+        mqtt_client.get_client().on_message = ftp_object.read_remote_data
+        mqtt_client.get_client().loop_start()
+        
+        # Start FTP test
+        print("Starting the FTP test...")
+        resistance_level = args.resistance
+        previous_ftp = ftp_object.get_ftp()
+        perform_ftp_test(ftp_object, resistance_level)
+        ftp_object.calculate_ftp()
+        result = ftp_object.get_ftp()
+        print(f"Your estimated FTP is: {result:.2f} watts")
+        print_power_summary(ftp_object.get_power_summary(float(previous_ftp) if previous_ftp else None))
+        print("Test complete, saving FTP to file...")
+        set_key(env_path, 'FTP_SCORE', str(result))
+        
+    except KeyboardInterrupt:
+        pass
+    mqtt_client.get_client().loop_stop()
+    
+if __name__ == "__main__":
+    main()
+
+
+
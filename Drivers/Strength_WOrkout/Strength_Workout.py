@@ -2,88 +2,77 @@
 #! bin/bash
 #! bin/sh
 import sys
-import csv
 import time
 import os
-import json
 import argparse
 from mqtt_client import MQTTClient
 from StrengthWorkout_class import StrengthWorkout
 from dotenv import load_dotenv, set_key
 
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from lib.mqtt_mux import create_mqtt_client
+from lib.distance_accumulator import DistanceAccumulator, parse_speed_samples
+from lib.compact_payload import batch_topic
+from lib.workout_schedule import load_schedule, compile_schedule
+from lib.workout_engine import WorkoutEngine
+
 MAX_WORKOUT_DURATION = 20  # Maximum duration of the workout in minutes
+STRENGTH_SCHEDULE = os.path.join(root_folder, 'workout_engine', 'schedules', 'strength.json')
 
 parser = argparse.ArgumentParser(description="Run a strength workout.")
 parser.add_argument("-t", "--time", type=int, help="Workout time in minutes", default=20)
 parser.add_argument("-d", "--distance", type=float, help="Target distance in kilometers", required=True)
 parser.add_argument("-r", "--resistance", type=int, help="Initial resistance level", required=True)
+parser.add_argument("--speed_log_file", type=str, help="Optionally log the speed samples to this CSV file", default=None)
 args = parser.parse_args()
 
-def perform_actions(resistence_level):
-    mqtt_client.publish(f"bike/000001/resistance/control", resistence_level)
+def perform_actions(target, level):
+    mqtt_client.publish(f"bike/{deviceId}/{target}/control", str(level))
 
 
 # Global Variables
-speed_data_file = 'speed_data.csv'
+distance_accumulator = DistanceAccumulator(log_file=args.speed_log_file)
+distance_goal = None
+engine = None
 
 def record_speed_data(client, userdata, message):
-    """Callback function to handle incoming speed data and write to a CSV."""
-    with open(speed_data_file, 'a', newline='') as csvfile:
-        writer = csv.writer(csvfile)
-        payload = message.payload.decode("utf-8")
-        dict_of_payload = json.loads(payload)
-        speed = dict_of_payload["value"]
-        writer.writerow([time.time(), speed])  # write current time and speed value
+    """Callback function to handle incoming speed data and add it to the running distance."""
+    try:
+        speed_samples = parse_speed_samples(message.topic, message.payload)
+    except (ValueError, KeyError, TypeError):
+        print("Invalid speed payload: " + str(message.payload))
+        return
+    for speed, timestamp in speed_samples:
+        distance_accumulator.add_sample(speed, timestamp)
+
+    # The workout ends as soon as the target distance is reached
+    if engine is not None and not engine.stopped.is_set() and distance_accumulator.get_distance() >= distance_goal:
+        print(f"Target distance of {distance_goal} km reached!")
+        engine.stop()
 
 
 def perform_strength_workout(strength_workout_object, target_distance, resistance_level):
     print("Starting strength workout in 5 seconds...")
     time.sleep(5)
-    start_time = time.time()    
-    
-    try:
-        while True:
-            current_time = time.time() - start_time
-            distance_covered = calculate_distance_from_csv()
-            
-            if distance_covered >= target_distance:
-                print(f"Target distance of {target_distance} km reached!")
-                break
-            
-            if current_time >= (strength_workout_object.duration * 60) or current_time >= (MAX_WORKOUT_DURATION * 60):
-                break
-
-            # Store the resistance level in the strength workout object
-            strength_workout_object.resistance_data.append(resistance_level)
-
-            # Perform the strength workout action based on the resistance level
-            perform_actions(resistance_level)
-
-            if current_time % 120 == 0 and resistance_level < 96:
-                resistance_level += 5
 
-            time.sleep(1)
+    # The resistance goes up by 5 every 2 minutes, the workout engine only sends it when it changes
+    duration = min(strength_workout_object.duration, MAX_WORKOUT_DURATION)
+    timeline = compile_schedule(load_schedule(STRENGTH_SCHEDULE), {'resistance': resistance_level, 'time': duration})
+    global engine
+    global distance_goal
+    distance_goal = target_distance
+    engine = WorkoutEngine(timeline, perform_actions)
 
+    try:
+        engine.run()
     except KeyboardInterrupt:
+        engine.stop()
         print("Workout stopped")
         print("Count of data points given: " + str(len(strength_workout_object.resistance_data)))
 
 
-def calculate_distance_from_csv():
-    last_time = None
-    distance = 0.0  # in kilometers or the unit of speed
-
-    with open(speed_data_file, 'r') as csvfile:
-        reader = csv.reader(csvfile)
-        for row in reader:
-            current_time, speed = float(row[0]), float(row[1])  # Extract time and speed
-            if last_time:  # Skip the first row
-                time_difference = current_time - last_time  # Time difference in seconds
-                distance += (speed * (time_difference / 3600))  # speed * time (converted to hours)
-            last_time = current_time
-
-    return distance
-
 def main():
     try:
         # Load environment variables from the .env file
@@ -99,19 +88,26 @@ def main():
 
 
         # Initialize MQTT client and subscribe to resistance topic
-        mqtt_client = MQTTClient(os.getenv('MQTT_HOSTNAME'), os.getenv('MQTT_USERNAME'), os.getenv('MQTT_PASSWORD'))
+        mqtt_client = create_mqtt_client(MQTTClient, os.getenv('MQTT_HOSTNAME'), os.getenv('MQTT_USERNAME'), os.getenv('MQTT_PASSWORD'))
         deviceId = os.getenv('DEVICE_ID')
         topic = f'bike/{deviceId}/resistance'
         print(deviceId)
         print(topic)
         mqtt_client.setup_mqtt_client()
         mqtt_client.subscribe(topic)
-        mqtt_client.get_client().on_message = strength_workout_object.read_remote_data
-
-        mqtt_client.get_client().loop_start()
         speed_topic = f'bike/{deviceId}/speed'
         mqtt_client.subscribe(speed_topic)
-        mqtt_client.get_client().on_message = record_speed_data
+        # in the batch publish mode the speed samples come in the batch frames of the bike
+        mqtt_client.subscribe(batch_topic(speed_topic))
+
+        # speed samples go to the distance accumulator, the resistance reports to the workout object
+        def on_message(client, userdata, message):
+            if message.topic in (speed_topic, batch_topic(speed_topic)):
+                record_speed_data(client, userdata, message)
+            else:
+                strength_workout_object.read_remote_data(client, userdata, message)
+        mqtt_client.get_client().on_message = on_message
+        mqtt_client.get_client().loop_start()
 
         # Start the strength workout
         target_distance = args.distance
@@ -120,11 +116,12 @@ def main():
         print("Starting the strength workout...")
         perform_strength_workout(strength_workout_object, target_distance, resistance_level)
         print("Workout complete.")
-        print(f"Total distance covered: {calculate_distance_from_csv()} kilometers")
+        print(f"Total distance covered: {distance_accumulator.get_distance()} kilometers")
 
     except KeyboardInterrupt:
         pass
     mqtt_client.get_client().loop_stop()
+    distance_accumulator.close()
 
 if __name__ == "__main__":
     main()
@@ -1,22 +1,30 @@
 import os
+import sys
 import time
-import json
 from dotenv import load_dotenv
 
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from lib.streaming_stats import StreamingStats
+from lib.compact_payload import decode_samples, batch_topic
+from lib.constants import STATS_RING_BUFFER_SIZE
+
 class ThresholdWorkout:
     def __init__(self):
         load_dotenv('home/pi/.env')
         self.threshold_workout = os.environ.get('THRESHOLD_WORKOUT_SCORE')
         self.current_power = 0
-        self.power_data = []
+        self.power_data = StreamingStats(STATS_RING_BUFFER_SIZE)
         self.calories = 0
         self.current_speed = 0
-        self.speed_data = []
+        self.speed_data = StreamingStats(STATS_RING_BUFFER_SIZE)
         self.distance = 0
         self.interval = 0
         self.duration = 0
         self.rest = 0
         self.threshold_power = 0
+        self.interval_count = 0
         
     # set and get variables
     def set_interval(self, interval):
@@ -47,7 +55,7 @@ class ThresholdWorkout:
     # Calculate distance travelled
     def calculate_distance(self):
         # formula - distance(m) = speed(m/s)*time(second)
-        speed = sum(self.speed_data) / len(self.speed_data)
+        speed = self.speed_data.time_weighted_mean()
         time = (self.duration * self.interval) * 60
         dist = speed * time
         
@@ -58,7 +66,7 @@ class ThresholdWorkout:
     # Calculate calories burnt
     def calculate_calories(self):
         # formula - Cal(kcal) = avg_power(Watts)*time(hour)*3.6
-        avg_power = sum(self.power_data) / len(self.power_data)
+        avg_power = self.power_data.time_weighted_mean()
         time = (self.duration * self.interval) / 60
         Cal = avg_power * time * 3.6
         
@@ -70,27 +78,43 @@ class ThresholdWorkout:
     def calculate_power_poer_second(self):
         pass
     
+    # Called by the workout engine when an interval or a rest starts,
+    # the samples in between are handled by read_message as they arrive
+    def start_phase(self, phase):
+        if phase.type == 'rest':
+            print('Interval number', self.interval_count, 'complete')
+            print('Resting for', int(phase.end - phase.start), 'seconds')
+        else:
+            self.interval_count += 1
+            print('Starting threshold workout')
+            print('Interval number: ', self.interval_count)
+    
     
     # Receive message
     def read_message(self, client, userdata, msg):
         deviceId = os.getenv('DEVICE_ID')
+        power_topic = f'bike/{deviceId}/power'
+        speed_topic = f'bike/{deviceId}/speed'
+        if msg.topic not in (power_topic, speed_topic, batch_topic(power_topic)):
+            return
+
+        try:
+            # a batch frame holds the samples of several channels, each one is handled as if it came on its own topic
+            samples = [(topic, sample['value'], sample.get('timestamp', time.time())) for topic, sample in decode_samples(msg.topic, msg.payload) if topic in (power_topic, speed_topic)]
+        except (ValueError, KeyError, TypeError):
+            # a truncated compact frame or a payload that isn't a sample
+            print("Invalid payload on " + msg.topic + ": " + str(msg.payload))
+            return
         
-        # Get power data from MQTT
-        if msg.topic == f'bike/{deviceId}/power':
-            power_payload = msg.payload.decode('utf-8')
-            dict_of_power_payload = json.loads(power_payload)
-            power_value = dict_of_power_payload['value']
-            # print("Received " + msg.topic + " " + str(msg.qos) + " " + str(msg.payload))
-            self.current_power = power_value
-            self.check_threshold()
-            self.power_data.append(power_value)
-            
-        # Get speed data from MQTT
-        if msg.topic == f'bike/{deviceId}/speed':
-            speed_payload = msg.payload.decode('utf-8')
-            dict_of_speed_payload = json.loads(speed_payload)
-            speed_value = dict_of_speed_payload["value"]
-            # print("Received " + msg.topic + " " + str(msg.qos) + " " + str(msg.payload))
-            self.current_speed = speed_value
-            self.speed_data.append(speed_value)
+        for topic, value, timestamp in samples:
+            # Get power data from MQTT
+            if topic == power_topic:
+                self.current_power = value
+                self.check_threshold()
+                self.power_data.add(value, timestamp)
+                
+            # Get speed data from MQTT
+            if topic == speed_topic:
+                self.current_speed = value
+                self.speed_data.add(value, timestamp)
             
\ No newline at end of file
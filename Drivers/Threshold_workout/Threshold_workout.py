@@ -5,6 +5,19 @@ from mqtt_client import MQTTClient
 from Threshold_class import ThresholdWorkout
 from dotenv import load_dotenv, set_key
 
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from lib.mqtt_mux import create_mqtt_client
+from lib.compact_payload import batch_topic
+from lib.workout_schedule import load_schedule, compile_schedule
+from lib.workout_engine import WorkoutEngine
+
+THRESHOLD_SCHEDULE = os.path.join(root_folder, 'workout_engine', 'schedules', 'threshold.json')
+
+def perform_actions(target, level):
+    mqtt_client.publish(f"bike/{deviceId}/{target}/control", str(level))
+
 def perform_threshold_workout(threshold_object):
     # Countdown
     for i in range(5):
@@ -12,22 +25,16 @@ def perform_threshold_workout(threshold_object):
         time.sleep(1)
     print('Good Luck!!!')
     
-    # Start timer
-    start_time = time.time()
+    # The workout engine only wakes up at the interval and rest boundaries,
+    # the power and speed samples are handled by threshold_object.read_message as they arrive
+    params = {'interval': threshold_object.get_interval(), 'duration': threshold_object.get_duration(), 'rest': threshold_object.get_rest()}
+    timeline = compile_schedule(load_schedule(THRESHOLD_SCHEDULE), params)
+    engine = WorkoutEngine(timeline, perform_actions, on_phase=threshold_object.start_phase)
     
-    # Fetch data from sensor while in workout duration
     try:
-        while time.time() - start_time < (threshold_object.get_duration()*60):
-            time.sleep(1)
-            if threshold_object.current_power is not None:
-                print('Current Speed:', threshold_object.current_speed)
-                print('Current power:', threshold_object.current_power)
-                print('Threshold power: ', threshold_object.get_threshold_power())
-                print('-------------------------------')
-            else:
-                print('No power data received')
-                
+        engine.run()
     except KeyboardInterrupt:
+        engine.stop()
         print('Workout stopped')
         print('Count of data points given: ' + str(len(threshold_object.power_data)))
         mqtt_client.get_client().loop_stop()
@@ -59,16 +66,9 @@ def user_input(threshold_object):
     
 def start_workout(threshold_object):
     
-    # Start Threshold workout, looping for amount of interval
-    for i in range(threshold_object.get_interval()):
-        print('Starting threshold workout')
-        print('Interval number: ', i+1)
-        perform_threshold_workout(threshold_object)
-        print('Interval number', i+1, 'complete')
-        # Rest between each interval, in the last interval no rest
-        if i+1 != threshold_object.get_interval():
-            print('Resting for', threshold_object.get_rest(), 'seconds')
-            time.sleep(threshold_object.get_rest())
+    # Start Threshold workout, the intervals and the rests between them are timed by the workout engine
+    perform_threshold_workout(threshold_object)
+    print('Interval number', threshold_object.interval_count, 'complete')
             
     print('Congratulations on finishing your workout!!!')
     # possible improvement - create calculation, print result
@@ -92,7 +92,7 @@ def main():
         user_input(threshold_object)
         
         # Initialize MQTT client and subcribe to power topic
-        mqtt_client = MQTTClient(os.getenv('MQTT_HOSTNAME'), os.getenv('MQTT_USERNAME'), os.getenv('MQTT_PASSWORD'))
+        mqtt_client = create_mqtt_client(MQTTClient, os.getenv('MQTT_HOSTNAME'), os.getenv('MQTT_USERNAME'), os.getenv('MQTT_PASSWORD'))
         deviceId = os.getenv('DEVICE_ID')
         topic1 = f'bike/{deviceId}/power'
         topic2 = f'bike/{deviceId}/speed'
@@ -102,9 +102,10 @@ def main():
         mqtt_client.setup_mqtt_client()
         mqtt_client.subscribe(topic1)
         mqtt_client.subscribe(topic2)
+        # in the batch publish mode the power and speed samples come in the batch frames of the bike
+        mqtt_client.subscribe(batch_topic(topic1))
         mqtt_client.get_client().on_message = threshold_object.read_message
         mqtt_client.get_client().loop_start()
-        time.sleep(1)
         
         # Start workout program
         start_workout(threshold_object)
@@ -2,9 +2,15 @@ import tkinter as tk
 from tkinter import ttk
 from PIL import Image, ImageTk
 import time
-import json
+import os
+import sys
 from mqtt_client import MQTTClient
 
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from lib.compact_payload import decode_samples, batch_topic
+
 # Global variables for GUI
 resistance_var = None
 incline_var = None
@@ -76,61 +82,44 @@ def read_message(client, userdata, msg):
     print("message received")
     print(msg.payload)
     
-    if msg.topic == f'bike/000001/power':
-        print("Received " + msg.topic + " " + str(msg.qos) + " " + str(msg.payload))
-        power_payload = msg.payload.decode('utf-8')
-        try:   
-            dict_of_power_payload = json.loads(power_payload)
-            power = dict_of_power_payload['value']
-        except json.JSONDecodeError:
-            power = power_payload
-        power_var.set(f"{power} Watts")
-        
-    # Get speed data from MQTT
-    if msg.topic == f'bike/000001/speed':
-        print("Received " + msg.topic + " " + str(msg.qos) + " " + str(msg.payload))
-        speed_payload = msg.payload.decode('utf-8')
-        try:
-            dict_of_speed_payload = json.loads(speed_payload)
-            speed = dict_of_speed_payload["value"]
-        except json.JSONDecodeError:
-            speed = speed_payload
-            
-       # calculate_distance(speed)
-        speed = str(round(speed, 2))
-        speed_var.set(f"{speed} m/s")
-
-    if msg.topic == f'bike/000001/cadence':
-        print("Received " + msg.topic + " " + str(msg.qos) + " " + str(msg.payload))
-        rpm_payload = msg.payload.decode('utf-8')
-        try:
-            dict_of_rpm_payload = json.loads(rpm_payload)
-            rpm = dict_of_rpm_payload["value"]
-        except json.JSONDecodeError:
-            rpm = rpm_payload
-        rpm_var.set(f"{rpm} RPM")
-    
     if msg.topic == f'bike/000001/incline/control':
         incline_payload = msg.payload.decode('utf-8')
         print("Received " + msg.topic + " " + str(msg.qos) + " " + str(msg.payload))
         incline_var.set(f"{incline_payload} %")
+        return
     
     if msg.topic == f'bike/000001/resistance/control':
         resistance_payload = msg.payload.decode('utf-8')
         print("Received " + msg.topic + " " + str(msg.qos) + " " + str(msg.payload))
         resistance_var.set(f"{resistance_payload} %")
-        
-    # Get Heartrate Data from MQTT
-    if msg.topic == f'bike/000001/heartrate':
-        print("Received " + msg.topic + " " + str(msg.qos) + " " + str(msg.payload))
-        heart_payload = msg.payload.decode('utf-8')
-        try:
-            dict_of_heart_payload = json.loads(heart_payload)
-            heart = dict_of_heart_payload["value"]
-        except json.JSONDecodeError:
-            heart = heart_payload
+        return
+
+    print("Received " + msg.topic + " " + str(msg.qos) + " " + str(msg.payload))
+    try:
+        # JSON, or a compact frame when the drivers use the compact payload encoding
+        # a batch frame holds the samples of several channels, each one is shown as if it came on its own topic
+        samples = [(topic, sample["value"]) for topic, sample in decode_samples(msg.topic, msg.payload)]
+    except (ValueError, KeyError, TypeError):
+        # a truncated compact frame or a payload that isn't a sample is dropped
+        print("Invalid payload on " + msg.topic + ": " + str(msg.payload))
+        return
+
+    for topic, value in samples:
+        if topic == f'bike/000001/power':
+            power_var.set(f"{value} Watts")
+            
+        # Get speed data from MQTT
+        if topic == f'bike/000001/speed':
+           # calculate_distance(speed)
+            speed = str(round(value, 2))
+            speed_var.set(f"{speed} m/s")
+
+        if topic == f'bike/000001/cadence':
+            rpm_var.set(f"{value} RPM")
             
-        heartbeat_rate_var.set(f"{heart} BPM")
+        # Get Heartrate Data from MQTT
+        if topic == f'bike/000001/heartrate':
+            heartbeat_rate_var.set(f"{value} BPM")
 
 def calculate_distance(speed):
     global start_time, distance_traveled
@@ -169,6 +158,8 @@ def main():
         mqtt_client.subscribe(topic4)
         mqtt_client.subscribe(topic5)
         mqtt_client.subscribe(topic6)
+        # in the batch publish mode the sensor samples come in the batch frames of the bike
+        mqtt_client.subscribe(batch_topic(topic1))
         
         mqtt_client.get_client().on_message = read_message
         mqtt_client.get_client().loop_start()
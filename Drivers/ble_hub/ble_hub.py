@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+from argparse import ArgumentParser
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from lib.ble_hub import SharedMQTTClient, DeviceHandler, HubDeviceManager, load_driver, kickr_args
+from lib.mqtt_batch_publisher import create_publisher
+from lib.compact_payload import create_payload_encoder, batch_topic
+from lib.publish_filter import create_publish_filter
+from lib.mqtt_mux import MuxMQTTClient
+from lib.latency_tracer import start_latency_reporting
+from lib.constants import PUBLISH_MODES, PUBLISH_MODE_IMMEDIATE, PUBLISH_WINDOW, PUBLISH_BUFFERED_CHANNELS, PAYLOAD_ENCODINGS, PAYLOAD_ENCODING_JSON, PUBLISH_IDLE_LIMIT, PUBLISH_HEARTBEAT_INTERVAL, GATT_ATTRIBUTE_CACHE_FILE, MQTT_MUX_SOCKET_ENV, LATENCY_REPORT_FILE, LATENCY_REPORT_TOPIC_SUFFIX
+
+HUB_DRIVERS = ('kickr', 'fan', 'heartrate', 'cadence')
+
+# each driver filters its own samples, with the publish filter options of the hub
+def hub_publish_filter(args):
+    return create_publish_filter(args.idle_limit, args.publish_deadbands, args.heartbeat_interval)
+
+# build a handler for every driver that is enabled and configured, all of them use the same MQTT client and publisher
+def create_handlers(args, mqtt_client, publisher):
+    handlers = []
+
+    if 'kickr' in args.drivers and args.kickr_mac_address:
+        wahoo_device = load_driver('wahoo_device', 'kickr_climb_and_smart_trainer', 'wahoo_device.py')
+        device_args = kickr_args(args)
+
+        def connect_kickr(mac_address, manager):
+            device = wahoo_device.WahooDevice(mac_address=mac_address, manager=manager, args=device_args, mqtt_client=mqtt_client, publisher=publisher)
+            device.connect()
+            return device
+
+        handlers.append(DeviceHandler('kickr', connect_kickr, mac_address=args.kickr_mac_address))
+
+    if 'fan' in args.drivers and args.fan_alias_prefix:
+        fan = load_driver('fan', 'fan', 'fan.py')
+        fan.setup(mqtt_client, publisher, args.device_id, create_payload_encoder(args.payload_encoding, mqtt_client), hub_publish_filter(args))
+        # the speed samples come in the batch frames too in the batch publish mode
+        for topic_name in (f"bike/{args.device_id}/speed", batch_topic(f"bike/{args.device_id}/speed")):
+            mqtt_client.add_message_callback(topic_name, fan.message)
+        handlers.append(DeviceHandler('fan', fan.connect_device, alias_prefix=args.fan_alias_prefix))
+
+    if 'heartrate' in args.drivers and args.heart_rate_alias_prefix:
+        heartrate = load_driver('heartrate', 'heart_rate_sensor', 'heartrate.py')
+        heartrate.setup(mqtt_client, publisher, args.device_id, create_payload_encoder(args.payload_encoding, mqtt_client), hub_publish_filter(args))
+        handlers.append(DeviceHandler('heartrate', heartrate.connect_device, alias_prefix=args.heart_rate_alias_prefix))
+
+    if 'cadence' in args.drivers and args.cadence_alias_prefix:
+        cadence = load_driver('cadence', 'cadence_sensor', 'cadence.py')
+        cadence.setup(mqtt_client, publisher, args.device_id, create_payload_encoder(args.payload_encoding, mqtt_client), hub_publish_filter(args))
+        handlers.append(DeviceHandler('cadence', cadence.connect_device, alias_prefix=args.cadence_alias_prefix))
+
+    return handlers
+
+# define CLI parse arguments, the defaults are read from the same environment variables (~/.env) the separate drivers use
+parser = ArgumentParser(description="Run the Kickr, fan, heart rate and cadence drivers of a bike in one process, with one BLE device manager and one MQTT connection")
+
+parser.add_argument('--drivers', dest='drivers', nargs='+', choices=HUB_DRIVERS, help='the drivers to run, a driver is skipped when its device is not configured', default=list(HUB_DRIVERS))
+parser.add_argument('--adapter_name', dest='adapter_name', type=str, help='the bluetooth adapter shared by all the devices', default=os.getenv('HUB_ADAPTER_NAME', 'hci0'))
+parser.add_argument('--device_id', dest='device_id', type=str, help='the bike id used in the MQTT topics', default=os.getenv('DEVICE_ID'))
+
+# BLE devices
+parser.add_argument('--kickr_mac_address', dest='kickr_mac_address', type=str, help="The Wahoo Kickr BLE Device's unique mac address", default=os.getenv('KICKR_MAC_ADDRESS'))
+parser.add_argument('--fan_alias_prefix', dest='fan_alias_prefix', type=str, help='the alias prefix of the Headwind fan', default=os.getenv('FAN_ALIAS_PREFIX'))
+parser.add_argument('--heart_rate_alias_prefix', dest='heart_rate_alias_prefix', type=str, help='the alias prefix of the heart rate sensor', default=os.getenv('HEART_RATE_ALIAS_PREFIX'))
+parser.add_argument('--cadence_alias_prefix', dest='cadence_alias_prefix', type=str, help='the alias prefix of the cadence sensor', default=os.getenv('CADENCE_ALIAS_PREFIX'))
+parser.add_argument('--gatt_cache_file', dest='gatt_cache_file', type=str, help='a local file to cache the characteristic values of the Kickr in', default=GATT_ATTRIBUTE_CACHE_FILE)
+
+# HiveMQ connection params
+parser.add_argument('--broker_address', dest='broker_address', type=str, help='The MQTT broker address getting from HiveMQ Cloud', default=os.getenv('MQTT_HOSTNAME'))
+parser.add_argument('--username', dest='username', type=str, help='HiveMQ Cloud username', default=os.getenv('MQTT_USERNAME'))
+parser.add_argument('--password', dest='password', type=str, help='HiveMQ Cloud password', default=os.getenv('MQTT_PASSWORD'))
+parser.add_argument('--mqtt_mux_socket', dest='mqtt_mux_socket', type=str, help='the Unix socket of the local MQTT multiplexer (Drivers/mqtt_mux), to share its connection instead of opening a new one', default=os.getenv(MQTT_MUX_SOCKET_ENV))
+
+# MQTT publishing params
+parser.add_argument('--publish_mode', dest='publish_mode', type=str, choices=PUBLISH_MODES, help='immediate: publish every sample, batch: send one batched frame per bike every window, latest: send only the latest value per topic every window', default=os.getenv('MQTT_PUBLISH_MODE', PUBLISH_MODE_IMMEDIATE))
+parser.add_argument('--publish_window', dest='publish_window', type=float, help='how many seconds to collect samples for in the batch and latest publish modes', default=float(os.getenv('MQTT_PUBLISH_WINDOW', PUBLISH_WINDOW)))
+parser.add_argument('--payload_encoding', dest='payload_encoding', type=str, choices=PAYLOAD_ENCODINGS, help='json: a JSON object per sample, compact: a 14 byte frame per sample with the unit and device name in a retained descriptor topic', default=os.getenv('MQTT_PAYLOAD_ENCODING', PAYLOAD_ENCODING_JSON))
+parser.add_argument('--idle_limit', dest='idle_limit', type=int, help='how many zero samples in a row are published on a topic before the next ones are suppressed, -1 publishes them all', default=int(os.getenv('MQTT_IDLE_LIMIT', PUBLISH_IDLE_LIMIT)))
+parser.add_argument('--publish_deadbands', dest='publish_deadbands', type=str, help='the smallest change published per channel, e.g. speed=0.1,power=5', default=os.getenv('MQTT_PUBLISH_DEADBANDS', ''))
+parser.add_argument('--heartbeat_interval', dest='heartbeat_interval', type=float, help='seconds after which a suppressed sample is published anyway, 0 disables the heartbeats', default=float(os.getenv('MQTT_HEARTBEAT_INTERVAL', PUBLISH_HEARTBEAT_INTERVAL)))
+
+# latency tracing params
+parser.add_argument('--latency_report_interval', dest='latency_report_interval', type=float, help='trace the latency from a BLE notification to the MQTT PUBACK and report it every N seconds, 0 disables the tracing', default=float(os.getenv('LATENCY_REPORT_INTERVAL', 0)))
+parser.add_argument('--latency_report_file', dest='latency_report_file', type=str, help='the file the latest latency report is written to', default=LATENCY_REPORT_FILE)
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    # one TLS connection to HiveMQ Cloud for all the devices, or the multiplexer's connection shared with the workouts too
+    if args.mqtt_mux_socket:
+        mqtt_client = MuxMQTTClient(args.mqtt_mux_socket)
+    else:
+        mqtt_client = SharedMQTTClient(args.broker_address, args.username, args.password)
+    mqtt_client.setup_mqtt_client()
+    publisher = create_publisher(mqtt_client, args.publish_mode, args.publish_window, buffered_channels=PUBLISH_BUFFERED_CHANNELS + ('heartrate', 'fan'))
+
+    if args.latency_report_interval > 0:
+        start_latency_reporting(mqtt_client, f"bike/{args.device_id}/{LATENCY_REPORT_TOPIC_SUFFIX}", args.latency_report_file, args.latency_report_interval)
+
+    handlers = create_handlers(args, mqtt_client, publisher)
+    if not handlers:
+        print("No devices are configured, check the environment variables or the CLI arguments.")
+        sys.exit(1)
+
+    print("Starting the BLE hub for: %s" % (', '.join(handler.name for handler in handlers)))
+    manager = HubDeviceManager(adapter_name=args.adapter_name, handlers=handlers)
+
+    try:
+        mqtt_client.loop_start()
+        manager.connect_devices()
+        # run the device manager in the main thread forever
+        manager.run()
+    except KeyboardInterrupt:
+        print('Exit the program.')
+        manager.stop()
+    mqtt_client.get_client().loop_stop()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+from argparse import ArgumentParser
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from lib.ble_replay import REPLAY_PROFILES, LocalMQTTSink, Replayer, load_capture, create_replay_device
+from lib.constants import REPLAY_DEVICE_ID, PAYLOAD_ENCODINGS, PAYLOAD_ENCODING_JSON
+
+DEFAULT_CAPTURE_FILE = os.path.join(root_folder, 'kickr_climb_and_smart_trainer', 'sample_data', 'indoor_bike_data_sample_frames.txt')
+
+# define CLI parse arguments
+parser = ArgumentParser(description="Replay captured BLE characteristic values into a driver through a fake gatt.Device, without the hardware or a MQTT broker")
+parser.add_argument('driver', choices=sorted(REPLAY_PROFILES), help='the driver to feed the captured values to')
+parser.add_argument('--capture_file', dest='capture_file', type=str, help='one frame per line: "<seconds> <payload in hex>" or "<seconds> <characteristic uuid> <payload in hex>"', default=DEFAULT_CAPTURE_FILE)
+parser.add_argument('--speed', dest='speed', type=float, help='1 replays at the captured pace, N at N times the pace, 0 as fast as possible', default=1.0)
+parser.add_argument('--repeat', dest='repeat', type=int, help='how many times to replay the capture', default=1)
+parser.add_argument('--device_id', dest='device_id', type=str, help='the bike id in the published topics', default=REPLAY_DEVICE_ID)
+parser.add_argument('--payload_encoding', dest='payload_encoding', type=str, choices=PAYLOAD_ENCODINGS, help='the payload encoding of the published samples', default=PAYLOAD_ENCODING_JSON)
+parser.add_argument('--print_messages', dest='print_messages', action='store_true', help='print every message the driver published')
+
+# the capture played back to back, each repeat starts one frame interval after the previous one ended
+def repeat_capture(capture, repeat):
+    if len(capture) < 2:
+        return capture * repeat
+
+    duration = capture[-1].time - capture[0].time + (capture[1].time - capture[0].time)
+    return [frame._replace(time=frame.time + duration * index) for index in range(repeat) for frame in capture]
+
+def format_latency(latency):
+    return f"{latency * 1e6:.1f} us" if latency is not None else "-"
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    sink = LocalMQTTSink()
+    device = create_replay_device(args.driver, sink, args.device_id, payload_encoding=args.payload_encoding)
+
+    capture = load_capture(args.capture_file, REPLAY_PROFILES[args.driver][1])
+    frames = repeat_capture(capture, args.repeat)
+    print(f"Replaying {len(frames)} frames into the {args.driver} driver...")
+
+    result = Replayer(device, frames, speed=args.speed, sink=sink).run()
+
+    if args.print_messages:
+        for topic_name, payload in sink.messages:
+            print(topic_name, payload)
+
+    print(f"{result.frame_count} frames in {result.elapsed:.3f} s ({result.frames_per_second() or 0:.0f} frames/s), {result.skipped_count} skipped, {result.publish_count} messages published")
+    print(f"{sum(len(payload) for _, payload in sink.messages)} payload bytes published ({args.payload_encoding})")
+    for name, latencies in (('frame', result.frame_latencies), ('publish', result.publish_latencies)):
+        percentiles = result.latency_percentiles(latencies)
+        print(f"{name:>8} latency: " + ', '.join(f"p{percent} {format_latency(latency)}" for percent, latency in percentiles.items()))
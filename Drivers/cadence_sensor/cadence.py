@@ -2,7 +2,24 @@
 import gatt
 from mqtt_client import MQTTClient
 import os
+import sys
 import time
+import logging
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from lib.mqtt_batch_publisher import create_publisher
+from lib.compact_payload import create_payload_encoder
+from lib.publish_filter import create_publish_filter
+from lib.gatt_index import GattIndex
+from lib.ble_helper import decode_csc_measurement
+from lib.csc import CSCCalculator
+from lib.driver_log import get_logger
+from lib.mqtt_mux import create_mqtt_client
+from lib.constants import PUBLISH_MODE_IMMEDIATE, PUBLISH_WINDOW, PUBLISH_IDLE_LIMIT, PUBLISH_HEARTBEAT_INTERVAL, PAYLOAD_ENCODING_JSON, DEVICE_UNIT_NAMES, CSC_UUID, CSC_MEASUREMENT_UUID
+
+log = get_logger('cadence')
 
 # Subclass gatt.DeviceManager to allow discovery only of TICKR devices
 # When the alias begins with the required prefix, connect to the device
@@ -11,8 +28,14 @@ class AnyDeviceManager(gatt.DeviceManager):
         alias = device.alias()
         if alias is not None and self.prefix is not None and len(alias) >= len(self.prefix) and alias[0:len(self.prefix)] == self.prefix:
             print("[%s] Discovered, alias = %s" % (device.mac_address, device.alias()))
-            device = AnyDevice(mac_address=device.mac_address, manager=self)
-            device.connect()
+            connect_device(device.mac_address, self)
+
+# Create and connect a cadence device, this is also used by the BLE hub
+def connect_device(mac_address, manager):
+    device = AnyDevice(mac_address=mac_address, manager=manager)
+    device.csc = CSCCalculator()
+    device.connect()
+    return device
 
 
 # Subclass gatt.Device to implement the Heart Rate Protocol
@@ -57,13 +80,10 @@ class AnyDevice(gatt.Device):
     # 0x2A66 is Cycling power control point ""
     # use above three values incase 1816 gives errors
     def start_measurements(self):
-        cadence_service = next(
-            s for s in self.services
-            if s.uuid[4:8] == '1816')
-
-        self.cadence_measurement_characteristic = next(
-            c for c in cadence_service.characteristics
-            if c.uuid[4:8] == '2a5b')
+        self.cadence_measurement_characteristic = GattIndex(self.services).find(CSC_UUID, CSC_MEASUREMENT_UUID)
+        if self.cadence_measurement_characteristic is None:
+            print("[%s] Cadence measurement characteristic not found" % (self.mac_address))
+            return
 
         self.cadence_measurement_characteristic.enable_notifications()
 
@@ -72,15 +92,8 @@ class AnyDevice(gatt.Device):
     # Find the heart rate service and its measurement characteristic and
     # disable notifications from it
     def stop_measurements(self):
-        cadence_service = next(
-            s for s in self.services
-            if s.uuid[4:8] == '1816')
-
-        self.cadence_measurement_characteristic = next(
-            c for c in cadence_service.characteristics
-            if c.uuid[4:8] == '2a5b')
-
-        self.cadence_measurement_characteristic.enable_notifications(False)
+        if getattr(self, 'cadence_measurement_characteristic', None) is not None:
+            self.cadence_measurement_characteristic.enable_notifications(False)
 
     # Called once the heart rate measurement notification has succeeded
     # Since we will now be receiving notifications,
@@ -96,94 +109,65 @@ class AnyDevice(gatt.Device):
         print("[%s] Enable Notifications Failed: %s" % (self.mac_address, str(error)))
 
 
-    # Receive acadence payload (cadence) and extract its information
-    # The format depends on the flags set
+    # Receive a CSC Measurement and extract its information, the format depends on the flags set
     #
-    # Byte 0: Wheel revolution data present (if feature is not supported - value is 0)
-    #          Also indicates if cumulative wheel revolutions and last wheel event time fields are present or not
-    # Bit 0 - When both are present, set to 1. When both are absent, set to 0.
-    # Bit 1 - set as 1 when cumulative crank revolutions and last crank event time fields are present else 0.
-    # Bit 2 - multiple sensor locations supported
-    # Bit 3 - 15 - reserved for future use.
-
-
-
-
-
+    # Byte 0: Flags
+    # Bit 0 - set when the cumulative wheel revolutions (uint32) and last wheel event time (uint16) are present
+    # Bit 1 - set when the cumulative crank revolutions (uint16) and last crank event time (uint16) are present
+    # Bits 2-7 - reserved for future use (ignored)
+    #
+    # The event times are in 1/1024 seconds, the cadence is computed by lib.csc from the differences
+    # between measurements, which handles the counters rolling over
     def characteristic_value_updated(self, characteristic, value):
         # Store the timestamp
         ts = time.time()
 
-        print(value)
-        self.publish(ts, 0)
-        #return
-
-        print(f"Interpreting {list(value.hex())}")
-
-        # getting the binary value of the flags to check if crank data and wheel data is present or not
-        bin_value = bin(value[0])
-
-        # converting string to hex, then converting to big endian in order to calculate crank data properly
-        print(value.hex())
-        little_endian = value.hex()
-        conversion = bytearray.fromhex(little_endian)
-        conversion.reverse()
-        big_endian = conversion.hex()
-        print(big_endian)
-
-        global old_crank_revolutions
-        global old_crank_event_time
-
-        if (int(bin_value[2]) == 1):
-            print("crank data present, ")
-
-            # getting the data
-
-            crank_data = big_endian[:-2]
-            crank_event_time = big_endian[0:4]
-            crank_revolutions = big_endian[4:8]
-            print("crank data", crank_data, "crank event time", crank_event_time, "crank cummulative time",
-                  crank_revolutions)
-
-            # converting hex to decimal
-
-            crank_event_time = int(crank_event_time, 16)
-            crank_revolutions = int(crank_revolutions, 16)
-            print("crank data", crank_data, "crank event time", crank_event_time, "crank cummulative time",
-                  crank_revolutions)
-            print("old crank revolutions", old_crank_revolutions, "old crank event time", old_crank_event_time)
-
-
-        else:
-            print("crank data not present")
-
-        if (int(bin_value[3]) == 1):
-            print("wheel data present")
-        else:
-            print("wheel data not present")
-
         try:
-            cadence = (crank_revolutions - old_crank_revolutions) / (
-                        (crank_event_time - old_crank_event_time) / 1024) * 60
-            #publish(cadence)
+            measurement = decode_csc_measurement(value)
+        except ValueError:
+            log.limited(logging.ERROR, 'invalid payload', "CSC Measurement payload was not parsed correctly: %s", bytes(value).hex())
+            return
+
+        if measurement.crank_revolutions is None:
+            log.limited(logging.WARNING, 'no crank data', "The sensor does not report crank revolutions")
+            return
+
+        cadence, _ = self.csc.update(measurement, ts)
+        log.debug("Crank revolutions: %s, event time: %s, cadence: %s", measurement.crank_revolutions, measurement.last_crank_event_time, cadence)
+        if cadence is None:
+            return
+
+        # The publish filter suppresses the zero cadences once the rider has stopped, and the unchanged ones within the deadband
+        if publish_filter.accept(f"bike/{deviceId}/cadence", cadence, ts):
             self.publish(ts, cadence)
-            print(".....................")
-            old_crank_revolutions = crank_revolutions
-            old_crank_event_time = crank_event_time
-
-        except TypeError:
-            print("Nonetype error")
-            pass
-
-            
+        else:
+            log.count('suppressed')
 
 
     # Publish the cadence to MQTT
     def publish(self, ts, cadence):
         topic = f"bike/{deviceId}/cadence"
-        payload = f"{{timestamp: {ts}, cadence: {cadence}}}"
-        print(f"Publishing {topic} {payload}")
-        mqtt_client.publish(topic, payload)
+        payload = self.mqtt_data_report_payload(topic, cadence, ts)
+        log.count('published')
+        log.debug("Publishing %s %s", topic, payload)
+        publisher.publish(topic, payload)
+
+    def mqtt_data_report_payload(self, topic, value, timestamp):
+        return payload_encoder.encode(topic, DEVICE_UNIT_NAMES['cadence'], value, timestamp)
+
+
+# Set the MQTT client, the publisher, the bike id, the payload encoder and the publish filter used by the devices, this is also used by the BLE hub
+def setup(client, device_publisher, device_id, encoder=None, sample_filter=None):
+    global mqtt_client
+    global publisher
+    global deviceId
+    global payload_encoder
+    global publish_filter
+    mqtt_client = client
+    publisher = device_publisher
+    deviceId = device_id
+    payload_encoder = encoder if encoder is not None else create_payload_encoder()
+    publish_filter = sample_filter if sample_filter is not None else create_publish_filter()
 
 
 def main():
@@ -191,12 +175,15 @@ def main():
         adapter_name=os.getenv('CADENCE_ADAPTER_NAME')
         alias_prefix=os.getenv('CADENCE_ALIAS_PREFIX')
 
-        global mqtt_client
-        global deviceId
-        mqtt_client = MQTTClient(os.getenv('MQTT_HOSTNAME'), \
+        client = create_mqtt_client(MQTTClient, os.getenv('MQTT_HOSTNAME'), \
             os.getenv('MQTT_USERNAME'), os.getenv('MQTT_PASSWORD'))
-        mqtt_client.setup_mqtt_client()
-        deviceId = os.getenv('DEVICE_ID')
+        client.setup_mqtt_client()
+        setup(client, create_publisher(client, os.getenv('MQTT_PUBLISH_MODE', PUBLISH_MODE_IMMEDIATE), \
+            float(os.getenv('MQTT_PUBLISH_WINDOW', PUBLISH_WINDOW)), buffered_channels=('cadence',)), os.getenv('DEVICE_ID'), \
+            create_payload_encoder(os.getenv('MQTT_PAYLOAD_ENCODING', PAYLOAD_ENCODING_JSON), client), \
+            create_publish_filter(int(os.getenv('MQTT_IDLE_LIMIT', PUBLISH_IDLE_LIMIT)), os.getenv('MQTT_PUBLISH_DEADBANDS', ''), \
+                float(os.getenv('MQTT_HEARTBEAT_INTERVAL', PUBLISH_HEARTBEAT_INTERVAL))))
+        mqtt_client.get_client().loop_start()
 
         manager = AnyDeviceManager(adapter_name=adapter_name)
         manager.prefix=alias_prefix
@@ -204,6 +191,7 @@ def main():
         manager.run()
     except KeyboardInterrupt:
         pass
+    mqtt_client.get_client().loop_stop()
 
 
 if __name__=="__main__":
@@ -1,8 +1,13 @@
 import time
-import json
 import os
+import sys
 from dotenv import load_dotenv
 
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from lib.compact_payload import decode_sample, is_compact_payload
+
 class EnduranceWorkout:
     def __init__(self):
         load_dotenv('/home/pi/.env')
@@ -38,18 +43,19 @@ class EnduranceWorkout:
     # This callback function is to be used when a message is received via MQTT in the Endurance_Workout.py script.
     # Its use case is only for the endurance workout mode, and it is not to be used in any other context.
     def read_remote_data(self, client, userdata, msg):
-        payload = msg.payload.decode("utf-8")
         try:
-            # Attempt to parse the payload as JSON in line with incline data script output
-            dict_of_payload = json.loads(payload)
+            # Attempt to parse the payload as JSON in line with incline data script output, or as a compact frame
+            dict_of_payload = decode_sample(msg.payload)
             incline_value = dict_of_payload["value"]
             temp = self.incline_data[-1]
             if temp != incline_value:
                 print("Received " + msg.topic + " " + str(msg.qos) + " " + str(msg.payload))
             self.current_incline = incline_value
             self.incline_data.append(incline_value)
-        except json.JSONDecodeError:
-            # Treat it as a singular string value
-            incline_value = payload
+        except ValueError:
+            # A truncated compact frame is dropped, anything else is treated as a singular string value
+            if is_compact_payload(msg.payload):
+                return
+            incline_value = msg.payload.decode("utf-8", errors="replace")
             self.current_incline = incline_value
             self.incline_data.append(incline_value)
@@ -3,68 +3,77 @@
 import sys
 import time
 import os
-import csv
+import argparse
 from mqtt_client import MQTTClient
 from EnduranceWorkout_class import EnduranceWorkout
 from dotenv import load_dotenv, set_key
 
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from lib.mqtt_mux import create_mqtt_client
+from lib.distance_accumulator import DistanceAccumulator, parse_speed_samples
+from lib.compact_payload import batch_topic
+from lib.workout_schedule import load_schedule, compile_schedule
+from lib.workout_engine import WorkoutEngine
+
 MAX_WORKOUT_DURATION = 20  # Maximum duration of the workout in minutes
+ENDURANCE_SCHEDULE = os.path.join(root_folder, 'workout_engine', 'schedules', 'endurance.json')
 
 parser = argparse.ArgumentParser(description="Run an endurance workout.")
 parser.add_argument("-t", "--time", type=int, help="Workout time in minutes", default=20)
 parser.add_argument("-d", "--distance", type=float, help="Target distance in kilometers", required=True)
 parser.add_argument("-r", "--resistance", type=int, help="Initial incline level", required=True)
+parser.add_argument("--speed_log_file", type=str, help="Optionally log the speed samples to this CSV file", default=None)
 args = parser.parse_args()
 
-def perform_actions(incline_level):
-    mqtt_client.publish(f"bike/000001/incline/control", incline_level)
+def perform_actions(target, level):
+    mqtt_client.publish(f"bike/{deviceId}/{target}/control", str(level))
 
 # Global Variables
-speed_data_file = 'speed_data.csv'
+distance_accumulator = DistanceAccumulator(log_file=args.speed_log_file)
+distance_goal = None
+engine = None
 
 def record_speed_data(client, userdata, message):
-    """Callback function to handle incoming speed data and write to a CSV."""
-    with open(speed_data_file, 'a', newline='') as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow([time.time(), message.payload.decode()])  # write current time and speed value    
+    """Callback function to handle incoming speed data and add it to the running distance."""
+    try:
+        speed_samples = parse_speed_samples(message.topic, message.payload)
+    except (ValueError, KeyError, TypeError):
+        print("Invalid speed payload: " + str(message.payload))
+        return
+    for speed, timestamp in speed_samples:
+        distance_accumulator.add_sample(speed, timestamp)
+
+    # The workout ends as soon as the target distance is reached
+    if engine is not None and not engine.stopped.is_set() and distance_accumulator.get_distance() >= distance_goal:
+        print(f"Target distance of {distance_goal} km reached!")
+        engine.stop()
 
 def perform_endurance_workout(endurance_workout_object, target_distance):
     print("Starting endurance workout in 5 seconds...")
     time.sleep(5)
-    start_time = time.time()    
-    
-    incline_level = args.resistance  # initialize incline_level using the resistance argument
-
-    try:
-        while True:
-            current_time = time.time() - start_time
-            distance_covered = calculate_distance_from_csv()
-
-            if distance_covered >= target_distance:
-                print(f"Target distance of {target_distance} km reached!")
-                break
-            
-            if current_time >= (endurance_workout_object.duration * 60) or current_time >= (MAX_WORKOUT_DURATION * 60):
-                break
 
-            # Store the incline level in the endurance workout object
-            endurance_workout_object.incline_data.append(incline_level)
-
-            # Perform the endurance workout action based on the incline level
-            perform_actions(incline_level)
+    incline_level = args.resistance  # initialize incline_level using the resistance argument
 
-            if current_time % 120 == 0 and incline_level < 19:
-                incline_level += 0.5
+    # The incline goes up by 1% every 4 minutes, the workout engine only sends it when it changes
+    timeline = compile_schedule(load_schedule(ENDURANCE_SCHEDULE), {'incline': incline_level, 'time': endurance_workout_object.duration})
+    global engine
+    global distance_goal
+    distance_goal = target_distance
+    engine = WorkoutEngine(timeline, perform_actions)
 
-            time.sleep(1)
+    try:
+        engine.run()
     except KeyboardInterrupt:
+        engine.stop()
         print("Workout stopped")
         print("Count of data points given: " + str(len(endurance_workout_object.incline_data)))
 
 def set_workout_duration(endurance_workout_object):
     # Read the command line argument for setting the duration of the workout
-    if len(sys.argv) > 1:
-        endurance_workout_object.duration = int(sys.argv[1])
+    if args.time:
+        endurance_workout_object.duration = args.time
         if endurance_workout_object.duration > MAX_WORKOUT_DURATION:
             endurance_workout_object.duration = MAX_WORKOUT_DURATION
             print("Duration exceeds maximum limit of 20 minutes. Setting duration to 20 minutes.")
@@ -74,21 +83,6 @@ def set_workout_duration(endurance_workout_object):
         endurance_workout_object.duration = 20
         print("Duration not specified, defaulting to 20 minutes")
 
-def calculate_distance_from_csv():
-    last_time = None
-    distance = 0.0  # in kilometers or the unit of speed
-
-    with open(speed_data_file, 'r') as csvfile:
-        reader = csv.reader(csvfile)
-        for row in reader:
-            current_time, speed = float(row[0]), float(row[1])  # Extract time and speed
-            if last_time:  # Skip the first row
-                time_difference = current_time - last_time  # Time difference in seconds
-                distance += (speed * (time_difference / 3600))  # speed * time (converted to hours)
-            last_time = current_time
-
-    return distance        
-
 def main():
     try:
         # Load environment variables from the .env file
@@ -105,32 +99,40 @@ def main():
         set_workout_duration(endurance_workout_object)
 
         # Initialize MQTT client and subscribe to incline topic
-        mqtt_client = MQTTClient(os.getenv('MQTT_HOSTNAME'), os.getenv('MQTT_USERNAME'), os.getenv('MQTT_PASSWORD'))
+        mqtt_client = create_mqtt_client(MQTTClient, os.getenv('MQTT_HOSTNAME'), os.getenv('MQTT_USERNAME'), os.getenv('MQTT_PASSWORD'))
         deviceId = os.getenv('DEVICE_ID')
         topic = f'bike/{deviceId}/incline'
         print(deviceId)
         print(topic)
         mqtt_client.setup_mqtt_client()
         mqtt_client.subscribe(topic)
-        mqtt_client.get_client().on_message = endurance_workout_object.read_remote_data
         speed_topic = f'bike/{deviceId}/speed'
         mqtt_client.subscribe(speed_topic)
-        mqtt_client.get_client().on_message = record_speed_data
+        # in the batch publish mode the speed samples come in the batch frames of the bike
+        mqtt_client.subscribe(batch_topic(speed_topic))
+
+        # speed samples go to the distance accumulator, the incline reports to the workout object
+        def on_message(client, userdata, message):
+            if message.topic in (speed_topic, batch_topic(speed_topic)):
+                record_speed_data(client, userdata, message)
+            else:
+                endurance_workout_object.read_remote_data(client, userdata, message)
+        mqtt_client.get_client().on_message = on_message
 
         mqtt_client.get_client().loop_start()
 
         # Start the endurance
         # Start the endurance workout
         target_distance = float(input("Enter the distance you want to travel (in kilometers): "))
-        incline_level = args.incline        
         print("Starting the endurance workout...")
         perform_endurance_workout(endurance_workout_object, target_distance)
-        print(f"Total distance covered: {calculate_distance_from_csv()} kilometers")
+        print(f"Total distance covered: {distance_accumulator.get_distance()} kilometers")
         print("Workout complete.")
 
     except KeyboardInterrupt:
         pass
     mqtt_client.get_client().loop_stop()
+    distance_accumulator.close()
 
 if __name__ == "__main__":
     main()
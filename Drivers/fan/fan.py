@@ -4,23 +4,41 @@ import sys
 import struct
 from mqtt_client import MQTTClient
 import os
-import json
 import time
-import platform
+import logging
 
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
 
-# When a message is received from MQTT on the fan topic for this bike, it is received here
+from lib.mqtt_batch_publisher import create_publisher
+from lib.compact_payload import create_payload_encoder, decode_samples, batch_topic
+from lib.publish_filter import create_publish_filter
+from lib.gatt_index import GattIndex
+from lib.driver_log import get_logger
+from lib.mqtt_mux import create_mqtt_client
+from lib.constants import PUBLISH_MODE_IMMEDIATE, PUBLISH_WINDOW, PUBLISH_IDLE_LIMIT, PUBLISH_HEARTBEAT_INTERVAL, PAYLOAD_ENCODING_JSON, HEADWIND_ENABLE_SERVICE_UUID, HEADWIND_ENABLE_CHARACTERISTIC_UUID, HEADWIND_FAN_SERVICE_UUID, HEADWIND_FAN_CHARACTERISTIC_UUID
+
+log = get_logger('fan')
+
+# When a message is received from MQTT on the speed or batch topic for this bike, it is received here
 def message(client, userdata, msg):
-	payload = msg.payload.decode("utf-8") #msg received is speed of the bike in m/s
-	print("Received " + msg.topic + " " + str(msg.qos) + " " + str(msg.payload))
+	payload = msg.payload #msg received is speed of the bike in m/s, as JSON or a compact frame
+	log.debug("Received %s %s %s", msg.topic, msg.qos, msg.payload)
 	
- 	#Extract value from payload
-	dict_of_payload = json.loads(payload)
-	bike_speed = int(dict_of_payload["value"])
-	print("Processed speed to set to device: ", bike_speed)
+ 	#Extract value from payload, a bad payload is dropped instead of stopping the MQTT network thread
+	#A batch frame can hold several speed samples (or none), only the latest one is used
+	try:
+		speed_samples = [sample for topic, sample in decode_samples(msg.topic, payload) if topic.endswith('/speed')]
+		if not speed_samples:
+			return
+		bike_speed = int(speed_samples[-1]["value"])
+	except (ValueError, KeyError, TypeError):
+		log.limited(logging.WARNING, 'invalid payload', "Invalid speed payload: %s", payload)
+		return
+	log.debug("Processed speed to set to device: %s", bike_speed)
 	if bike_speed != 0:
 		if bike_speed < 0:
-			print(f"Invalid speed in message: {msg}")
+			log.limited(logging.WARNING, 'invalid speed', "Invalid speed in message: %s", payload)
 			return
 		# Maximum bike speed is around 20 m/s, setting fan_speed according to bike_speed
 		if bike_speed == 0:
@@ -36,10 +54,10 @@ def message(client, userdata, msg):
 		elif bike_speed > 16:
 			fan_speed = 100 # Maximum fan speed
 		else:
-			print(f"Invalid speed in message: {msg}")
+			log.limited(logging.WARNING, 'invalid speed', "Invalid speed in message: %s", payload)
 			return
 
-		print(f"Setting speed to {fan_speed}")
+		log.debug("Setting speed to %s", fan_speed)
 		device.set_speed(fan_speed)
 
 # Called when an update is published back to MQTT.
@@ -54,17 +72,21 @@ class AnyDeviceManager(gatt.DeviceManager):
 		alias = dev.alias()
 		if alias is not None and self.prefix is not None and len(alias) >= len(self.prefix) and alias[0:len(self.prefix)] == self.prefix:
 			#print("[%s] Discovered, alias = %s" % (dev.mac_address, dev.alias()))
-			dev = AnyDevice(mac_address=dev.mac_address, manager=self)
-			dev.enableCount = 0
-			dev.startCount = 0
-			dev.sendCount = 0
-			dev.speed = 0
-			dev.zeroCount = 0 
-			dev.connect()
-			dev.zero_limit = 10
+			connect_device(dev.mac_address, self)
 			self.stop_discovery()
-			global device
-			device = dev
+
+# Create and connect a fan device, the speed messages received from MQTT are sent to it
+# This is also used by the BLE hub
+def connect_device(mac_address, manager):
+	dev = AnyDevice(mac_address=mac_address, manager=manager)
+	dev.enableCount = 0
+	dev.startCount = 0
+	dev.sendCount = 0
+	dev.speed = 0
+	dev.connect()
+	global device
+	device = dev
+	return dev
 
 
 # Send a given value to the fan through Bluetooth
@@ -123,21 +145,15 @@ class AnyDevice(gatt.Device):
 		super().services_resolved()
 		self.manager.stop_discovery()
 
-		self.enable_service = next(
-			s for s in self.services
-			if s.uuid[4:8] == 'ee01')
-
-		self.enable_characteristic = next(
-			c for c in self.enable_service.characteristics
-			if c.uuid[4:8] == 'e002')
+		gatt_index = GattIndex(self.services)
+		self.enable_service = gatt_index.find(HEADWIND_ENABLE_SERVICE_UUID)
+		self.enable_characteristic = gatt_index.find(HEADWIND_ENABLE_SERVICE_UUID, HEADWIND_ENABLE_CHARACTERISTIC_UUID)
+		self.fan_service = gatt_index.find(HEADWIND_FAN_SERVICE_UUID)
+		self.fan_characteristic = gatt_index.find(HEADWIND_FAN_SERVICE_UUID, HEADWIND_FAN_CHARACTERISTIC_UUID)
 
-		self.fan_service = next(
-			s for s in self.services
-			if s.uuid[4:8] == 'ee0c')
-
-		self.fan_characteristic = next(
-			c for c in self.fan_service.characteristics
-			if c.uuid[4:8] == 'e038')
+		if self.enable_characteristic is None or self.fan_characteristic is None:
+			print("[%s] Headwind fan characteristics not found" % (self.mac_address))
+			return
 
 		self.enable_characteristic.enable_notifications()
 		self.fan_characteristic.enable_notifications()
@@ -195,38 +211,49 @@ class AnyDevice(gatt.Device):
 			# The fan has several payloads to report its speed, but when
 			# idle, it returns fd 01 xx 04, where xx is the speed (0 to 100)
 			if len(value) == 4 and value[0] == 0xFD and value[1] == 0x01 and value[3] == 0x04:
-				# Check for zero value and value of zero counter. Continue if value is not 0 or 0 limit not reached
-				if not(value[2] == 0x00 and self.zeroCount >= self.zero_limit):
-					# Check if value is 0 and if so inc the zero counter. If value is not 0 then reset 0 counter
-					# Zero counter will always reset when non-zero data published so it is most efficient to reset the zero counter
-					# every time a non-zero is published as opposed to checking if zero counter is already 0 
-					if value[2] == 0x00:
-						self.zeroCount += 1
-					else:
-						self.zeroCount = 0
-					reported_speed = value[2]
-					topic = f"bike/{deviceId}/fan"
+				# The publish filter suppresses the zero speeds once the fan is idle, and the unchanged ones within the deadband
+				reported_speed = value[2]
+				topic = f"bike/{deviceId}/fan"
+				if publish_filter.accept(topic, reported_speed, time.time()):
 					payload = self.mqtt_data_report_payload(reported_speed)				
-					mqtt_client.publish(topic, payload)
-					print(f"Published speed: {reported_speed}")
+					publisher.publish(topic, payload)
+					log.count('published')
+					log.debug("Published speed: %s", reported_speed)
 
 	def mqtt_data_report_payload(self, value):
 		# TODO: add more json data payload whenever needed later
-		return json.dumps({"value": value, "unitName": 'percentage', "timestamp": time.time(), "metadata": { "deviceName": platform.node() } })
+		return payload_encoder.encode(f"bike/{deviceId}/fan", 'percentage', value, time.time())
+
+# Set the MQTT client, the publisher, the bike id, the payload encoder and the publish filter used by the device, this is also used by the BLE hub
+def setup(client, device_publisher, device_id, encoder=None, sample_filter=None):
+	global mqtt_client
+	global publisher
+	global deviceId
+	global payload_encoder
+	global publish_filter
+	mqtt_client = client
+	publisher = device_publisher
+	deviceId = device_id
+	payload_encoder = encoder if encoder is not None else create_payload_encoder()
+	publish_filter = sample_filter if sample_filter is not None else create_publish_filter()
 
 def main():
 	try:
 		adapter_name=os.getenv('FAN_ADAPTER_NAME')
 		alias_prefix=os.getenv('FAN_ALIAS_PREFIX')
 
-		global mqtt_client
-		global deviceId
-		mqtt_client = MQTTClient(os.getenv('MQTT_HOSTNAME'), \
+		client = create_mqtt_client(MQTTClient, os.getenv('MQTT_HOSTNAME'), \
 			os.getenv('MQTT_USERNAME'), os.getenv('MQTT_PASSWORD'))
-		mqtt_client.setup_mqtt_client()
-		deviceId = os.getenv('DEVICE_ID')
+		client.setup_mqtt_client()
+		setup(client, create_publisher(client, os.getenv('MQTT_PUBLISH_MODE', PUBLISH_MODE_IMMEDIATE), \
+			float(os.getenv('MQTT_PUBLISH_WINDOW', PUBLISH_WINDOW)), buffered_channels=('fan',)), os.getenv('DEVICE_ID'), \
+			create_payload_encoder(os.getenv('MQTT_PAYLOAD_ENCODING', PAYLOAD_ENCODING_JSON), client), \
+			create_publish_filter(int(os.getenv('MQTT_IDLE_LIMIT', PUBLISH_IDLE_LIMIT)), os.getenv('MQTT_PUBLISH_DEADBANDS', ''), \
+				float(os.getenv('MQTT_HEARTBEAT_INTERVAL', PUBLISH_HEARTBEAT_INTERVAL))))
 		topic = f'bike/{deviceId}/speed'
 		mqtt_client.subscribe(topic)
+		#In the batch publish mode the speed samples come in the batch frames of the bike
+		mqtt_client.subscribe(batch_topic(topic))
 		mqtt_client.get_client().on_message = message
 		mqtt_client.get_client().on_publish = publish
 		mqtt_client.get_client().loop_start()
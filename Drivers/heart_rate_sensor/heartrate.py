@@ -3,8 +3,24 @@ import gatt
 from mqtt_client import MQTTClient
 import os
 import time
-import platform
-import json
+import logging
+import sys
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from lib.mqtt_batch_publisher import create_publisher
+from lib.compact_payload import create_payload_encoder
+from lib.publish_filter import create_publish_filter
+from lib.gatt_index import GattIndex
+from lib.ble_helper import decode_heart_rate_measurement
+from lib.hrv import RollingHRV
+from lib.latency_tracer import tracer
+from lib.driver_log import get_logger
+from lib.mqtt_mux import create_mqtt_client
+from lib.constants import PUBLISH_MODE_IMMEDIATE, PUBLISH_WINDOW, PUBLISH_IDLE_LIMIT, PUBLISH_HEARTBEAT_INTERVAL, PAYLOAD_ENCODING_JSON, HRS_UUID, HEART_RATE_MEASUREMENT_UUID, RR_INTERVAL_RESOLUTION, HRV_PUBLISH_INTERVAL, RR_INTERVALS_TOPIC_SUFFIX, HRV_TOPIC_SUFFIX
+
+log = get_logger('heartrate')
 
 # Subclass gatt.DeviceManager to allow discovery only of TICKR devices
 # When the alias begins with the required prefix, connect to the device
@@ -13,10 +29,16 @@ class AnyDeviceManager(gatt.DeviceManager):
         alias = device.alias()
         if alias is not None and self.prefix is not None and len(alias) >= len(self.prefix) and alias[0:len(self.prefix)] == self.prefix:
             #print("[%s] Discovered, alias = %s" % (device.mac_address, device.alias()))
-            device = AnyDevice(mac_address=device.mac_address, manager=self)
-            device.connect()
-            device.zero_limit = 10
-            device.zeroCount = 0
+            connect_device(device.mac_address, self)
+
+# Create and connect a heart rate device, this is also used by the BLE hub
+def connect_device(mac_address, manager):
+    device = AnyDevice(mac_address=mac_address, manager=manager)
+    device.hrv = RollingHRV()
+    device.rr_intervals = []
+    device.last_hrv_publish = time.time()
+    device.connect()
+    return device
 
 # Subclass gatt.Device to implement the Heart Rate Protocol
 class AnyDevice(gatt.Device):
@@ -55,13 +77,10 @@ class AnyDevice(gatt.Device):
     # Enable notifications on the measurement characteristic to ensure that
     # heart rate readings are sent to the characteristic_value_updated callback
     def start_measurements(self):
-        heart_rate_service = next(
-            s for s in self.services
-            if s.uuid[4:8] == '180d')
-
-        self.heart_rate_measurement_characteristic = next(
-            c for c in heart_rate_service.characteristics
-            if c.uuid[4:8] == '2a37')
+        self.heart_rate_measurement_characteristic = GattIndex(self.services).find(HRS_UUID, HEART_RATE_MEASUREMENT_UUID)
+        if self.heart_rate_measurement_characteristic is None:
+            print("[%s] Heart rate measurement characteristic not found" % (self.mac_address))
+            return
 
         self.heart_rate_measurement_characteristic.enable_notifications()
 
@@ -95,102 +114,90 @@ class AnyDevice(gatt.Device):
 
 
     # Receive a heart rate measurement and extract its information
-    # The format depends on the flags set
-    #rrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrrr
-    # Byte 0: Flags
-    # Bit 0 - set if the heart rate is 16 bit (otherwise 8 bit)
-    # Bit 1 - set if contact is detected (only valid if bit 2 is also set)
-    # Bit 2 - set if contact status is reported
-    # Bit 3 - set if energy expenditure is reported
-    # Bit 4 - set if rr interval is reported
-    # Bits 5-7 - reserved for future use (ignored)
-    #
-    # Followed by:
-    # Heart rate (beats per minute) [uint8, or uint16 if flags Bit 0 is set]
-    # Energy (kJ) [uint16, only present if flags Bit 3 is set]
-    # RR Interval (1/1024 seconds) [Remaining bytes until end of packet,
-    #                               only present if flags bit 4 is set]
+    # The flags, heart rate, sensor contact, energy expended and RR intervals are decoded by lib.ble_helper
+    # The RR intervals (1/1024 seconds, oldest first) feed the rolling HRV and are published in batches
     def characteristic_value_updated(self, characteristic, value):
         # Store the timestamp
         ts = time.time()
+        start = tracer.begin_notification()
 
-        # Check the flags
-        hr16bit = value[0] & 1
-        sensorcontact = (value[0] & 6) >> 1
-        energyexpended = (value[0] & 8) >> 3
-        rrinterval = (value[0] & 16) >> 4
+        try:
+            measurement = decode_heart_rate_measurement(value)
+        except ValueError:
+            log.limited(logging.ERROR, 'invalid payload', "Heart Rate Measurement payload was not parsed correctly: %s", bytes(value).hex())
+            tracer.end_notification(start)
+            return
 
-        # Offset is the current byte in the packet being processed
-        offset = 1
+        heartrate = measurement.heart_rate
 
-        # Parse the heartrate
-        if hr16bit:
-            heartrate = (value[offset+1] << 8) + value[offset]
-            offset += 2
-        else:
-            heartrate = value[offset]
-            offset += 1
-
-        #check for zero heartrate and if limit reached
-        if not(heartrate == 0 and self.zeroCount >= self.zero_limit):
-            # Parse the sensor contact information (if present)
-            if sensorcontact == 2:
-                contact = "Not detected"
-            elif sensorcontact == 3:
-                contact = "Detected"
-            else:
-                contact = None
-
-            #Parse heartrate to check if 0
-            if heartrate == 0:
-                self.zeroCount += 1
-            else:
-                self.zeroCount = 0
-
-            # Parse the energy expended (if present)
-            if energyexpended:
-                energy = (value[offset+1] << 8) + value[offset]
-                offset += 2
-            else:
-                energy = None
-
-            # Parse the RR interval(s) (if present)
-            # If several intervals have occurred since the last measurement
-            # they are sent from oldest to newest
-            if rrinterval:
-                interval = []
-                for index in range(offset, len(value), 2):
-                    interval.append(float((value[index+1] << 8) + value[index])/1024.0)
-                offset = len(value)
-            else:
-                interval = None
-
-            #print("Heart Rate:",heartrate,"Contact:",contact,"Energy:",energy,"RR:",interval)
+        for interval in measurement.rr_intervals:
+            if self.hrv.add(interval):
+                self.rr_intervals.append(round(interval * 1000.0 / RR_INTERVAL_RESOLUTION, 1))
+
+        #the publish filter suppresses the zero heart rates once the strap is idle, and the unchanged ones within the deadband
+        if publish_filter.accept(f"bike/{deviceId}/heartrate", heartrate, ts):
             self.publish(ts, heartrate)
+        else:
+            log.count('suppressed')
+
+        #the HRV is only reported while the strap measures a heart rate
+        if heartrate != 0 and ts - self.last_hrv_publish >= HRV_PUBLISH_INTERVAL:
+            self.publish_hrv(ts)
+
+        tracer.end_notification(start)
 
 
     # Publish the heart rate to MQTT
     def publish(self, ts, heartrate):
         topic = f"bike/{deviceId}/heartrate"
         payload = self.mqtt_data_report_payload(heartrate, ts)
-        print(f"Publishing {topic} {payload}")
-        mqtt_client.publish(topic, payload)
+        log.count('published')
+        log.debug("Publishing %s %s", topic, payload)
+        publisher.publish(topic, payload)
 
     def mqtt_data_report_payload(self, value, timestamp):
         # TODO: add more json data payload whenever needed later
-        return json.dumps({"value": value, "unitName": 'BPM', "timestamp": timestamp, "metadata": { "deviceName": platform.node() } })        
+        start = tracer.start()
+        payload = payload_encoder.encode(f"bike/{deviceId}/heartrate", 'BPM', value, timestamp)
+        tracer.record('payload', start)
+        return payload
+
+    # Publish the RR intervals received since the last batch (in ms) and the rolling HRV
+    # The HRV report is {"rmssd": ms, "sdnn": ms, "pnn50": percent, "meanRR": ms, "heartRate": BPM, "beats": count}
+    def publish_hrv(self, ts):
+        self.last_hrv_publish = ts
+        if self.rr_intervals:
+            publisher.publish(f"bike/{deviceId}/{RR_INTERVALS_TOPIC_SUFFIX}", payload_encoder.encode(f"bike/{deviceId}/{RR_INTERVALS_TOPIC_SUFFIX}", 'ms', self.rr_intervals, ts))
+            self.rr_intervals = []
+        if len(self.hrv) > 1:
+            publisher.publish(f"bike/{deviceId}/{HRV_TOPIC_SUFFIX}", payload_encoder.encode(f"bike/{deviceId}/{HRV_TOPIC_SUFFIX}", 'ms', self.hrv.summary(), ts))
+
+# Set the MQTT client, the publisher, the bike id, the payload encoder and the publish filter used by the devices, this is also used by the BLE hub
+def setup(client, device_publisher, device_id, encoder=None, sample_filter=None):
+    global mqtt_client
+    global publisher
+    global deviceId
+    global payload_encoder
+    global publish_filter
+    mqtt_client = client
+    publisher = device_publisher
+    deviceId = device_id
+    payload_encoder = encoder if encoder is not None else create_payload_encoder()
+    publish_filter = sample_filter if sample_filter is not None else create_publish_filter()
 
 def main():
     try:
         adapter_name=os.getenv('HEART_RATE_ADAPTER_NAME')
         alias_prefix=os.getenv('HEART_RATE_ALIAS_PREFIX')
 
-        global mqtt_client
-        global deviceId
-        mqtt_client = MQTTClient(os.getenv('MQTT_HOSTNAME'), \
+        client = create_mqtt_client(MQTTClient, os.getenv('MQTT_HOSTNAME'), \
             os.getenv('MQTT_USERNAME'), os.getenv('MQTT_PASSWORD'))
-        mqtt_client.setup_mqtt_client()
-        deviceId = os.getenv('DEVICE_ID')
+        client.setup_mqtt_client()
+        setup(client, create_publisher(client, os.getenv('MQTT_PUBLISH_MODE', PUBLISH_MODE_IMMEDIATE), \
+            float(os.getenv('MQTT_PUBLISH_WINDOW', PUBLISH_WINDOW)), buffered_channels=('heartrate',)), os.getenv('DEVICE_ID'), \
+            create_payload_encoder(os.getenv('MQTT_PAYLOAD_ENCODING', PAYLOAD_ENCODING_JSON), client), \
+            create_publish_filter(int(os.getenv('MQTT_IDLE_LIMIT', PUBLISH_IDLE_LIMIT)), os.getenv('MQTT_PUBLISH_DEADBANDS', ''), \
+                float(os.getenv('MQTT_HEARTBEAT_INTERVAL', PUBLISH_HEARTBEAT_INTERVAL))))
         mqtt_client.get_client().loop_start()
 
         manager = AnyDeviceManager(adapter_name=adapter_name)
@@ -38,9 +38,9 @@ class MQTTClient:
         # subscribe to all topics of encyclopedia by using the wildcard "#"
         self.client.subscribe(topic_name, qos=1)
 
-    def publish(self, topic_name, payload):
+    def publish(self, topic_name, payload, retain=False):
         # a single publish, this can also be done in loops, etc.
-        self.client.publish(topic_name, payload=payload, qos=1)
+        self.client.publish(topic_name, payload=payload, qos=1, retain=retain)
 
     def loop_forever(self):
         # loop_forever for simplicity, here you need to stop the loop manually
@@ -9,18 +9,23 @@ from wahoo_device import WahooDevice
 root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.append(root_folder)
 
-from lib.constants import BIKE_01_INCLINE_COMMAND, BIKE_01_RESISTANCE_COMMAND, BIKE_01_INCLINE_REPORT, BIKE_01_RESISTANCE_REPORT, BIKE_01_SPEED_REPORT, BIKE_01_CADENCE_REPORT, BIKE_01_POWER_REPORT
+from lib.mqtt_mux import MuxMQTTClient
+from lib.mqtt_batch_publisher import create_publisher, split_topic
+from lib.latency_tracer import start_latency_reporting
+from lib.constants import BIKE_01_INCLINE_COMMAND, BIKE_01_RESISTANCE_COMMAND, BIKE_01_INCLINE_REPORT, BIKE_01_RESISTANCE_REPORT, BIKE_01_SPEED_REPORT, BIKE_01_CADENCE_REPORT, BIKE_01_POWER_REPORT, PUBLISH_MODES, PUBLISH_MODE_IMMEDIATE, PUBLISH_WINDOW, PAYLOAD_ENCODINGS, PAYLOAD_ENCODING_JSON, PUBLISH_IDLE_LIMIT, PUBLISH_HEARTBEAT_INTERVAL, GATT_ATTRIBUTE_CACHE_FILE, MQTT_MUX_SOCKET_ENV, LATENCY_REPORT_FILE, LATENCY_REPORT_TOPIC_SUFFIX
 
 # define CLI parse arguments
 parser = ArgumentParser(description="Wahoo Kickr Incline and Resistance Control")
 
 # BLE connection params
 parser.add_argument('--mac_address', dest='mac_address', type=str, help="The Wahoo Kickr BLE Device's unique mac address")
+parser.add_argument('--gatt_cache_file', dest='gatt_cache_file', type=str, help='a local file to cache the characteristic values of the device in, so reconnects can skip reading them', default=GATT_ATTRIBUTE_CACHE_FILE)
 
 # HiveMQ connection params
 parser.add_argument('--broker_address', dest='broker_address', type=str, help='The MQTT broker address getting from HiveMQ Cloud')
 parser.add_argument('--username', dest='username', type=str, help='HiveMQ Cloud username')
 parser.add_argument('--password', dest='password', type=str, help='HiveMQ Cloud password')
+parser.add_argument('--mqtt_mux_socket', dest='mqtt_mux_socket', type=str, help='the Unix socket of the local MQTT multiplexer (Drivers/mqtt_mux), to share its connection instead of opening a new one', default=os.getenv(MQTT_MUX_SOCKET_ENV))
 
 parser.add_argument('--incline_command_topic', dest='incline_command_topic', type=str, help='a MQTT topic that will send incline or resistance control commands to this driver', default=BIKE_01_INCLINE_COMMAND)
 parser.add_argument('--incline_report_topic', dest='incline_report_topic', type=str, help='a MQTT topic that will receieve the current incline or resistance levels data from this driver', default=BIKE_01_INCLINE_REPORT)
@@ -30,15 +35,37 @@ parser.add_argument('--speed_report_topic', dest='speed_report_topic', type=str,
 parser.add_argument('--cadence_report_topic', dest='cadence_report_topic', type=str, help='a MQTT topic that will receive the current instantaneous cadence data in rpm from this driver', default=BIKE_01_CADENCE_REPORT)
 parser.add_argument('--power_report_topic', dest='power_report_topic', type=str, help='a MQTT topic that will receive the current instantaneous power data in W from this driver', default=BIKE_01_POWER_REPORT)
 
+# MQTT publishing params
+parser.add_argument('--publish_mode', dest='publish_mode', type=str, choices=PUBLISH_MODES, help='immediate: publish every sample, batch: send one batched frame per bike every window, latest: send only the latest value per topic every window', default=PUBLISH_MODE_IMMEDIATE)
+parser.add_argument('--publish_window', dest='publish_window', type=float, help='how many seconds to collect samples for in the batch and latest publish modes', default=PUBLISH_WINDOW)
+parser.add_argument('--payload_encoding', dest='payload_encoding', type=str, choices=PAYLOAD_ENCODINGS, help='json: a JSON object per sample, compact: a 14 byte frame per sample with the unit and device name in a retained descriptor topic', default=os.getenv('MQTT_PAYLOAD_ENCODING', PAYLOAD_ENCODING_JSON))
+parser.add_argument('--idle_limit', dest='idle_limit', type=int, help='how many zero samples in a row are published on a topic before the next ones are suppressed, -1 publishes them all', default=int(os.getenv('MQTT_IDLE_LIMIT', PUBLISH_IDLE_LIMIT)))
+parser.add_argument('--publish_deadbands', dest='publish_deadbands', type=str, help='the smallest change published per channel, e.g. speed=0.1,power=5', default=os.getenv('MQTT_PUBLISH_DEADBANDS', ''))
+parser.add_argument('--heartbeat_interval', dest='heartbeat_interval', type=float, help='seconds after which a suppressed sample is published anyway, 0 disables the heartbeats', default=float(os.getenv('MQTT_HEARTBEAT_INTERVAL', PUBLISH_HEARTBEAT_INTERVAL)))
+
+# latency tracing params
+parser.add_argument('--latency_report_interval', dest='latency_report_interval', type=float, help='trace the latency from a BLE notification to the MQTT PUBACK and report it every N seconds, 0 disables the tracing', default=float(os.getenv('LATENCY_REPORT_INTERVAL', 0)))
+parser.add_argument('--latency_report_file', dest='latency_report_file', type=str, help='the file the latest latency report is written to', default=LATENCY_REPORT_FILE)
+
 args = parser.parse_args()
 
 print("Connecting to the BLE device...")
 manager = gatt.DeviceManager(adapter_name='hci0')
 
 # initiate and connect a WahooDevice with a given BLE mac_address
-device = WahooDevice(manager=manager, mac_address=args.mac_address, args=args)
+if args.mqtt_mux_socket:
+    mqtt_client = MuxMQTTClient(args.mqtt_mux_socket)
+    mqtt_client.setup_mqtt_client()
+    mqtt_client.loop_start()
+    device = WahooDevice(manager=manager, mac_address=args.mac_address, args=args, mqtt_client=mqtt_client, publisher=create_publisher(mqtt_client, args.publish_mode, args.publish_window))
+else:
+    device = WahooDevice(manager=manager, mac_address=args.mac_address, args=args)
 device.connect()
 
+# the latency reports are published next to the speed reports, e.g. 'bike/000001/latency'
+if args.latency_report_interval > 0:
+    start_latency_reporting(device.mqtt_client, f"{split_topic(args.speed_report_topic)[0]}/{LATENCY_REPORT_TOPIC_SUFFIX}", args.latency_report_file, args.latency_report_interval)
+
 try:
     print("Running the device manager now...")
     # run the device manager in the main thread forever
@@ -10,11 +10,12 @@ sys.path.append(root_folder)
 from lib.mqtt_client import MQTTClient
 from lib.constants import RESISTANCE_MIN, RESISTANCE_MAX, INCLINE_MIN, INCLINE_MAX
 
-# define a custom MQTT Client to be able send BLE FTMS commands while receiving command messages from a MQTT command topic
-class MQTTClientWithSendingFTMSCommands(MQTTClient):
-    def __init__(self, broker_address, username, password, device):
-        super().__init__(broker_address, username, password)
+# handle the resistance and incline command messages for a device, the replies are published with the given MQTT client
+# this is used by MQTTClientWithSendingFTMSCommands, and by the BLE hub where one MQTT client is shared by several devices
+class FTMSCommandHandler:
+    def __init__(self, device, mqtt_client):
         self.device = device
+        self.mqtt_client = mqtt_client
 
     def on_message(self, client, userdata, msg):
         # positve number for resistance value; positve/negative number for inclination value
@@ -28,7 +29,7 @@ class MQTTClientWithSendingFTMSCommands(MQTTClient):
                     message = f"Skip invalid incline value: {int_value} (the range has to be: {INCLINE_MIN}% - {INCLINE_MAX}%)"
                     print(message)
 
-                    self.publish(self.device.args.incline_report_topic, message)
+                    self.mqtt_client.publish(self.device.args.incline_report_topic, message)
                 else:
                     self.device.custom_control_point_set_target_inclination(int_value)
             elif bool(re.search("/resistance", msg.topic, re.IGNORECASE)):
@@ -36,10 +37,20 @@ class MQTTClientWithSendingFTMSCommands(MQTTClient):
                     message = f"Skip invalid resistance value: {int_value}"
                     print(message)
 
-                    self.publish(self.device.args.resistance_report_topic, message)
+                    self.mqtt_client.publish(self.device.args.resistance_report_topic, message)
                 else:
                     self.device.ftms_set_target_resistance_level(int_value)
             else:
                 print("The command topic is not idetified.")
         else:
-            print("Skip the invalid command payload.")
\ No newline at end of file
+            print("Skip the invalid command payload.")
+
+# define a custom MQTT Client to be able send BLE FTMS commands while receiving command messages from a MQTT command topic
+class MQTTClientWithSendingFTMSCommands(MQTTClient):
+    def __init__(self, broker_address, username, password, device):
+        super().__init__(broker_address, username, password)
+        self.device = device
+        self.command_handler = FTMSCommandHandler(device, self)
+
+    def on_message(self, client, userdata, msg):
+        self.command_handler.on_message(client, userdata, msg)
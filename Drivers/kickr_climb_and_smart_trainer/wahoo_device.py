@@ -4,23 +4,28 @@ import os
 from sqlite3 import Timestamp
 import sys
 import gatt
-import platform
-import json
 import time
-from time import sleep
-from mqtt_custom_client import MQTTClientWithSendingFTMSCommands
+import logging
+from mqtt_custom_client import MQTTClientWithSendingFTMSCommands, FTMSCommandHandler
 
 root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.append(root_folder)
 
-from lib.ble_helper import convert_incline_to_op_value, service_or_characteristic_found, service_or_characteristic_found_full_match, decode_int_bytes, covert_negative_value_to_valid_bytes
-from lib.constants import FTMS_UUID, RESISTANCE_LEVEL_RANGE_UUID, INCLINATION_RANGE_UUID, FTMS_CONTROL_POINT_UUID, FTMS_REQUEST_CONTROL, FTMS_RESET, FTMS_SET_TARGET_RESISTANCE_LEVEL, INCLINE_REQUEST_CONTROL, INCLINE_CONTROL_OP_CODE, INCLINE_CONTROL_SERVICE_UUID, INCLINE_CONTROL_CHARACTERISTIC_UUID, INDOOR_BIKE_DATA_UUID, DEVICE_UNIT_NAMES
+from lib.ble_helper import convert_incline_to_op_value, decode_indoor_bike_data, decode_int_bytes, decode_string_bytes, covert_negative_value_to_valid_bytes
+from lib.mqtt_batch_publisher import create_publisher
+from lib.compact_payload import create_payload_encoder
+from lib.publish_filter import create_publish_filter
+from lib.gatt_command_queue import GattCommandQueue, GLibScheduler
+from lib.gatt_index import GattIndex
+from lib.gatt_attribute_cache import GattAttributeCache, get_cached_value
+from lib.latency_tracer import tracer
+from lib.driver_log import get_logger
+from lib.constants import FTMS_UUID, RESISTANCE_LEVEL_RANGE_UUID, INCLINATION_RANGE_UUID, FTMS_CONTROL_POINT_UUID, FTMS_REQUEST_CONTROL, FTMS_RESET, FTMS_SET_TARGET_RESISTANCE_LEVEL, INCLINE_REQUEST_CONTROL, INCLINE_CONTROL_OP_CODE, INCLINE_CONTROL_SERVICE_UUID, INCLINE_CONTROL_CHARACTERISTIC_UUID, INDOOR_BIKE_DATA_UUID, DEVICE_UNIT_NAMES, DIS_UUID, FIRMWARE_REVISION_STRING_UUID, BLE_RECONNECT_DELAY
 
-# a sleep time to wait for a characteristic.writevalue() action to be completed
-WRITEVALUE_WAIT_TIME = 0.5 # TODO: If this doesn't work well, it needs to change this short sleep mechainism to a async process mechainism for sending consequetive BLE commands (eg., threading control)
+log = get_logger('kickr')
 
 class WahooDevice(gatt.Device):
-    def __init__(self, mac_address, manager, args, managed=True):
+    def __init__(self, mac_address, manager, args, managed=True, mqtt_client=None, publisher=None, command_scheduler=None):
         super().__init__(mac_address, manager, managed)
 
         # define the initial FTMS Service and the corresponding Characteristics
@@ -42,55 +47,92 @@ class WahooDevice(gatt.Device):
         # define the Characteristics for Indoor Bike Data (reporting speed, cadence and power)
         self.indoor_bike_data = None
 
+        # the latest speed, cadence and power reported, a frame can leave any of them out
+        self.instantaneous_speed = 0
+        self.instantaneous_cadence = 0
+        self.instantaneous_power = 0
+
         # CLI parser arguments
         self.args = args
         
-        # Zero count
-        self.zero_count = 0
+        # idle suppression, deadbands and heartbeats of the speed, cadence and power samples
+        self.publish_filter = create_publish_filter(self.args.idle_limit, self.args.publish_deadbands, self.args.heartbeat_interval)
+
+        # BLE commands are sent one at a time, the next one as soon as the device confirms the previous one
+        # they are scheduled on the GLib main loop unless another scheduler is given (e.g. by the replay harness)
+        self.scheduler = command_scheduler or GLibScheduler()
+        self.command_queue = GattCommandQueue(self.mac_address, scheduler=self.scheduler)
+
+        # the characteristic values read on the first connection, reused on reconnects with the same firmware
+        self.attribute_cache = GattAttributeCache(self.args.gatt_cache_file)
+        self.attribute_table = {}
+
+        # setup MQTT connection, or use the one shared by the BLE hub
+        if mqtt_client is None:
+            self.setup_mqtt_connection()
+        else:
+            self.use_shared_mqtt_connection(mqtt_client, publisher)
 
-        # setup MQTT connection
-        self.setup_mqtt_connection()
+        # the compact encoding publishes the descriptors of its topics with the MQTT client
+        self.payload_encoder = create_payload_encoder(self.args.payload_encoding, self.mqtt_client)
 
     def setup_mqtt_connection(self):
+        self.owns_mqtt_client = True
         self.mqtt_client = MQTTClientWithSendingFTMSCommands(self.args.broker_address, self.args.username, self.args.password, self)
         self.mqtt_client.setup_mqtt_client()
 
+        # speed, cadence and power samples go through the publisher, which may batch them depending on the publish mode
+        self.publisher = create_publisher(self.mqtt_client, self.args.publish_mode, self.args.publish_window)
+
         # subscribe to both resistance and incline command topics
         self.mqtt_client.subscribe([(self.args.resistance_command_topic, 0), (self.args.incline_command_topic, 0)])
 
-    def set_service_or_characteristic(self, service_or_characteristic):
-        if service_or_characteristic_found(FTMS_UUID, service_or_characteristic.uuid):
-            self.ftms = service_or_characteristic
-        elif service_or_characteristic_found_full_match(INCLINE_CONTROL_SERVICE_UUID, service_or_characteristic.uuid):
-            self.custom_incline_service = service_or_characteristic
-        elif service_or_characteristic_found_full_match(INCLINE_CONTROL_CHARACTERISTIC_UUID, service_or_characteristic.uuid):
-            self.custom_incline_characteristic = service_or_characteristic
-        elif service_or_characteristic_found(INCLINATION_RANGE_UUID, service_or_characteristic.uuid):
-            self.inclination_range = service_or_characteristic
-        elif service_or_characteristic_found(RESISTANCE_LEVEL_RANGE_UUID, service_or_characteristic.uuid):
-            self.resistance_level_range = service_or_characteristic
-        elif service_or_characteristic_found(FTMS_CONTROL_POINT_UUID, service_or_characteristic.uuid):
-            self.ftms_control_point = service_or_characteristic
-        elif service_or_characteristic_found(INDOOR_BIKE_DATA_UUID, service_or_characteristic.uuid):
-            self.indoor_bike_data = service_or_characteristic
+    # a SharedMQTTClient (lib.ble_hub) or a MuxMQTTClient (lib.mqtt_mux) routes the command topics to this device, its network loop is run by the caller
+    def use_shared_mqtt_connection(self, mqtt_client, publisher):
+        self.owns_mqtt_client = False
+        self.mqtt_client = mqtt_client
+        self.publisher = publisher if publisher is not None else mqtt_client
+
+        command_handler = FTMSCommandHandler(self, mqtt_client)
+        for topic_name in (self.args.resistance_command_topic, self.args.incline_command_topic):
+            mqtt_client.add_message_callback(topic_name, command_handler.on_message)
+
+    # find the FTMS and custom incline services and their characteristics from the resolved services
+    def set_services_and_characteristics(self, gatt_index):
+        self.ftms = gatt_index.find(FTMS_UUID)
+        self.inclination_range = gatt_index.find(FTMS_UUID, INCLINATION_RANGE_UUID)
+        self.resistance_level_range = gatt_index.find(FTMS_UUID, RESISTANCE_LEVEL_RANGE_UUID)
+        self.ftms_control_point = gatt_index.find(FTMS_UUID, FTMS_CONTROL_POINT_UUID)
+        self.indoor_bike_data = gatt_index.find(FTMS_UUID, INDOOR_BIKE_DATA_UUID)
+
+        self.custom_incline_service = gatt_index.find(INCLINE_CONTROL_SERVICE_UUID)
+        self.custom_incline_characteristic = gatt_index.find(INCLINE_CONTROL_SERVICE_UUID, INCLINE_CONTROL_CHARACTERISTIC_UUID)
 
+    def read_firmware_revision(self, gatt_index):
+        firmware_revision = gatt_index.find(DIS_UUID, FIRMWARE_REVISION_STRING_UUID)
+        if firmware_revision is None:
+            return None
+
+        value = firmware_revision.read_value()
+        return decode_string_bytes(value).rstrip('\x00') if value is not None else None
 
     def read_resistance_level_range(self):
         if self.resistance_level_range:
-            print("The resistance level range is: {}".format(decode_int_bytes(self.resistance_level_range.read_value())))
+            print("The resistance level range is: {}".format(get_cached_value(self.attribute_table, self.resistance_level_range)))
 
     def read_inclination_range(self):
         if self.inclination_range:
-            print("The inclination range is: {}".format(decode_int_bytes(self.inclination_range.read_value())))
+            print("The inclination range is: {}".format(get_cached_value(self.attribute_table, self.inclination_range)))
 
     def connect_succeeded(self):
         super().connect_succeeded()
         print("[%s] Connected" % (self.mac_address))
 
+    # don't exit, under the BLE hub that would stop the fan, heart rate and cadence devices too
     def connect_failed(self, error):
         super().connect_failed(error)
-        print("[%s] Connection failed: %s" % (self.mac_address, str(error)))
-        sys.exit()
+        print("[%s] Connection failed: %s, retrying in %d seconds" % (self.mac_address, str(error), BLE_RECONNECT_DELAY))
+        self.scheduler.call_later(BLE_RECONNECT_DELAY, self.connect)
 
     def disconnect_succeeded(self):
         super().disconnect_succeeded()
@@ -100,16 +142,14 @@ class WahooDevice(gatt.Device):
         if self.ftms_control_point:
             # request FTMS control
             print("Requesting FTMS control...")
-            self.ftms_control_point.write_value(bytearray([FTMS_REQUEST_CONTROL]))
-            sleep(WRITEVALUE_WAIT_TIME)
+            self.command_queue.write_value(self.ftms_control_point, bytearray([FTMS_REQUEST_CONTROL]))
 
     def ftms_reset_settings(self):
         print("Initiating to reset control settings...")
         if self.ftms_control_point:
             # reset FTMS control settings
             print("Resetting FTMS control settings...")
-            self.ftms_control_point.write_value(bytearray([FTMS_RESET]))
-            sleep(WRITEVALUE_WAIT_TIME)
+            self.command_queue.write_value(self.ftms_control_point, bytearray([FTMS_RESET]))
 
             self.resistance = 0
             self.inclination = 0
@@ -124,57 +164,64 @@ class WahooDevice(gatt.Device):
             # reset incline to the flat level: 0%
             self.custom_control_point_set_target_inclination(self.inclination)
 
-            self.mqtt_client.publish(self.args.incline_report_topic, self.mqtt_data_report_payload('incline', self.inclination))
-            self.mqtt_client.publish(self.args.resistance_report_topic, self.mqtt_data_report_payload('resistance', self.resistance))
+            self.mqtt_client.publish(self.args.incline_report_topic, self.mqtt_data_report_payload(self.args.incline_report_topic, 'incline', self.inclination))
+            self.mqtt_client.publish(self.args.resistance_report_topic, self.mqtt_data_report_payload(self.args.resistance_report_topic, 'resistance', self.resistance))
 
     # the resistance value is UINT8 type and unitless with a resolution of 0.1
     def ftms_set_target_resistance_level(self, new_resistance):
         print(f"Trying to set a new resistance value: {new_resistance}")
 
         if self.ftms_control_point:
-            # initiate the action
-            self.ftms_control_point.write_value(bytearray([FTMS_SET_TARGET_RESISTANCE_LEVEL, new_resistance]))
+            # initiate the action, the new value is reported once the device confirms the write
+            # a newer resistance target replaces this one if it hasn't been sent yet
             self.new_resistance = new_resistance
-            sleep(WRITEVALUE_WAIT_TIME)
-            
+            self.command_queue.write_value(self.ftms_control_point, bytearray([FTMS_SET_TARGET_RESISTANCE_LEVEL, new_resistance]),
+                on_success=lambda: self.set_new_resistance(new_resistance),
+                on_failure=lambda: self.set_new_resistance_failed(new_resistance),
+                key='resistance')
+
     def custom_control_point_enable_notifications(self):
         if self.custom_incline_characteristic:
             # has to do this step to be able to send incline value successfully
             print("Enabling notifications for custom incline endpoint...")
-            self.custom_incline_characteristic.enable_notifications()
-            sleep(WRITEVALUE_WAIT_TIME)
+            self.command_queue.enable_notifications(self.custom_incline_characteristic)
 
     # the inclination value range is -10 to 19, in Percent with a resolution of 0.5%
     def custom_control_point_set_target_inclination(self, new_inclination):
         print(f"Trying to set a new inclination value: {new_inclination}")
 
         if self.custom_incline_characteristic:
-            # send the new inclination value to the custom characteristic
-            print("values are: ", convert_incline_to_op_value(new_inclination))
-            self.custom_incline_characteristic.write_value(bytearray([INCLINE_CONTROL_OP_CODE] + convert_incline_to_op_value(new_inclination)))
-            #self.custom_incline_characteristic.write_value(bytearray([0x66, 0x6c, 0x07]))
+            # send the new inclination value to the custom characteristic, the new value is reported once the device confirms the write
+            # a newer inclination target replaces this one if it hasn't been sent yet
             self.new_inclination = new_inclination
-            sleep(WRITEVALUE_WAIT_TIME)
-
-    def set_new_inclination(self):
-        self.inclination = self.new_inclination
-        self.new_inclination = None
+            self.command_queue.write_value(self.custom_incline_characteristic, bytearray([INCLINE_CONTROL_OP_CODE] + convert_incline_to_op_value(new_inclination)),
+                on_success=lambda: self.set_new_inclination(new_inclination),
+                on_failure=lambda: self.set_new_inclination_failed(new_inclination),
+                key='incline')
+
+    def set_new_inclination(self, inclination):
+        self.inclination = inclination
+        if self.new_inclination == inclination:
+            self.new_inclination = None
         print(f"A new inclination has been set successfully: {self.inclination}")
-        self.mqtt_client.publish(self.args.incline_report_topic, self.mqtt_data_report_payload('incline', self.inclination))
+        self.mqtt_client.publish(self.args.incline_report_topic, self.mqtt_data_report_payload(self.args.incline_report_topic, 'incline', self.inclination))
 
-    def set_new_resistance(self):
-        self.resistance = self.new_resistance
-        self.new_resistance = None
+    def set_new_resistance(self, resistance):
+        self.resistance = resistance
+        if self.new_resistance == resistance:
+            self.new_resistance = None
         print(f"A new resistance has been set successfully: {self.resistance}")
-        self.mqtt_client.publish(self.args.resistance_report_topic, self.mqtt_data_report_payload('resistance', self.resistance))
+        self.mqtt_client.publish(self.args.resistance_report_topic, self.mqtt_data_report_payload(self.args.resistance_report_topic, 'resistance', self.resistance))
 
-    def set_new_inclination_failed(self):
-        print(f"The new inclination has not been set successfully: {self.new_inclination}")
-        self.new_inclination = None
+    def set_new_inclination_failed(self, inclination):
+        print(f"The new inclination has not been set successfully: {inclination}")
+        if self.new_inclination == inclination:
+            self.new_inclination = None
 
-    def set_new_resistance_failed(self):
-        print(f"The new resistance has not been set successfully: {self.new_resistance}")
-        self.new_resistance = None
+    def set_new_resistance_failed(self, resistance):
+        print(f"The new resistance has not been set successfully: {resistance}")
+        if self.new_resistance == resistance:
+            self.new_resistance = None
 
     def descriptor_read_value_failed(self, descriptor, error):
         print('descriptor value read failed:', str(error))
@@ -182,200 +229,111 @@ class WahooDevice(gatt.Device):
     def characteristic_value_updated(self, characteristic, value):
         print(f"The updated value for {characteristic.uuid} is:", value)
 
+    # let the command queue send the next BLE command once the device confirms or rejects the current one
     def characteristic_write_value_succeeded(self, characteristic):
         print(f"A new value has been written to {characteristic.uuid}")
-
-        # set new resistance or inclination and notify to MQTT if the async write value action is succeeded
-        if service_or_characteristic_found(FTMS_CONTROL_POINT_UUID, characteristic.uuid):
-            if self.new_resistance is not None:
-                self.set_new_resistance()
-        if service_or_characteristic_found_full_match(INCLINE_CONTROL_CHARACTERISTIC_UUID, characteristic.uuid):
-            if self.new_inclination is not None:
-                self.set_new_inclination()
+        self.command_queue.command_succeeded(characteristic)
 
     def characteristic_write_value_failed(self, characteristic, error):
         print(f"A new value has not been written to {characteristic.uuid} successfully: {str(error)}")
+        self.command_queue.command_failed(characteristic, error)
 
-        # clear the new resistance or inclination and notify to MQTT if the async write value action is failed
-        if service_or_characteristic_found(FTMS_CONTROL_POINT_UUID, characteristic.uuid):
-            if self.new_resistance is not None:
-                self.set_new_resistance_failed()
-        if service_or_characteristic_found_full_match(INCLINE_CONTROL_CHARACTERISTIC_UUID, characteristic.uuid):
-            if self.new_inclination is not None:
-                self.set_new_inclination_failed()
-
-    def characteristic_enable_notification_succeeded(self, characteristic):
+    def characteristic_enable_notifications_succeeded(self, characteristic):
         print(f"The {characteristic.uuid} has been enabled with notification!")
+        self.command_queue.command_succeeded(characteristic)
 
-    def characteristic_enable_notification_failed(self, characteristic, error):
-        print(f"Cannot enable notification for {characteristic.uuid}: {str(error)}")      
+    def characteristic_enable_notifications_failed(self, characteristic, error):
+        print(f"Cannot enable notification for {characteristic.uuid}: {str(error)}")
+        self.command_queue.command_failed(characteristic, error)
 
     # process the Indoor Bike Data
     def process_indoor_bike_data(self, value):
-        flag_instantaneous_speed = not((value[0] & 1) >> 0)
-        flag_average_speed = (value[0] & 2) >> 1
-        flag_instantaneous_cadence = (value[0] & 4) >> 2
-        flag_average_cadence = (value[0] & 8) >> 3
-        flag_total_distance = (value[0] & 16) >> 4
-        flag_resistance_level = (value[0] & 32) >> 5
-        flag_instantaneous_power = (value[0] & 64) >> 6
-        flag_average_power = (value[0] & 128) >> 7
-        flag_expended_energy = (value[1] & 1) >> 0
-        flag_heart_rate = (value[1] & 2) >> 1
-        flag_metabolic_equivalent = (value[1] & 4) >> 2
-        flag_elapsed_time = (value[1] & 8) >> 3
-        flag_remaining_time = (value[1] & 16) >> 4
-        offset = 2
-
-        if flag_instantaneous_speed:
-            self.instantaneous_speed = float((value[offset+1] << 8) + value[offset]) / 100.0 * 5.0 / 18.0
-            offset += 2
-            print(f"Instantaneous Speed: {self.instantaneous_speed} m/s")
+        try:
+            record = decode_indoor_bike_data(value)
+        except ValueError:
+            log.limited(logging.ERROR, 'invalid payload', "Indoor Bike Data payload was not parsed correctly: %s", bytes(value).hex())
+            return
 
-        if flag_average_speed:
-            self.average_speed = float((value[offset+1] << 8) + value[offset]) / 100.0 * 5.0 / 18.0
-            offset += 2
-            print(f"Average Speed: {self.average_speed} m/s")
+        flag_instantaneous_speed = record.instantaneous_speed is not None
+        flag_instantaneous_cadence = record.instantaneous_cadence is not None
+        flag_instantaneous_power = record.instantaneous_power is not None
 
+        if flag_instantaneous_speed:
+            self.instantaneous_speed = record.instantaneous_speed
         if flag_instantaneous_cadence:
-            self.instantaneous_cadence = float((value[offset+1] << 8) + value[offset]) / 10.0
-            offset += 2
-            print(f"Instantaneous Cadence: {self.instantaneous_cadence} rpm")
-
-        if flag_average_cadence:
-            self.average_cadence = float((value[offset+1] << 8) + value[offset]) / 10.0
-            offset += 2
-            print(f"Average Cadence: {self.average_cadence} rpm")
-
-        if flag_total_distance:
-            self.total_distance = int((value[offset+2] << 16) + (value[offset+1] << 8) + value[offset])
-            offset += 3
-            print(f"Total Distance: {self.total_distance} m")
-
-        if flag_resistance_level:
-           self.resistance_level = int((value[offset+1] << 8) + value[offset])
-           offset += 2
-           print(f"Resistance Level: {self.resistance_level}")
-
+            self.instantaneous_cadence = record.instantaneous_cadence
         if flag_instantaneous_power:
-            self.instantaneous_power = int((value[offset+1] << 8) + value[offset])
-            offset += 2
-            print(f"Instantaneous Power: {self.instantaneous_power} W")
-
-        if flag_average_power:
-            self.average_power = int((value[offset+1] << 8) + value[offset])
-            offset += 2
-            print(f"Average Power: {self.average_power} W")
-
-        if flag_expended_energy:
-            expended_energy_total = int((value[offset+1] << 8) + value[offset])
-            offset += 2
-            if expended_energy_total != 0xFFFF:
-                self.expended_energy_total = expended_energy_total
-                print(f"Expended Energy: {self.expended_energy_total} kCal total")
-
-            expended_energy_per_hour = int((value[offset+1] << 8) + value[offset])
-            offset += 2
-            if expended_energy_per_hour != 0xFFFF:
-                self.expended_energy_per_hour = expended_energy_per_hour
-                print(f"Expended Energy: {self.expended_energy_per_hour} kCal/hour")
-
-            expended_energy_per_minute = int(value[offset])
-            offset += 1
-            if expended_energy_per_minute != 0xFF:
-                self.expended_energy_per_minute = expended_energy_per_minute
-                print(f"Expended Energy: {self.expended_energy_per_minute} kCal/min")
-
-        if flag_heart_rate:
-            self.heart_rate = int(value[offset])
-            offset += 1
-            print(f"Heart Rate: {self.heart_rate} bpm")
-
-        if flag_metabolic_equivalent:
-            self.metabolic_equivalent = float(value[offset]) / 10.0
-            offset += 1
-            print(f"Metabolic Equivalent: {self.metabolic_equivalent} METS")
-
-        if flag_elapsed_time:
-            self.elapsed_time = int((value[offset+1] << 8) + value[offset])
-            offset += 2
-            print(f"Elapsed Time: {self.elapsed_time} seconds")
-
-        if flag_remaining_time:
-            self.remaining_time = int((value[offset+1] << 8) + value[offset])
-            offset += 2
-            print(f"Remaining Time: {self.remaining_time} seconds")
-
-        if offset != len(value):
-            print("ERROR: Payload was not parsed correctly")
-            return
+            self.instantaneous_power = record.instantaneous_power
 
         # The KICKR Trainer only reports instantaneous speed, cadence and power
-        # Publish them to MQTT topics if they were provided
-        if self.zero_count < 10:
-            if flag_instantaneous_speed:
-                self.mqtt_client.publish(self.args.speed_report_topic, self.mqtt_data_report_payload('speed', self.instantaneous_speed))
-            if flag_instantaneous_cadence:
-                self.mqtt_client.publish(self.args.cadence_report_topic, self.mqtt_data_report_payload('cadence', self.instantaneous_cadence))
-            if flag_instantaneous_power:
-                self.mqtt_client.publish(self.args.power_report_topic, self.mqtt_data_report_payload('power', self.instantaneous_power))
-                
-            if self.instantaneous_speed == 0:
-                self.zero_count += 1
-                
-            print('Zero Count:', self.zero_count)
-                
-        elif self.zero_count >= 10 and self.instantaneous_speed > 0:
-            self.zero_count = 0
-            if flag_instantaneous_speed:
-                self.mqtt_client.publish(self.args.speed_report_topic, self.mqtt_data_report_payload('speed', self.instantaneous_speed))
-            if flag_instantaneous_cadence:
-                self.mqtt_client.publish(self.args.cadence_report_topic, self.mqtt_data_report_payload('cadence', self.instantaneous_cadence))
-            if flag_instantaneous_power:
-                self.mqtt_client.publish(self.args.power_report_topic, self.mqtt_data_report_payload('power', self.instantaneous_power))
+        # Publish them to MQTT topics if they were provided and the publish filter lets them through
+        ts = time.time()
+        published_count = self.publish_sample(flag_instantaneous_speed, self.args.speed_report_topic, 'speed', record.instantaneous_speed, ts) \
+            + self.publish_sample(flag_instantaneous_cadence, self.args.cadence_report_topic, 'cadence', record.instantaneous_cadence, ts) \
+            + self.publish_sample(flag_instantaneous_power, self.args.power_report_topic, 'power', record.instantaneous_power, ts)
+
+        if published_count > 0:
+            log.count('published frames')
         else:
-            print('Bike currently idle, no data publish to MQTT')
-            
-    def mqtt_data_report_payload(self, device_type, value):
+            log.count('suppressed frames')
+            if self.publish_filter.is_idle(self.args.speed_report_topic):
+                log.limited(logging.INFO, 'idle', "Bike currently idle, no data published to MQTT")
+
+    # publish a value of the Indoor Bike Data, returns 1 if it was published and 0 if it wasn't present or was filtered out
+    def publish_sample(self, present, topic_name, device_type, value, timestamp):
+        if not present or not self.publish_filter.accept(topic_name, value, timestamp):
+            return 0
+        self.publisher.publish(topic_name, self.mqtt_data_report_payload(topic_name, device_type, value, timestamp))
+        return 1
+
+    # a JSON payload, or a compact frame with the unit and device name in the retained descriptor of the topic (lib.compact_payload)
+    # the samples are stamped with the time their notification was received, the command reports with now
+    def mqtt_data_report_payload(self, topic_name, device_type, value, timestamp=None):
         # TODO: add more json data payload whenever needed later
-        return json.dumps({"value": value, "unitName": DEVICE_UNIT_NAMES[device_type], "timestamp": time.time(), "metadata": { "deviceName": platform.node() } })
+        start = tracer.start()
+        payload = self.payload_encoder.encode(topic_name, DEVICE_UNIT_NAMES[device_type], value, timestamp if timestamp is not None else time.time())
+        tracer.record('payload', start)
+        return payload
 
     # this will be called with updates from any characteristics which provide notifications (eg. Indoor Bike Data)
     def characteristic_value_updated(self, characteristic, value):
         if characteristic == self.indoor_bike_data:
+            start = tracer.begin_notification()
             self.process_indoor_bike_data(value)
+            tracer.end_notification(start)
 
     # this is the main process that will be run all time after manager.run() is called
     def services_resolved(self):
         super().services_resolved()
 
         print("[%s] Resolved services" % (self.mac_address))
-        for service in self.services:
-            print("[%s]\tService [%s]" % (self.mac_address, service.uuid))
-            self.set_service_or_characteristic(service)
-
-            for characteristic in service.characteristics:
-                print("[%s]\t\tCharacteristic [%s]" % (self.mac_address, characteristic.uuid))
-                print("The characteristic value is: ", characteristic.read_value())
-
-                if self.ftms == service:
-                    # set for FTMS control point for resistance control
-                    self.set_service_or_characteristic(characteristic)
-                if self.custom_incline_service == service:
-                    # set for custom control point for incline control
-                    self.set_service_or_characteristic(characteristic)
+        gatt_index = GattIndex(self.services)
+        self.set_services_and_characteristics(gatt_index)
+
+        # only read every characteristic on the first connection, or after a firmware update
+        firmware_revision = self.read_firmware_revision(gatt_index)
+        self.attribute_table, cached = self.attribute_cache.get_or_read(self.mac_address, firmware_revision, self.services)
+        if cached:
+            print("[%s] Using the cached attribute table (firmware revision: %s)" % (self.mac_address, firmware_revision))
+        else:
+            for service_uuid, values in self.attribute_table.items():
+                print("[%s]\tService [%s]" % (self.mac_address, service_uuid))
+                for characteristic_uuid, value in values.items():
+                    print("[%s]\t\tCharacteristic [%s]" % (self.mac_address, characteristic_uuid))
+                    print("The characteristic value is: ", value)
 
         # continue if FTMS service is found from the BLE device
         if self.ftms and self.indoor_bike_data:
-            # read the supported resistance and inclination ranges here to set correct command values later
+            # enable notifications for Indoor Bike Data
+            self.command_queue.enable_notifications(self.indoor_bike_data)
+
+            # the supported resistance and inclination ranges to set correct command values later
             self.read_resistance_level_range()
             self.read_inclination_range()
 
-            # enable notifications for Indoor Bike Data
-            self.indoor_bike_data.enable_notifications()
-
             # reset control settings while initiating the BLE connection
             self.ftms_reset_settings()
 
             # start looping MQTT messages
-            self.mqtt_client.loop_start()
+            if self.owns_mqtt_client:
+                self.mqtt_client.loop_start()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import random
+import asyncio
+import threading
+import paho.mqtt.client as paho
+from paho import mqtt
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from lib.constants import ASYNC_MQTT_QUEUE_SIZE, ASYNC_MQTT_MAX_INFLIGHT, ASYNC_MQTT_CONNECT_TIMEOUT, ASYNC_MQTT_RECONNECT_MIN_DELAY, ASYNC_MQTT_RECONNECT_MAX_DELAY
+
+# the delay before the next reconnect attempt: an exponential backoff with "full jitter",
+# so a group of Pis that lost the broker at the same time don't all reconnect at the same moment
+def reconnect_delay(attempt, min_delay=ASYNC_MQTT_RECONNECT_MIN_DELAY, max_delay=ASYNC_MQTT_RECONNECT_MAX_DELAY):
+    return random.uniform(min_delay, min(max_delay, min_delay * (2 ** attempt)))
+
+# an asyncio version of MQTTClient with the same publish/subscribe surface, for HiveMQ Cloud
+# paho's socket is driven by the asyncio event loop (add_reader/add_writer) instead of the loop_start() thread,
+# so BLE callbacks and MQTT can be served by one event loop without thread handoffs
+class AsyncMQTTClient:
+    def __init__(self, broker_address, username, password, port=8883, queue_size=ASYNC_MQTT_QUEUE_SIZE, max_inflight=ASYNC_MQTT_MAX_INFLIGHT):
+        self.broker_address = broker_address
+        self.username = username
+        self.password = password
+        self.port = port
+        self.queue_size = queue_size
+        self.max_inflight = max_inflight
+        self.client = None
+        self.loop = None
+        # the outbound queue is created by connect(), in the event loop it belongs to
+        self.queue = None
+
+        # topics to subscribe to again after every reconnect
+        self.subscriptions = []
+
+        # a user defined callback for received messages, same signature as paho's on_message
+        self.message_callback = None
+
+        self.dropped_count = 0
+        self.closing = False
+        self.tasks = []
+
+    def get_client(self):
+        return self.client
+
+    # connect to the broker, this returns once the CONNACK has been received
+    async def connect(self):
+        self.create_queue()
+
+        # using MQTT version 5 here, for 3.1.1: MQTTv311, 3.1: MQTTv31
+        self.client = paho.Client(client_id="", userdata=None, protocol=paho.MQTTv5)
+        # enable TLS for secure connection
+        self.client.tls_set(tls_version=mqtt.client.ssl.PROTOCOL_TLS)
+        # set username and password
+        self.client.username_pw_set(self.username, self.password)
+
+        self.client.on_connect = self.on_connect
+        self.client.on_disconnect = self.on_disconnect
+        self.client.on_subscribe = self.on_subscribe
+        self.client.on_message = self.on_message
+        self.client.on_publish = self.on_publish
+
+        # hand the socket over to the asyncio event loop
+        self.client.on_socket_open = self.on_socket_open
+        self.client.on_socket_close = self.on_socket_close
+        self.client.on_socket_register_write = self.on_socket_register_write
+        self.client.on_socket_unregister_write = self.on_socket_unregister_write
+
+        await self.connect_with_backoff()
+
+        self.tasks = [
+            self.loop.create_task(self.send_queued_messages()),
+            self.loop.create_task(self.run_misc_loop()),
+            self.loop.create_task(self.keep_connected())
+        ]
+
+    # the outbound queue, the in-flight slots and the connection events of the running event loop
+    def create_queue(self):
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread_id = threading.get_ident()
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.inflight = asyncio.Semaphore(self.max_inflight)
+        self.inflight_mids = set()
+        self.connected = asyncio.Event()
+        self.disconnected = asyncio.Event()
+
+    async def connect_with_backoff(self):
+        attempt = 0
+        while not self.closing:
+            try:
+                # the TCP connection and TLS handshake are blocking in paho, so they run in a worker thread
+                await self.loop.run_in_executor(None, self.client.connect, self.broker_address, self.port)
+                await asyncio.wait_for(self.connected.wait(), ASYNC_MQTT_CONNECT_TIMEOUT)
+                return
+            except (OSError, asyncio.TimeoutError) as error:
+                delay = reconnect_delay(attempt)
+                print(f"MQTT connection failed: {str(error)}, retrying in {delay:.1f} seconds")
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    # reconnect with a jittered backoff whenever the connection drops
+    async def keep_connected(self):
+        while not self.closing:
+            await self.disconnected.wait()
+            if self.closing:
+                return
+            await self.connect_with_backoff()
+
+    # paho needs loop_misc() to be called regularly for keepalive pings and retries
+    async def run_misc_loop(self):
+        while not self.closing:
+            self.client.loop_misc()
+            await asyncio.sleep(1)
+
+    # take messages from the outbound queue and publish them, never having more than max_inflight QoS 1 messages without a PUBACK
+    async def send_queued_messages(self):
+        while True:
+            topic_name, payload, retain = await self.queue.get()
+            await self.connected.wait()
+            await self.inflight.acquire()
+
+            message_info = self.client.publish(topic_name, payload=payload, qos=1, retain=retain)
+            if message_info.rc == paho.MQTT_ERR_SUCCESS:
+                self.inflight_mids.add(message_info.mid)
+            else:
+                self.inflight.release()
+            self.queue.task_done()
+
+    def subscribe(self, topic_name):
+        self.subscriptions.append(topic_name)
+        if self.client and self.connected.is_set():
+            self.client.subscribe(topic_name, qos=1)
+
+    # same signature as MQTTClient.publish and never blocks: the message is queued,
+    # or dropped and counted if the outbound queue is full, returns whether it was queued
+    def publish(self, topic_name, payload, retain=False):
+        if self.queue is None:
+            raise Exception("connect() has to be awaited before publishing", topic_name)
+        try:
+            self.queue.put_nowait((topic_name, payload, retain))
+            return True
+        except asyncio.QueueFull:
+            self.dropped_count += 1
+            return False
+
+    # the awaitable version of publish, which waits for room in the outbound queue (backpressure)
+    async def publish_async(self, topic_name, payload, retain=False):
+        if self.queue is None:
+            raise Exception("connect() has to be awaited before publishing", topic_name)
+        await self.queue.put((topic_name, payload, retain))
+
+    # wait until everything queued has been published
+    async def flush(self):
+        await self.queue.join()
+
+    # paho only queues the DISCONNECT packet, so it is written out before the tasks are cancelled,
+    # otherwise the broker sees an unclean drop and publishes the last will
+    async def disconnect(self):
+        self.closing = True
+        self.client.disconnect()
+        self.client.loop_write()
+
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    # asyncio event loop integration for the paho socket
+    # paho calls these from the worker thread that runs client.connect too, so those calls are handed over to the event loop
+    def call_in_loop(self, callback, *args):
+        if threading.get_ident() == self.loop_thread_id:
+            callback(*args)
+        else:
+            self.loop.call_soon_threadsafe(callback, *args)
+
+    def on_socket_open(self, client, userdata, sock):
+        self.call_in_loop(self.loop.add_reader, sock, self.client.loop_read)
+
+    # the socket may be closed by the time the event loop gets to it, so it is removed by its file descriptor
+    def on_socket_close(self, client, userdata, sock):
+        self.call_in_loop(self.loop.remove_reader, sock.fileno())
+
+    def on_socket_register_write(self, client, userdata, sock):
+        self.call_in_loop(self.loop.add_writer, sock, self.client.loop_write)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self.call_in_loop(self.loop.remove_writer, sock.fileno())
+
+    # setting callbacks for different events to see if it works, print the message etc.
+    def on_connect(self, client, userdata, flags, rc, properties=None):
+        print("CONNACK received with code %s." % rc)
+        if rc != 0:
+            return
+
+        # subscribe again after a reconnect
+        for topic_name in self.subscriptions:
+            self.client.subscribe(topic_name, qos=1)
+
+        self.disconnected.clear()
+        self.connected.set()
+
+    def on_disconnect(self, client, userdata, rc=0, properties=None):
+        print(f"Disconnected result code: {str(rc)}")
+        self.connected.clear()
+
+        # the messages waiting for a PUBACK are resent by paho after reconnecting, so they don't hold the in-flight slots
+        for _ in self.inflight_mids:
+            self.inflight.release()
+        self.inflight_mids.clear()
+
+        if not self.closing:
+            self.disconnected.set()
+
+    # release an in-flight slot once the PUBACK is received
+    def on_publish(self, client, userdata, mid, properties=None):
+        if mid in self.inflight_mids:
+            self.inflight_mids.remove(mid)
+            self.inflight.release()
+
+    # print which topic was subscribed to
+    def on_subscribe(self, client, userdata, mid, granted_qos, properties=None):
+        print("Subscribed: " + str(mid) + " " + str(granted_qos))
+
+    # pass the message on to the user defined callback, or print it
+    def on_message(self, client, userdata, msg):
+        if self.message_callback:
+            self.message_callback(client, userdata, msg)
+        else:
+            print(msg.topic + " " + str(msg.qos) + " " + str(msg.payload))
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import timeit
+from argparse import ArgumentParser
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.append(root_folder)
+
+from lib.ble_helper import decode_indoor_bike_data
+
+DEFAULT_FRAMES_FILE = os.path.join(root_folder, 'kickr_climb_and_smart_trainer', 'sample_data', 'indoor_bike_data_sample_frames.txt')
+
+# the per-field parser previously used by WahooDevice.process_indoor_bike_data (without its prints), kept here as the baseline
+def decode_per_field(value):
+    result = {}
+    flag_instantaneous_speed = not((value[0] & 1) >> 0)
+    flag_average_speed = (value[0] & 2) >> 1
+    flag_instantaneous_cadence = (value[0] & 4) >> 2
+    flag_average_cadence = (value[0] & 8) >> 3
+    flag_total_distance = (value[0] & 16) >> 4
+    flag_resistance_level = (value[0] & 32) >> 5
+    flag_instantaneous_power = (value[0] & 64) >> 6
+    flag_average_power = (value[0] & 128) >> 7
+    flag_expended_energy = (value[1] & 1) >> 0
+    flag_heart_rate = (value[1] & 2) >> 1
+    flag_metabolic_equivalent = (value[1] & 4) >> 2
+    flag_elapsed_time = (value[1] & 8) >> 3
+    flag_remaining_time = (value[1] & 16) >> 4
+    offset = 2
+
+    if flag_instantaneous_speed:
+        result['instantaneous_speed'] = float((value[offset+1] << 8) + value[offset]) / 100.0 * 5.0 / 18.0
+        offset += 2
+    if flag_average_speed:
+        result['average_speed'] = float((value[offset+1] << 8) + value[offset]) / 100.0 * 5.0 / 18.0
+        offset += 2
+    if flag_instantaneous_cadence:
+        result['instantaneous_cadence'] = float((value[offset+1] << 8) + value[offset]) / 10.0
+        offset += 2
+    if flag_average_cadence:
+        result['average_cadence'] = float((value[offset+1] << 8) + value[offset]) / 10.0
+        offset += 2
+    if flag_total_distance:
+        result['total_distance'] = int((value[offset+2] << 16) + (value[offset+1] << 8) + value[offset])
+        offset += 3
+    if flag_resistance_level:
+        result['resistance_level'] = int((value[offset+1] << 8) + value[offset])
+        offset += 2
+    if flag_instantaneous_power:
+        result['instantaneous_power'] = int((value[offset+1] << 8) + value[offset])
+        offset += 2
+    if flag_average_power:
+        result['average_power'] = int((value[offset+1] << 8) + value[offset])
+        offset += 2
+    if flag_expended_energy:
+        result['expended_energy_total'] = int((value[offset+1] << 8) + value[offset])
+        offset += 2
+        result['expended_energy_per_hour'] = int((value[offset+1] << 8) + value[offset])
+        offset += 2
+        result['expended_energy_per_minute'] = int(value[offset])
+        offset += 1
+    if flag_heart_rate:
+        result['heart_rate'] = int(value[offset])
+        offset += 1
+    if flag_metabolic_equivalent:
+        result['metabolic_equivalent'] = float(value[offset]) / 10.0
+        offset += 1
+    if flag_elapsed_time:
+        result['elapsed_time'] = int((value[offset+1] << 8) + value[offset])
+        offset += 2
+    if flag_remaining_time:
+        result['remaining_time'] = int((value[offset+1] << 8) + value[offset])
+        offset += 2
+
+    if offset != len(value):
+        return None
+
+    return result
+
+def load_frames(path):
+    frames = []
+    with open(path, 'r') as frames_file:
+        for line in frames_file:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            frames.append(bytes.fromhex(line.split()[-1]))
+
+    return frames
+
+def run_benchmark(frames, repeat):
+    def per_field():
+        for frame in frames:
+            decode_per_field(frame)
+
+    def table_driven():
+        for frame in frames:
+            decode_indoor_bike_data(frame)
+
+    number_of_frames = len(frames) * repeat
+    for name, func in (('per-field', per_field), ('table-driven', table_driven)):
+        elapsed = min(timeit.repeat(func, number=repeat, repeat=5))
+        print(f"{name:>14}: {elapsed / number_of_frames * 1e6:.3f} us/frame ({number_of_frames / elapsed:.0f} frames/s)")
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Compare the per-field and table-driven Indoor Bike Data decoders")
+    parser.add_argument('--frames_file', dest='frames_file', type=str, help='a file with one hex encoded Indoor Bike Data payload per line', default=DEFAULT_FRAMES_FILE)
+    parser.add_argument('--repeat', dest='repeat', type=int, help='how many times to decode the whole set of frames per run', default=2000)
+    args = parser.parse_args()
+
+    frames = load_frames(args.frames_file)
+    print(f"Decoding {len(frames)} frames x {args.repeat}...")
+    run_benchmark(frames, args.repeat)
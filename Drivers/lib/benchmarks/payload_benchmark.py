@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import timeit
+import platform
+from argparse import ArgumentParser
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.append(root_folder)
+
+from lib.compact_payload import JSONPayloadEncoder, CompactPayloadEncoder
+from lib.constants import DEVICE_UNIT_NAMES
+
+# the Kickr reports speed, cadence and power, the heart rate and fan drivers one value each
+SAMPLES = [
+    ('bike/000001/speed', 'speed', 8.277777777777779),
+    ('bike/000001/cadence', 'cadence', 85.5),
+    ('bike/000001/power', 'power', 212),
+    ('bike/000001/heartrate', 'heartRate', 141),
+    ('bike/000001/fan', 'headWind', 40)
+]
+
+# the payload previously built by WahooDevice.mqtt_data_report_payload for every sample, kept here as the baseline
+def encode_per_sample(device_type, value):
+    return json.dumps({"value": value, "unitName": DEVICE_UNIT_NAMES[device_type], "timestamp": time.time(), "metadata": { "deviceName": platform.node() } })
+
+class NullMQTTClient:
+    def publish(self, topic_name, payload, retain=False):
+        pass
+
+def run_benchmark(repeat, sample_rate):
+    json_encoder = JSONPayloadEncoder()
+    compact_encoder = CompactPayloadEncoder(NullMQTTClient())
+
+    def per_sample():
+        for topic_name, device_type, value in SAMPLES:
+            encode_per_sample(device_type, value)
+
+    def cached_json():
+        for topic_name, device_type, value in SAMPLES:
+            json_encoder.encode(topic_name, DEVICE_UNIT_NAMES[device_type], value, time.time())
+
+    def compact():
+        for topic_name, device_type, value in SAMPLES:
+            compact_encoder.encode(topic_name, DEVICE_UNIT_NAMES[device_type], value, time.time())
+
+    # the cached encoder has to build exactly the same payloads
+    for topic_name, device_type, value in SAMPLES:
+        expected = json.loads(encode_per_sample(device_type, value))
+        actual = json.loads(json_encoder.encode(topic_name, DEVICE_UNIT_NAMES[device_type], value, expected["timestamp"]))
+        assert actual == expected, (actual, expected)
+
+    number_of_samples = len(SAMPLES) * repeat
+    for name, func in (('json.dumps', per_sample), ('cached JSON', cached_json), ('compact', compact)):
+        elapsed = min(timeit.repeat(func, number=repeat, repeat=5))
+        per_sample_time = elapsed / number_of_samples
+        print(f"{name:>12}: {per_sample_time * 1e6:.3f} us/sample ({number_of_samples / elapsed:.0f} samples/s), {per_sample_time * sample_rate * 100:.3f}% of a core at {sample_rate} samples/s")
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Compare building the sample payloads with json.dumps, the cached JSON encoder and the compact encoder")
+    parser.add_argument('--repeat', dest='repeat', type=int, help='how many times to encode the set of samples per run', default=20000)
+    parser.add_argument('--sample_rate', dest='sample_rate', type=int, help='the samples per second of a hub, e.g. 4 Hz Kickr notifications with 3 values, heart rate and fan for 4 bikes', default=80)
+    args = parser.parse_args()
+
+    print(f"Encoding {len(SAMPLES)} samples x {args.repeat}...")
+    run_benchmark(args.repeat, args.sample_rate)
@@ -1,11 +1,13 @@
 import re
 import os
 import sys
+import struct
+from collections import namedtuple
 
 root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.append(root_folder)
 
-from lib.constants import INCLINE_MIN, INCLINE_MAX, INCLINE_CONTROL_FLAT, INCLINE_CONTROL_INCREMENT_UNIT, MAX_BYTE_VALUE, MIN_BYTE_VALUE
+from lib.constants import INCLINE_MIN, INCLINE_MAX, INCLINE_CONTROL_RESOLUTION
 
 def service_or_characteristic_found(target_uuid, full_uuid):
     uuid_string = hex(target_uuid)[2:]
@@ -28,43 +30,44 @@ def decode_string_bytes(value):
 def covert_negative_value_to_valid_bytes(negative_int):
     return negative_int.to_bytes(2, byteorder='big', signed=True)
 
-# the incline control value needs to have a valid BLE op code pattern like 666c07(19%), 66000(0%), 6619fc(-10%)
-def convert_incline_to_op_value(incline):
-    if incline < INCLINE_MIN or incline > INCLINE_MAX:
-        raise Exception("invalid incline value", incline)
+# the incline control value is a little-endian int16 in 0.01% units, eg. 666c07(19%), 660000(0%)
+# NOTE: the negative values sniffed from the Wahoo app are always 1 unit above that, eg. 6619fc(-10%) is -999 and 66cfff(-0.5%) is -49
+def encode_incline_op_value(incline):
+    units = int(round(incline * 100))
+    if units < 0:
+        units += 1
+
+    return list(units.to_bytes(2, byteorder='little', signed=True))
 
-    # increment op value part 1 by 50 unit, and increment part 2 by 1 when part value is greater than 256
-    if incline >= 0:
-        converted_value_part_1 = INCLINE_CONTROL_FLAT
-        converted_value_part_2 = INCLINE_CONTROL_FLAT
-        int_track_value =  0
+def decode_incline_op_value(op_value):
+    units = int.from_bytes(bytes(op_value[-2:]), byteorder='little', signed=True)
+    if units < 0:
+        units -= 1
 
-        while int_track_value < incline:
-            if converted_value_part_1 + INCLINE_CONTROL_INCREMENT_UNIT >= MAX_BYTE_VALUE:
-                converted_value_part_1 = converted_value_part_1 + INCLINE_CONTROL_INCREMENT_UNIT - MAX_BYTE_VALUE
-                converted_value_part_2 += 1
-            else:
-                converted_value_part_1 += INCLINE_CONTROL_INCREMENT_UNIT
+    return units / 100
 
-            int_track_value += INCLINE_CONTROL_INCREMENT_UNIT/100
+# every valid incline op value precomputed at the 0.5% resolution, keyed by the number of 0.5% steps
+INCLINE_OP_VALUES = {
+    steps: tuple(encode_incline_op_value(steps * INCLINE_CONTROL_RESOLUTION))
+    for steps in range(int(INCLINE_MIN / INCLINE_CONTROL_RESOLUTION), int(INCLINE_MAX / INCLINE_CONTROL_RESOLUTION) + 1)
+}
+INCLINE_OP_VALUE_INCLINES = {op_value: steps * INCLINE_CONTROL_RESOLUTION for steps, op_value in INCLINE_OP_VALUES.items()}
 
-        return [converted_value_part_1, converted_value_part_2]
-        # increment op value part 1 by 50 unit, and increment part 2 by 1 when part value is greater than 256
-    elif incline < 0:
-        converted_value_part_1 = INCLINE_CONTROL_FLAT
-        converted_value_part_2 = MAX_BYTE_VALUE
-        int_track_value =  0
+# the incline control value needs to have a valid BLE op code pattern like 666c07(19%), 660000(0%), 6619fc(-10%)
+# the incline is rounded to the nearest 0.5% step
+def convert_incline_to_op_value(incline):
+    if incline < INCLINE_MIN or incline > INCLINE_MAX:
+        raise Exception("invalid incline value", incline)
 
-        while int_track_value > incline:
-            if converted_value_part_1 - INCLINE_CONTROL_INCREMENT_UNIT < MIN_BYTE_VALUE:
-                converted_value_part_1 = MAX_BYTE_VALUE - converted_value_part_1 - INCLINE_CONTROL_INCREMENT_UNIT + 1
-                converted_value_part_2 -= 1
-            else:
-                converted_value_part_1 -= INCLINE_CONTROL_INCREMENT_UNIT
+    return list(INCLINE_OP_VALUES[int(round(incline / INCLINE_CONTROL_RESOLUTION))])
 
-            int_track_value -= INCLINE_CONTROL_INCREMENT_UNIT/100
+# the reverse of convert_incline_to_op_value, the op code byte is optional
+def convert_op_value_to_incline(op_value):
+    incline = INCLINE_OP_VALUE_INCLINES.get(tuple(op_value[-2:]))
+    if incline is None:
+        raise Exception("invalid incline op value", op_value)
 
-        return [converted_value_part_1, converted_value_part_2]
+    return incline
 
 # convert an array of hex values into human readable string
 def covert_hex_values_to_readable_string(array):
@@ -72,4 +75,159 @@ def covert_hex_values_to_readable_string(array):
     for i in range(len(array)):
         result += hex(array[i])[2:].zfill(2)
 
-    return result
\ No newline at end of file
+    return result
+
+# a decoded Indoor Bike Data (0x2AD2) notification, any field not present in the payload is None
+IndoorBikeData = namedtuple('IndoorBikeData', [
+    'flags',
+    'instantaneous_speed', 'average_speed',
+    'instantaneous_cadence', 'average_cadence',
+    'total_distance', 'resistance_level',
+    'instantaneous_power', 'average_power',
+    'expended_energy_total', 'expended_energy_per_hour', 'expended_energy_per_minute',
+    'heart_rate', 'metabolic_equivalent',
+    'elapsed_time', 'remaining_time'
+])
+
+def _unless_not_available(not_available_value):
+    return lambda raw: None if raw == not_available_value else raw
+
+# the Indoor Bike Data fields in the order they appear in the payload after the 2 flag bytes:
+# (flag bit, little-endian struct format, record field, divisor applied to the raw value, converter for fields that need more than a divisor)
+# NOTE: bit 0 is "More Data", so the instantaneous speed is present when the bit is NOT set
+# the speed is reported in 0.01 km/h and converted to m/s here, all other scales are kept as the previous per-field parser did
+INDOOR_BIKE_DATA_FIELDS = (
+    (0, 'H', 'instantaneous_speed', 360.0, None),
+    (1, 'H', 'average_speed', 360.0, None),
+    (2, 'H', 'instantaneous_cadence', 10.0, None),
+    (3, 'H', 'average_cadence', 10.0, None),
+    (4, 'HB', 'total_distance', None, lambda low, high: (high << 16) + low), # uint24
+    (5, 'H', 'resistance_level', None, None),
+    (6, 'H', 'instantaneous_power', None, None),
+    (7, 'H', 'average_power', None, None),
+    (8, 'H', 'expended_energy_total', None, _unless_not_available(0xFFFF)),
+    (8, 'H', 'expended_energy_per_hour', None, _unless_not_available(0xFFFF)),
+    (8, 'B', 'expended_energy_per_minute', None, _unless_not_available(0xFF)),
+    (9, 'B', 'heart_rate', None, None),
+    (10, 'B', 'metabolic_equivalent', 10.0, None),
+    (11, 'H', 'elapsed_time', None, None),
+    (12, 'H', 'remaining_time', None, None),
+)
+
+# the precompiled payload layouts, keyed by the 16-bit flags value of a notification
+_indoor_bike_data_layouts = {}
+
+def _build_indoor_bike_data_layout(flags):
+    struct_format = '<H'
+    copied_fields = []
+    scaled_fields = []
+    converted_fields = []
+    raw_index = 1
+
+    for flag_bit, field_format, field, divisor, converter in INDOOR_BIKE_DATA_FIELDS:
+        present = bool(flags & (1 << flag_bit))
+        if flag_bit == 0:
+            present = not present
+        if not present:
+            continue
+
+        field_index = IndoorBikeData._fields.index(field)
+        struct_format += field_format
+        if converter:
+            converted_fields.append((field_index, raw_index, raw_index + len(field_format), converter))
+        elif divisor:
+            scaled_fields.append((field_index, raw_index, divisor))
+        else:
+            copied_fields.append((field_index, raw_index))
+        raw_index += len(field_format)
+
+    return struct.Struct(struct_format), tuple(copied_fields), tuple(scaled_fields), tuple(converted_fields)
+
+def get_indoor_bike_data_layout(flags):
+    layout = _indoor_bike_data_layouts.get(flags)
+    if layout is None:
+        layout = _indoor_bike_data_layouts[flags] = _build_indoor_bike_data_layout(flags)
+
+    return layout
+
+# decode an Indoor Bike Data payload (bytes, bytearray or a dbus array of bytes) into an IndoorBikeData record
+# the struct layout for each distinct flags value is only built once, so a notification is decoded by a single unpack call
+def decode_indoor_bike_data(value):
+    if len(value) < 2:
+        raise ValueError("invalid Indoor Bike Data payload length", len(value))
+
+    flags = value[0] | (value[1] << 8)
+    layout, copied_fields, scaled_fields, converted_fields = get_indoor_bike_data_layout(flags)
+
+    if len(value) != layout.size:
+        raise ValueError("invalid Indoor Bike Data payload length", len(value))
+
+    raw_values = layout.unpack(value if isinstance(value, (bytes, bytearray)) else bytes(value))
+    record = [None] * len(IndoorBikeData._fields)
+    record[0] = flags
+    for field_index, raw_index in copied_fields:
+        record[field_index] = raw_values[raw_index]
+    for field_index, raw_index, divisor in scaled_fields:
+        record[field_index] = raw_values[raw_index] / divisor
+    for field_index, start, end, converter in converted_fields:
+        record[field_index] = converter(*raw_values[start:end])
+
+    return IndoorBikeData._make(record)
+
+# a decoded Heart Rate Measurement (0x2A37) notification: the heart rate in BPM, the sensor contact (None when it isn't reported),
+# the energy expended in kJ (None when it isn't reported) and the RR intervals in 1/1024 seconds, oldest first
+HeartRateMeasurement = namedtuple('HeartRateMeasurement', ['heart_rate', 'sensor_contact', 'energy_expended', 'rr_intervals'])
+
+# flags: bit 0 - 16 bit heart rate, bit 1 - contact detected, bit 2 - contact reported, bit 3 - energy expended, bit 4 - RR intervals
+def decode_heart_rate_measurement(value):
+    value = value if isinstance(value, (bytes, bytearray)) else bytes(value)
+    if len(value) < 2:
+        raise ValueError("invalid Heart Rate Measurement payload length", len(value))
+
+    flags = value[0]
+    size = (3 if flags & 1 else 2) + (2 if flags & 8 else 0)
+    if len(value) < size:
+        raise ValueError("invalid Heart Rate Measurement payload length", len(value))
+
+    heart_rate = struct.unpack_from('<H', value, 1)[0] if flags & 1 else value[1]
+    energy_expended = struct.unpack_from('<H', value, size - 2)[0] if flags & 8 else None
+    sensor_contact = bool(flags & 2) if flags & 4 else None
+
+    rr_intervals = ()
+    if flags & 16:
+        if (len(value) - size) % 2:
+            raise ValueError("invalid Heart Rate Measurement payload length", len(value))
+        rr_intervals = struct.unpack_from('<%dH' % ((len(value) - size) // 2), value, size)
+
+    return HeartRateMeasurement(heart_rate, sensor_contact, energy_expended, rr_intervals)
+
+# a decoded CSC Measurement (0x2A5B) notification, the fields of the data that isn't present are None
+# the revolutions are cumulative (wheel: uint32, crank: uint16) and the event times are in 1/1024 seconds (uint16), all of them roll over
+CSCMeasurement = namedtuple('CSCMeasurement', ['wheel_revolutions', 'last_wheel_event_time', 'crank_revolutions', 'last_crank_event_time'])
+
+# flags: bit 0 - wheel revolution data present, bit 1 - crank revolution data present
+CSC_MEASUREMENT_LAYOUTS = {
+    0: struct.Struct('<B'),
+    1: struct.Struct('<BIH'),
+    2: struct.Struct('<BHH'),
+    3: struct.Struct('<BIHHH')
+}
+
+def decode_csc_measurement(value):
+    value = value if isinstance(value, (bytes, bytearray)) else bytes(value)
+    if not value:
+        raise ValueError("invalid CSC Measurement payload length", len(value))
+
+    flags = value[0] & 3
+    layout = CSC_MEASUREMENT_LAYOUTS[flags]
+    if len(value) < layout.size:
+        raise ValueError("invalid CSC Measurement payload length", len(value))
+
+    fields = layout.unpack_from(value)
+    if flags == 3:
+        return CSCMeasurement(*fields[1:])
+    if flags == 1:
+        return CSCMeasurement(fields[1], fields[2], None, None)
+    if flags == 2:
+        return CSCMeasurement(None, None, fields[1], fields[2])
+    return CSCMeasurement(None, None, None, None)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import gatt
+import importlib.util
+from argparse import Namespace
+import paho.mqtt.client as paho
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from lib.mqtt_client import MQTTClient
+
+# a MQTT client shared by all the devices of the hub, incoming messages are passed to the callbacks of the matching topics
+class SharedMQTTClient(MQTTClient):
+    def __init__(self, broker_address, username, password):
+        super().__init__(broker_address, username, password)
+        self.message_callbacks = []
+
+    # subscribe to a topic (wildcards are allowed) and call the callback with every message received on it
+    def add_message_callback(self, topic_name, callback):
+        self.message_callbacks.append((topic_name, callback))
+        self.subscribe(topic_name)
+
+    def on_message(self, client, userdata, msg):
+        for topic_name, callback in self.message_callbacks:
+            if paho.topic_matches_sub(topic_name, msg.topic):
+                callback(client, userdata, msg)
+
+    # every sensor sample goes through this client, so don't print each published message id
+    def on_publish(self, client, userdata, mid, properties=None):
+        pass
+
+# a device the hub looks for, either by its mac address or by the prefix of its alias (e.g. 'TICKR', 'HEADWIND')
+# connect_device(mac_address, manager) creates and connects the driver's gatt.Device and returns it
+class DeviceHandler:
+    def __init__(self, name, connect_device, alias_prefix=None, mac_address=None):
+        if alias_prefix is None and mac_address is None:
+            raise ValueError(f"the {name} handler needs an alias prefix or a mac address")
+
+        self.name = name
+        self.connect_device = connect_device
+        self.alias_prefix = alias_prefix
+        self.mac_address = mac_address
+        self.device = None
+
+    def matches(self, device):
+        if self.mac_address is not None:
+            return device.mac_address.lower() == self.mac_address.lower()
+
+        alias = device.alias()
+        return alias is not None and alias.startswith(self.alias_prefix)
+
+# one gatt.DeviceManager (and so one discovery scan) for all the devices of a bike,
+# each discovered device is handed over to the first handler that is still waiting for its device
+class HubDeviceManager(gatt.DeviceManager):
+    def __init__(self, adapter_name, handlers):
+        super().__init__(adapter_name=adapter_name)
+        self.handlers = handlers
+
+    def waiting_handlers(self):
+        return [handler for handler in self.handlers if handler.device is None]
+
+    # devices with a known mac address are connected straight away, the others are discovered by their alias
+    def connect_devices(self):
+        for handler in self.handlers:
+            if handler.mac_address is not None:
+                self.dispatch(handler, handler.mac_address)
+
+        if self.waiting_handlers():
+            self.start_discovery()
+
+    def dispatch(self, handler, mac_address):
+        print("[%s] Connecting the %s device" % (mac_address, handler.name))
+        handler.device = handler.connect_device(mac_address, self)
+
+    def device_discovered(self, device):
+        for handler in self.waiting_handlers():
+            if handler.matches(device):
+                self.dispatch(handler, device.mac_address)
+                return
+
+    # a driver restarts the discovery when its connection failed, so its handler waits for the next discovered device again
+    def start_discovery(self):
+        for handler in self.handlers:
+            if handler.device is not None and handler.mac_address is None and not handler.device.is_connected():
+                handler.device = None
+
+        super().start_discovery()
+
+    # the drivers stop the discovery once their own device is connected,
+    # but the hub keeps it running until every handler has its device
+    def stop_discovery(self):
+        if self.waiting_handlers():
+            return
+
+        super().stop_discovery()
+
+# load a driver script as a module, its own folder is added to the path for its local imports (e.g. mqtt_client, wahoo_device)
+def load_driver(name, folder, file_name):
+    driver_folder = os.path.join(root_folder, folder)
+    sys.path.append(driver_folder)
+    spec = importlib.util.spec_from_file_location(name, os.path.join(driver_folder, file_name))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+# the same arguments start_kickr.sh passes to incline_and_resistance_control.py
+def kickr_args(args):
+    return Namespace(
+        mac_address=args.kickr_mac_address,
+        gatt_cache_file=args.gatt_cache_file,
+        broker_address=args.broker_address,
+        username=args.username,
+        password=args.password,
+        resistance_command_topic=f"bike/{args.device_id}/resistance/control",
+        resistance_report_topic=f"bike/{args.device_id}/resistance",
+        incline_command_topic=f"bike/{args.device_id}/incline/control",
+        incline_report_topic=f"bike/{args.device_id}/incline",
+        speed_report_topic=f"bike/{args.device_id}/speed",
+        cadence_report_topic=f"bike/{args.device_id}/cadence",
+        power_report_topic=f"bike/{args.device_id}/power",
+        publish_mode=args.publish_mode,
+        publish_window=args.publish_window,
+        payload_encoding=args.payload_encoding,
+        idle_limit=args.idle_limit,
+        publish_deadbands=args.publish_deadbands,
+        heartbeat_interval=args.heartbeat_interval
+    )
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import tempfile
+from argparse import Namespace
+from collections import namedtuple
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from lib import fake_gatt
+from lib.gatt_index import GattIndex
+from lib.compact_payload import create_payload_encoder
+from lib.constants import REPLAY_MAC_ADDRESS, REPLAY_DEVICE_ID, LATENCY_PERCENTILES, PUBLISH_MODE_IMMEDIATE, PUBLISH_WINDOW, PUBLISH_IDLE_LIMIT, PUBLISH_DEADBANDS, PUBLISH_HEARTBEAT_INTERVAL, PAYLOAD_ENCODING_JSON, FTMS_UUID, INDOOR_BIKE_DATA_UUID, FTMS_CONTROL_POINT_UUID, RESISTANCE_LEVEL_RANGE_UUID, INCLINATION_RANGE_UUID, DIS_UUID, FIRMWARE_REVISION_STRING_UUID, INCLINE_CONTROL_SERVICE_UUID, INCLINE_CONTROL_CHARACTERISTIC_UUID, HRS_UUID, HEART_RATE_MEASUREMENT_UUID, HEADWIND_ENABLE_SERVICE_UUID, HEADWIND_ENABLE_CHARACTERISTIC_UUID, HEADWIND_FAN_SERVICE_UUID, HEADWIND_FAN_CHARACTERISTIC_UUID, CSC_UUID, CSC_MEASUREMENT_UUID
+
+# a captured characteristic value: seconds since the start of the capture, the characteristic UUID and the raw bytes
+ReplayFrame = namedtuple('ReplayFrame', ['time', 'characteristic_uuid', 'value'])
+
+# the services each fake device resolves, and the characteristic a capture without UUIDs is replayed on
+REPLAY_PROFILES = {
+    'kickr': ({
+        FTMS_UUID: {
+            INDOOR_BIKE_DATA_UUID: None,
+            FTMS_CONTROL_POINT_UUID: None,
+            RESISTANCE_LEVEL_RANGE_UUID: bytes.fromhex('0000e8030a00'), # 0 to 100 in steps of 1 (resolution 0.1)
+            INCLINATION_RANGE_UUID: bytes.fromhex('9cffbe000500') # -10% to 19% in steps of 0.5%
+        },
+        DIS_UUID: {FIRMWARE_REVISION_STRING_UUID: b'replay'},
+        INCLINE_CONTROL_SERVICE_UUID: {INCLINE_CONTROL_CHARACTERISTIC_UUID: None}
+    }, INDOOR_BIKE_DATA_UUID),
+    'heartrate': ({
+        HRS_UUID: {HEART_RATE_MEASUREMENT_UUID: None}
+    }, HEART_RATE_MEASUREMENT_UUID),
+    'fan': ({
+        HEADWIND_ENABLE_SERVICE_UUID: {HEADWIND_ENABLE_CHARACTERISTIC_UUID: None},
+        HEADWIND_FAN_SERVICE_UUID: {HEADWIND_FAN_CHARACTERISTIC_UUID: None}
+    }, HEADWIND_FAN_CHARACTERISTIC_UUID),
+    'cadence': ({
+        CSC_UUID: {CSC_MEASUREMENT_UUID: None}
+    }, CSC_MEASUREMENT_UUID)
+}
+
+# read a capture file, one frame per line: "<seconds> <payload in hex>" or "<seconds> <characteristic uuid> <payload in hex>"
+# frames without a UUID are replayed on the default characteristic
+def load_capture(path, default_characteristic_uuid):
+    frames = []
+    with open(path, 'r') as capture_file:
+        for line in capture_file:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+
+            fields = line.split()
+            if len(fields) == 2:
+                frames.append(ReplayFrame(float(fields[0]), default_characteristic_uuid, bytes.fromhex(fields[1])))
+            elif len(fields) == 3:
+                frames.append(ReplayFrame(float(fields[0]), fields[1], bytes.fromhex(fields[2])))
+            else:
+                raise ValueError("invalid capture line", line)
+
+    return frames
+
+# a local stand-in for the MQTT client and publisher of a driver, it keeps what is published and when
+class LocalMQTTSink:
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.messages = []
+        self.retained = {}
+        self.message_callbacks = []
+        self.on_message = None
+        self.on_publish = None
+
+        # the time the current replayed frame was handed to the device, to measure the latency of each publish
+        self.frame_start = None
+        self.publish_latencies = []
+
+    def get_client(self):
+        return self
+
+    def setup_mqtt_client(self):
+        pass
+
+    def subscribe(self, topic_name):
+        pass
+
+    def add_message_callback(self, topic_name, callback):
+        self.message_callbacks.append((topic_name, callback))
+
+    def publish(self, topic_name, payload, retain=False):
+        self.messages.append((topic_name, payload))
+        if retain:
+            self.retained[topic_name] = payload
+        if self.frame_start is not None:
+            self.publish_latencies.append(self.clock() - self.frame_start)
+
+    def loop_start(self):
+        pass
+
+    def loop_stop(self):
+        pass
+
+# the value at the given percentile (nearest rank), None without values
+def percentile(sorted_values, percent):
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * percent // 100))
+    return sorted_values[int(rank) - 1]
+
+class ReplayResult:
+    def __init__(self, frame_count, skipped_count, elapsed, frame_latencies, publish_latencies, publish_count):
+        self.frame_count = frame_count
+        self.skipped_count = skipped_count
+        self.elapsed = elapsed
+        self.frame_latencies = frame_latencies
+        self.publish_latencies = publish_latencies
+        self.publish_count = publish_count
+
+    def frames_per_second(self):
+        return self.frame_count / self.elapsed if self.elapsed > 0 else None
+
+    # {50: seconds, 95: seconds, 99: seconds} of the given latencies
+    def latency_percentiles(self, latencies=None, percents=LATENCY_PERCENTILES):
+        latencies = sorted(self.frame_latencies if latencies is None else latencies)
+        return {percent: percentile(latencies, percent) for percent in percents}
+
+# streams captured frames into a connected (fake) device, at the captured pace multiplied by speed,
+# or as fast as possible when speed is 0
+class Replayer:
+    def __init__(self, device, frames, speed=1.0, sink=None, clock=time.perf_counter, sleep=time.sleep):
+        self.device = device
+        self.frames = frames
+        self.speed = speed
+        self.sink = sink
+        self.clock = clock
+        self.sleep = sleep
+
+    def run(self):
+        manager = self.device.manager
+        # let the device finish connecting (resolving services, enabling notifications) first
+        manager.run_pending()
+        gatt_index = GattIndex(self.device.services)
+        publish_count = len(self.sink.messages) if self.sink else 0
+
+        frame_latencies = []
+        skipped_count = 0
+        start = self.clock()
+        first_time = self.frames[0].time if self.frames else 0
+
+        for frame in self.frames:
+            if self.speed:
+                delay = start + (frame.time - first_time) / self.speed - self.clock()
+                if delay > 0:
+                    self.sleep(delay)
+
+            characteristic = gatt_index.find_characteristic(frame.characteristic_uuid)
+            if characteristic is None:
+                skipped_count += 1
+                continue
+
+            frame_start = self.clock()
+            if self.sink:
+                self.sink.frame_start = frame_start
+            self.device.characteristic_value_updated(characteristic, bytearray(frame.value))
+            manager.run_pending()
+            frame_latencies.append(self.clock() - frame_start)
+
+        elapsed = self.clock() - start
+        if self.sink:
+            self.sink.frame_start = None
+            publish_count = len(self.sink.messages) - publish_count
+
+        return ReplayResult(len(frame_latencies), skipped_count, elapsed, frame_latencies, self.sink.publish_latencies if self.sink else [], publish_count)
+
+# make "import gatt" return the fake module, this has to be done before a driver module is loaded
+def install_fake_gatt():
+    sys.modules['gatt'] = fake_gatt
+
+# create a driver's device connected to a fake device with the profile of the driver, publishing to the sink
+def create_replay_device(driver, sink, device_id=REPLAY_DEVICE_ID, mac_address=REPLAY_MAC_ADDRESS, gatt_cache_file=None, payload_encoding=PAYLOAD_ENCODING_JSON):
+    if driver not in REPLAY_PROFILES:
+        raise Exception("no replay profile for the driver", driver)
+
+    install_fake_gatt()
+    # imported here, lib.ble_hub imports gatt
+    from lib.ble_hub import load_driver, kickr_args
+
+    manager = fake_gatt.DeviceManager()
+    manager.add_device(mac_address, REPLAY_PROFILES[driver][0])
+
+    if driver == 'kickr':
+        wahoo_device = load_driver('wahoo_device', 'kickr_climb_and_smart_trainer', 'wahoo_device.py')
+        if gatt_cache_file is None:
+            gatt_cache_file = os.path.join(tempfile.mkdtemp(), 'gatt_attribute_cache.json')
+        args = kickr_args(Namespace(kickr_mac_address=mac_address, gatt_cache_file=gatt_cache_file, broker_address=None, username=None, password=None,
+            device_id=device_id, publish_mode=PUBLISH_MODE_IMMEDIATE, publish_window=PUBLISH_WINDOW, payload_encoding=payload_encoding,
+            idle_limit=PUBLISH_IDLE_LIMIT, publish_deadbands=PUBLISH_DEADBANDS, heartbeat_interval=PUBLISH_HEARTBEAT_INTERVAL))
+        device = wahoo_device.WahooDevice(mac_address=mac_address, manager=manager, args=args, mqtt_client=sink, publisher=sink,
+            command_scheduler=fake_gatt.ManagerScheduler(manager))
+        device.connect()
+        return device
+
+    folder, file_name = {'heartrate': ('heart_rate_sensor', 'heartrate.py'), 'fan': ('fan', 'fan.py'), 'cadence': ('cadence_sensor', 'cadence.py')}[driver]
+    module = load_driver(driver, folder, file_name)
+    module.setup(sink, sink, device_id, create_payload_encoder(payload_encoding, sink))
+    return module.connect_device(mac_address, manager)
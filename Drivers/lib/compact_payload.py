@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import math
+import struct
+import platform
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from lib.constants import PAYLOAD_ENCODING_JSON, PAYLOAD_ENCODING_COMPACT, PAYLOAD_ENCODINGS, COMPACT_FRAME_FORMAT, COMPACT_FRAME_MARKER, PAYLOAD_CHANNEL_IDS, PAYLOAD_DESCRIPTOR_TOPIC, PUBLISH_BATCH_TOPIC_SUFFIX
+
+COMPACT_FRAME = struct.Struct(COMPACT_FRAME_FORMAT)
+CHANNEL_NAMES = {channel_id: channel for channel, channel_id in PAYLOAD_CHANNEL_IDS.items()}
+
+# the channel of a topic like 'bike/000001/resistance/report' is 'resistance/report'
+def topic_channel(topic_name):
+    parts = topic_name.split('/', 2)
+    return parts[2] if len(parts) == 3 else None
+
+# the retained descriptor topic of a sample topic, e.g. 'bike/000001/speed' -> 'bike/000001/descriptor/speed'
+def descriptor_topic(topic_name):
+    prefix, _, channel = topic_name.partition('/')
+    device_id, _, channel = channel.partition('/')
+    return f"{prefix}/{device_id}/{PAYLOAD_DESCRIPTOR_TOPIC}/{channel}"
+
+# what a compact sample leaves out, published once per topic:
+# {"channel": "speed", "channelId": 1, "unitName": "m/s", "encoding": "compact", "format": "<BBdf", "metadata": {"deviceName": ...}}
+def descriptor_payload(topic_name, unit_name, device_name):
+    channel = topic_channel(topic_name)
+    return json.dumps({"channel": channel, "channelId": PAYLOAD_CHANNEL_IDS[channel], "unitName": unit_name, "encoding": PAYLOAD_ENCODING_COMPACT,
+        "format": COMPACT_FRAME_FORMAT, "metadata": { "deviceName": device_name } })
+
+def is_compact_payload(payload):
+    return isinstance(payload, (bytes, bytearray)) and len(payload) > 0 and payload[0] == COMPACT_FRAME_MARKER
+
+# the float32 values are rounded to the 7 significant digits they hold, so a speed of 5.2 isn't decoded as 5.199999809265137
+def float32_value(value):
+    return float('%.7g' % value)
+
+# the (channel, timestamp, value) of every frame of a compact payload, a batch is simply its frames back to back
+def decode_frames(payload):
+    if len(payload) % COMPACT_FRAME.size != 0:
+        raise ValueError("invalid compact payload length", len(payload))
+
+    frames = []
+    for marker, channel_id, timestamp, value in COMPACT_FRAME.iter_unpack(payload):
+        if marker != COMPACT_FRAME_MARKER:
+            raise ValueError("invalid compact frame marker", marker)
+        frames.append((CHANNEL_NAMES.get(channel_id), timestamp, float32_value(value)))
+
+    return frames
+
+# decode a sample payload of either encoding into the fields consumers read from the JSON one: {"value": 5.2, "timestamp": 1700000000.0, ...}
+# the unit and device name of a compact sample are in its descriptor, a plain number payload (e.g. a command) is returned as the number
+def decode_sample(payload):
+    if is_compact_payload(payload):
+        _, timestamp, value = decode_frames(payload)[-1]
+        return {"value": value, "timestamp": timestamp}
+
+    return json.loads(payload)
+
+# decode a batch frame of either encoding into {"speed": [{"value": ..., "timestamp": ...}, ...], ...}
+def decode_batch(payload):
+    if not is_compact_payload(payload):
+        return json.loads(payload)
+
+    samples_by_channel = {}
+    for channel, timestamp, value in decode_frames(payload):
+        samples_by_channel.setdefault(channel, []).append({"value": value, "timestamp": timestamp})
+    return samples_by_channel
+
+# the batch topic the samples of a topic are sent to in the batch publish mode, e.g. 'bike/000001/speed' -> 'bike/000001/batch'
+def batch_topic(topic_name):
+    return f"{topic_name.rpartition('/')[0]}/{PUBLISH_BATCH_TOPIC_SUFFIX}"
+
+# the (topic, sample) pairs of a message, a batch frame is split into the samples of its channel topics,
+# e.g. 'bike/000001/batch' -> [('bike/000001/speed', {...}), ('bike/000001/speed', {...}), ('bike/000001/power', {...})]
+# so a consumer subscribed to both a channel topic and its batch topic handles their samples the same way
+def decode_samples(topic_name, payload):
+    prefix, _, channel = topic_name.rpartition('/')
+    if channel != PUBLISH_BATCH_TOPIC_SUFFIX:
+        return [(topic_name, decode_sample(payload))]
+
+    return [(f"{prefix}/{batch_channel}", sample) for batch_channel, samples in decode_batch(payload).items() for sample in samples]
+
+# a number formatted the way json.dumps formats it, without going through the encoder for the ints and finite floats the drivers publish
+def json_number(value):
+    value_type = type(value)
+    if value_type is int:
+        return int.__repr__(value)
+    if value_type is float and math.isfinite(value):
+        return float.__repr__(value)
+    return json.dumps(value)
+
+# the JSON payloads the drivers have always published: {"value": 5.2, "unitName": "m/s", "timestamp": 1700000000.0, "metadata": {"deviceName": ...}}
+# everything but the value and the timestamp is the same for every sample of a unit, so that part is serialized once
+# and the two numbers are spliced in, which gives the same string as json.dumps in a fraction of the time
+class JSONPayloadEncoder:
+    encoding = PAYLOAD_ENCODING_JSON
+
+    def __init__(self, device_name=None):
+        self.metadata = { "deviceName": device_name if device_name is not None else platform.node() }
+        # unit name -> (the JSON between the value and the timestamp, the JSON after the timestamp)
+        self.templates = {}
+
+    def encode(self, topic_name, unit_name, value, timestamp):
+        template = self.templates.get(unit_name)
+        if template is None:
+            template = self.templates[unit_name] = self.build_template(unit_name)
+
+        return '{"value": ' + json_number(value) + template[0] + json_number(timestamp) + template[1]
+
+    def build_template(self, unit_name):
+        unit_and_timestamp = json.dumps({"unitName": unit_name, "timestamp": None})
+        metadata = json.dumps({"metadata": self.metadata})
+        return ', ' + unit_and_timestamp[1:-len('null}')], ', ' + metadata[1:]
+
+# 14 byte frames instead of ~110 bytes of JSON per sample, for metered uplinks
+# the first sample of a topic publishes its retained descriptor, topics without a channel id are still sent as JSON
+class CompactPayloadEncoder:
+    encoding = PAYLOAD_ENCODING_COMPACT
+
+    def __init__(self, mqtt_client, device_name=None):
+        self.mqtt_client = mqtt_client
+        self.json_encoder = JSONPayloadEncoder(device_name)
+        self.channel_ids = {}
+
+    def encode(self, topic_name, unit_name, value, timestamp):
+        if topic_name not in self.channel_ids:
+            self.channel_ids[topic_name] = self.describe(topic_name, unit_name)
+
+        channel_id = self.channel_ids[topic_name]
+        if channel_id is None:
+            return self.json_encoder.encode(topic_name, unit_name, value, timestamp)
+
+        return COMPACT_FRAME.pack(COMPACT_FRAME_MARKER, channel_id, timestamp, value)
+
+    # publish the descriptor of a topic, returns the channel id of the topic or None when it has none
+    def describe(self, topic_name, unit_name):
+        channel_id = PAYLOAD_CHANNEL_IDS.get(topic_channel(topic_name))
+        if channel_id is None:
+            return None
+
+        self.mqtt_client.publish(descriptor_topic(topic_name), descriptor_payload(topic_name, unit_name, self.json_encoder.metadata["deviceName"]), retain=True)
+        return channel_id
+
+# return the payload encoder of the given encoding, the compact one publishes its descriptors with the MQTT client
+def create_payload_encoder(encoding=PAYLOAD_ENCODING_JSON, mqtt_client=None):
+    if encoding not in PAYLOAD_ENCODINGS:
+        raise Exception("invalid payload encoding", encoding)
+
+    if encoding == PAYLOAD_ENCODING_COMPACT:
+        return CompactPayloadEncoder(mqtt_client)
+
+    return JSONPayloadEncoder()
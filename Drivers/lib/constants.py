@@ -48,6 +48,11 @@ HRS_UUID = 0x180D
 # Characteristics
 HEART_RATE_MEASUREMENT_UUID = 0X2A37
 
+# Cycling Speed and Cadence Service (CSC)
+CSC_UUID = 0x1816
+# Characteristics
+CSC_MEASUREMENT_UUID = 0X2A5B
+
 # Fitness Machine Control Point Op Codes (more details in https://www.bluetooth.com/specifications/specs/fitness-machine-service-1-0)
 FTMS_REQUEST_CONTROL = 0x00
 FTMS_RESET = 0x01
@@ -76,6 +81,12 @@ FTMS_RESPONSE_CODE = 0x80
 INCLINE_CONTROL_SERVICE_UUID = "a026ee0b0a7d4ab397faf1500f9feb8b"
 INCLINE_CONTROL_CHARACTERISTIC_UUID = "a026e0370a7d4ab397faf1500f9feb8b"
 
+# Headwind Fan's Custom Services and Characteristics (same Wahoo base UUID as the incline control ones)
+HEADWIND_ENABLE_SERVICE_UUID = "a026ee010a7d4ab397faf1500f9feb8b"
+HEADWIND_ENABLE_CHARACTERISTIC_UUID = "a026e0020a7d4ab397faf1500f9feb8b"
+HEADWIND_FAN_SERVICE_UUID = "a026ee0c0a7d4ab397faf1500f9feb8b"
+HEADWIND_FAN_CHARACTERISTIC_UUID = "a026e0380a7d4ab397faf1500f9feb8b"
+
 # Incline Control Op Values
 INCLINE_REQUEST_CONTROL = 0x67
 INCLINE_CONTROL_OP_CODE = 0x66
@@ -85,6 +96,7 @@ INCLINE_CONTROL_FLAT = 0x00 # '0x660000' is 0% incline
 INCLINE_CONTROL_MIN_PART_1 = 0x19 # '0x6619fc' is -10% incline
 INCLINE_CONTROL_MIN_PART_2 = 0xfc
 INCLINE_CONTROL_INCREMENT_UNIT = 50 # the incline value is up or down by 50 unit each time
+INCLINE_CONTROL_RESOLUTION = 0.5 # the incline can be set in 0.5% steps
 
 ##### Section 3: Wahoo Device Mac Addresses #####
 BIKE_01_KICKR_TRAINER_ADDRESS = "d9:07:e8:1c:db:94"
@@ -112,3 +124,124 @@ DEVICE_UNIT_NAMES = {
   "incline": "degree",
   "headWind": "percentage"
 }
+
+##### Section 5: MQTT Publishing #####
+# immediate: every sample is published straight away (the default)
+# batch: samples are collected for a short window and sent as one frame per bike to 'bike/{deviceId}/batch'
+#        the consumers subscribe to the batch topic next to the channel topics and split it with lib.compact_payload.decode_samples
+# latest: samples are collected for a short window and only the latest value per topic is published
+PUBLISH_MODE_IMMEDIATE = 'immediate'
+PUBLISH_MODE_BATCH = 'batch'
+PUBLISH_MODE_LATEST = 'latest'
+PUBLISH_MODES = (PUBLISH_MODE_IMMEDIATE, PUBLISH_MODE_BATCH, PUBLISH_MODE_LATEST)
+
+PUBLISH_WINDOW = 0.2 # seconds to collect samples before sending them in the batch/latest modes
+PUBLISH_MAX_SAMPLES_PER_TOPIC = 50 # older samples are dropped once a topic has this many pending samples
+PUBLISH_BATCH_TOPIC_SUFFIX = 'batch'
+PUBLISH_BUFFERED_CHANNELS = ('speed', 'cadence', 'power') # command reports are never held back
+
+# the publish filter of the sensor samples (lib.publish_filter), applied per topic before the payload is built
+PUBLISH_IDLE_LIMIT = 10 # zero samples in a row published on a topic before the next ones are suppressed, -1 publishes them all
+PUBLISH_DEADBANDS = {} # the smallest change published per channel, e.g. {'power': 5}, the channels without one publish every value
+PUBLISH_HEARTBEAT_INTERVAL = 4 # seconds, a suppressed sample is still published when its topic hasn't been published for this long, 0 disables it (at most PUBLISH_MAX_HEARTBEAT_INTERVAL)
+
+# AsyncMQTTClient settings
+ASYNC_MQTT_QUEUE_SIZE = 500 # outbound messages waiting to be published, publish() drops new messages when it is full
+ASYNC_MQTT_MAX_INFLIGHT = 20 # QoS 1 messages sent without a PUBACK yet
+ASYNC_MQTT_CONNECT_TIMEOUT = 10 # seconds to wait for the CONNACK
+ASYNC_MQTT_RECONNECT_MIN_DELAY = 1 # seconds
+ASYNC_MQTT_RECONNECT_MAX_DELAY = 60 # seconds
+
+##### Section 6: BLE Command Queue #####
+GATT_COMMAND_TIMEOUT = 2.0 # seconds to wait for a write/enable notifications callback before retrying the command
+GATT_COMMAND_RETRIES = 2 # how many times a timed out or failed command is sent again before giving up
+BLE_RECONNECT_DELAY = 5 # seconds to wait before connecting to the Kickr again after its connection failed
+
+##### Section 7: GATT Attribute Cache #####
+GATT_ATTRIBUTE_CACHE_FILE = '~/.iot_gatt_attribute_cache.json' # the characteristic values read on the first connection to each device
+
+##### Section 8: MQTT Multiplexer #####
+MQTT_MUX_SOCKET_PATH = '/tmp/iot_mqtt_mux.sock' # the Unix socket of the local service that shares one HiveMQ connection between the drivers
+MQTT_MUX_SOCKET_ENV = 'MQTT_MUX_SOCKET' # the drivers use the multiplexer when this environment variable is set to its socket path
+
+##### Section 9: Workouts #####
+DISTANCE_LOG_BUFFER_ROWS = 60 # speed samples kept in memory before they are appended to the optional CSV log
+WORKOUT_TARGETS = ('resistance', 'incline') # the trainer setpoints a workout schedule can set
+WORKOUT_TARGET_RANGES = {'resistance': (RESISTANCE_MIN, RESISTANCE_MAX), 'incline': (INCLINE_MIN, INCLINE_MAX)}
+WORKOUT_TARGET_RESOLUTION = 1 # the resistance and incline command topics only accept whole numbers
+STATS_RING_BUFFER_SIZE = 4096 # raw samples kept per metric by StreamingStats, the summaries cover every sample
+
+##### Section 10: Ride Analytics #####
+ANALYTICS_SAMPLE_PERIOD = 1.0 # seconds between the points of the uniform timeline the power samples are resampled onto
+ANALYTICS_MAX_SAMPLE_GAP = 5.0 # seconds a power sample is held for, longer gaps in the MQTT samples count as 0 W
+PUBLISH_MAX_HEARTBEAT_INTERVAL = ANALYTICS_MAX_SAMPLE_GAP - ANALYTICS_SAMPLE_PERIOD # the heartbeat is sent with the first sample after it is due, which has to be within the held gap
+BEST_POWER_DURATIONS = (5, 60, 300, 1200) # seconds, the rolling best power reported after a ride
+NORMALIZED_POWER_WINDOW = 30 # seconds, the rolling average used for Normalized Power
+FTP_TEST_DURATION = 1200 # seconds, FTP is estimated from the best 20 minute power
+FTP_FACTOR = 0.95
+SESSION_CHANNELS = ('speed', 'cadence', 'power', 'heartrate') # the MQTT report channels a ride session is made of
+POWER_CURVE_DURATIONS = (1, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600) # seconds
+POWER_ZONE_EDGES = (0.55, 0.75, 0.90, 1.05, 1.20, 1.50) # fractions of FTP that separate the 7 power zones
+HEART_RATE_ZONE_EDGES = (0.60, 0.70, 0.80, 0.90) # fractions of the maximum heart rate that separate the 5 heart rate zones
+CADENCE_HISTOGRAM_EDGES = (1, 40, 50, 60, 70, 80, 90, 100, 110, 120, 250) # rpm, cadence below the first edge is coasting
+
+##### Section 11: Session Recording #####
+SESSION_FILE_MAGIC = b'IOTRIDE1' # the header of a session file, followed by fixed-width records
+SESSION_RECORD_FORMAT = '<dIf' # timestamp (float64 seconds), channel id (uint32), value (float32): 16 bytes per sample
+SESSION_CHANNEL_IDS = {'speed': 1, 'cadence': 2, 'power': 3, 'heartrate': 4, 'resistance': 5, 'incline': 6, 'fan': 7, 'resistance/control': 8, 'incline/control': 9} # the channels of the driver topics, e.g. the Kickr reports on 'bike/{deviceId}/resistance'
+SESSION_BUFFER_RECORDS = 64 # records kept in memory before they are appended to the file
+SESSION_FSYNC_INTERVAL = 10 # seconds between fsyncs of the session file, a crash loses at most this much of the ride
+SESSION_FOLDER = '~/sessions'
+
+##### Section 12: BLE Replay #####
+REPLAY_MAC_ADDRESS = '00:00:00:00:00:01' # the address of the fake device the captured frames are replayed through
+REPLAY_DEVICE_ID = 'replay' # the bike id in the topics published during a replay
+LATENCY_PERCENTILES = (50, 95, 99)
+
+##### Section 13: Latency Tracing #####
+# the stages are timed only when tracing is enabled, a disabled tracer costs one attribute check per stage
+LATENCY_TRACE_ENV = 'LATENCY_TRACE' # tracing is enabled at startup when this environment variable is set to 1
+LATENCY_HISTOGRAM_MIN = 1e-5 # seconds, the lower edge of the first histogram bucket (anything faster is counted in it)
+LATENCY_HISTOGRAM_DECADES = 7 # the buckets cover 10 us to 100 s
+LATENCY_HISTOGRAM_BUCKETS_PER_DECADE = 20 # a percentile is reported within about 12% of the actual latency
+LATENCY_MAX_PENDING_PUBLISHES = 1000 # published samples waiting for a PUBACK, the oldest are forgotten beyond this
+LATENCY_REPORT_INTERVAL = 60 # seconds between latency reports
+LATENCY_REPORT_FILE = '/tmp/iot_latency_report.json'
+LATENCY_REPORT_TOPIC_SUFFIX = 'latency' # the reports are published to 'bike/{deviceId}/latency'
+
+##### Section 14: Logging #####
+LOG_LEVEL_ENV = 'LOG_LEVEL' # the level of every category, INFO by default
+LOG_LEVELS_ENV = 'LOG_LEVELS' # per-category levels, e.g. 'kickr=DEBUG,mqtt=WARNING'
+LOG_FORMAT = '%(levelname)s [%(name)s] %(message)s' # journald adds the time already
+LOG_RATE_LIMIT = 5 # messages of a rate-limited kind logged per window, the rest are counted and reported with the next one logged
+LOG_RATE_WINDOW = 10 # seconds
+LOG_SUMMARY_INTERVAL = 60 # seconds between the counter summaries of a category
+
+##### Section 15: Payload Encoding #####
+# json: every sample is a JSON object with its unit and the device name (the default)
+# compact: every sample is a small binary frame, the unit and the device name are published once per topic to a retained descriptor topic
+PAYLOAD_ENCODING_JSON = 'json'
+PAYLOAD_ENCODING_COMPACT = 'compact'
+PAYLOAD_ENCODINGS = (PAYLOAD_ENCODING_JSON, PAYLOAD_ENCODING_COMPACT)
+
+COMPACT_FRAME_FORMAT = '<BBdf' # marker, channel id, timestamp (float64 seconds), value (float32): 14 bytes per sample
+COMPACT_FRAME_MARKER = 0xC1 # never the first byte of UTF-8 text, so a compact frame can't be mistaken for a JSON or plain number payload
+PAYLOAD_CHANNEL_IDS = SESSION_CHANNEL_IDS # the channel ids of the session files, topics of other channels are still sent as JSON
+PAYLOAD_DESCRIPTOR_TOPIC = 'descriptor' # the descriptors are retained on 'bike/{deviceId}/descriptor/{channel}'
+
+##### Section 16: Heart Rate Variability #####
+RR_INTERVAL_RESOLUTION = 1024 # the RR intervals of a Heart Rate Measurement are in 1/1024 seconds
+HRV_WINDOW = 60 # seconds of beats the RMSSD, SDNN and pNN50 are computed over
+HRV_MIN_RR_INTERVAL = 0.25 # seconds, shorter intervals (over 240 BPM) are artifacts and are skipped
+HRV_MAX_RR_INTERVAL = 2.0 # seconds, longer intervals (under 30 BPM) are missed beats and are skipped
+HRV_NN50_THRESHOLD = 0.05 # seconds, the successive difference counted by pNN50
+HRV_PUBLISH_INTERVAL = 5 # seconds between the batches of RR intervals and the HRV reports
+RR_INTERVALS_TOPIC_SUFFIX = 'rr' # the RR interval batches are published to 'bike/{deviceId}/rr'
+HRV_TOPIC_SUFFIX = 'hrv' # the HRV reports are published to 'bike/{deviceId}/hrv'
+
+##### Section 17: Cycling Speed and Cadence #####
+CSC_EVENT_TIME_RESOLUTION = 1024 # the last wheel and crank event times are in 1/1024 seconds, as uint16 that rolls over every 64 seconds
+CSC_SMOOTHING_EVENTS = 4 # the cadence is the revolutions over the event time of the last few crank events
+CSC_STOP_TIMEOUT = 3 # seconds without a new crank event before the cadence drops to 0
+CSC_MAX_CADENCE = 250 # rpm, faster revolution rates are glitches (e.g. a sensor reset) and restart the smoothing
+CSC_WHEEL_CIRCUMFERENCE = 2.105 # meters, a 700x25c tyre
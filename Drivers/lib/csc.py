@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+from array import array
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from lib.constants import CSC_EVENT_TIME_RESOLUTION, CSC_SMOOTHING_EVENTS, CSC_STOP_TIMEOUT, CSC_MAX_CADENCE, CSC_WHEEL_CIRCUMFERENCE
+
+EVENT_TIME_MASK = 0xFFFF
+CRANK_REVOLUTIONS_MASK = 0xFFFF
+WHEEL_REVOLUTIONS_MASK = 0xFFFFFFFF
+
+# the revolutions per second of a crank or a wheel from the cumulative revolutions and the last event time of a CSC sensor
+# the differences are taken modulo the field sizes, so the counters rolling over don't matter,
+# and the rate is the revolutions over the event time of the last few events (a fixed ring of deltas with running sums)
+class RevolutionRate:
+    __slots__ = ('revolutions_mask', 'max_rate', 'stop_timeout', 'revolution_deltas', 'time_deltas', 'next_index', 'revolutions_sum', 'time_sum',
+        'previous_revolutions', 'previous_event_time', 'last_event_timestamp')
+
+    def __init__(self, revolutions_mask, max_rate, smoothing_events=CSC_SMOOTHING_EVENTS, stop_timeout=CSC_STOP_TIMEOUT):
+        self.revolutions_mask = revolutions_mask
+        self.max_rate = max_rate
+        self.stop_timeout = stop_timeout
+        self.revolution_deltas = array('L', [0]) * smoothing_events
+        self.time_deltas = array('L', [0]) * smoothing_events
+        self.previous_revolutions = None
+        self.previous_event_time = None
+        self.last_event_timestamp = None
+        self.reset()
+
+    def reset(self):
+        for index in range(len(self.time_deltas)):
+            self.revolution_deltas[index] = 0
+            self.time_deltas[index] = 0
+        self.next_index = 0
+        self.revolutions_sum = 0
+        self.time_sum = 0
+
+    # add a measurement received at timestamp (seconds), returns the revolutions per second or None until there is one
+    def update(self, revolutions, event_time, timestamp):
+        if self.previous_revolutions is None:
+            self.previous_revolutions = revolutions
+            self.previous_event_time = event_time
+            self.last_event_timestamp = timestamp
+            return None
+
+        revolutions_delta = (revolutions - self.previous_revolutions) & self.revolutions_mask
+        time_delta = (event_time - self.previous_event_time) & EVENT_TIME_MASK
+        self.previous_revolutions = revolutions
+        self.previous_event_time = event_time
+
+        # the sensor repeats its last event until the next revolution
+        if time_delta == 0:
+            if timestamp - self.last_event_timestamp >= self.stop_timeout:
+                self.reset()
+                return 0.0
+            return self.rate()
+
+        self.last_event_timestamp = timestamp
+
+        # the first revolution after a stop (or a glitch) only restarts the smoothing, its delta covers the whole pause
+        if time_delta > self.stop_timeout * CSC_EVENT_TIME_RESOLUTION or revolutions_delta * CSC_EVENT_TIME_RESOLUTION > self.max_rate * time_delta:
+            self.reset()
+            return 0.0 if revolutions_delta == 0 else None
+
+        self.revolutions_sum += revolutions_delta - self.revolution_deltas[self.next_index]
+        self.time_sum += time_delta - self.time_deltas[self.next_index]
+        self.revolution_deltas[self.next_index] = revolutions_delta
+        self.time_deltas[self.next_index] = time_delta
+        self.next_index = (self.next_index + 1) % len(self.time_deltas)
+        return self.rate()
+
+    def rate(self):
+        if self.time_sum == 0:
+            return None
+        return self.revolutions_sum * CSC_EVENT_TIME_RESOLUTION / self.time_sum
+
+# the cadence (rpm) and the wheel speed (m/s) of CSC Measurements (lib.ble_helper.decode_csc_measurement)
+class CSCCalculator:
+    def __init__(self, wheel_circumference=CSC_WHEEL_CIRCUMFERENCE, smoothing_events=CSC_SMOOTHING_EVENTS, stop_timeout=CSC_STOP_TIMEOUT):
+        self.wheel_circumference = wheel_circumference
+        self.crank = RevolutionRate(CRANK_REVOLUTIONS_MASK, CSC_MAX_CADENCE / 60.0, smoothing_events, stop_timeout)
+        # up to about 35 m/s with a 2.1 m wheel
+        self.wheel = RevolutionRate(WHEEL_REVOLUTIONS_MASK, 4 * CSC_MAX_CADENCE / 60.0, smoothing_events, stop_timeout)
+
+    # returns (cadence, speed), either is None when the measurement doesn't have its data or there isn't a rate yet
+    def update(self, measurement, timestamp):
+        cadence = None
+        speed = None
+
+        if measurement.crank_revolutions is not None:
+            rate = self.crank.update(measurement.crank_revolutions, measurement.last_crank_event_time, timestamp)
+            cadence = rate * 60.0 if rate is not None else None
+
+        if measurement.wheel_revolutions is not None:
+            rate = self.wheel.update(measurement.wheel_revolutions, measurement.last_wheel_event_time, timestamp)
+            speed = rate * self.wheel_circumference if rate is not None else None
+
+        return cadence, speed
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import csv
+import time
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from lib.compact_payload import decode_sample, decode_samples
+from lib.constants import DISTANCE_LOG_BUFFER_ROWS
+
+# keep a running distance from the speed samples of a workout, updated in O(1) per sample with the trapezoidal rule
+# the distance is the speed integrated over time in hours, the same units the CSV based calculation used (e.g. km/h -> km)
+# the samples can optionally be logged to a CSV file, they are buffered and appended every buffer_rows samples
+class DistanceAccumulator:
+    def __init__(self, log_file=None, buffer_rows=DISTANCE_LOG_BUFFER_ROWS):
+        self.distance = 0.0
+        self.sample_count = 0
+        self.last_time = None
+        self.last_speed = None
+
+        self.log_file = log_file
+        self.buffer_rows = buffer_rows
+        self.log_rows = []
+
+    # add a speed sample, timestamp is in seconds (the time of the sample in the MQTT payload, or now)
+    def add_sample(self, speed, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+
+        speed = float(speed)
+        if self.last_time is not None:
+            time_difference = timestamp - self.last_time
+            if time_difference <= 0:
+                # a late or duplicated sample, the distance up to last_time is already counted
+                return
+            self.distance += (self.last_speed + speed) / 2 * (time_difference / 3600)
+
+        self.last_time = timestamp
+        self.last_speed = speed
+        self.sample_count += 1
+
+        if self.log_file is not None:
+            self.log_rows.append((timestamp, speed))
+            if len(self.log_rows) >= self.buffer_rows:
+                self.flush()
+
+    def get_distance(self):
+        return self.distance
+
+    # append the buffered samples to the CSV log
+    def flush(self):
+        if not self.log_rows:
+            return
+
+        with open(self.log_file, 'a', newline='') as csvfile:
+            csv.writer(csvfile).writerows(self.log_rows)
+        self.log_rows = []
+
+    def close(self):
+        if self.log_file is not None:
+            self.flush()
+
+# read the speed and timestamp of a sample payload like the Kickr driver publishes: {"value": 5.2, "timestamp": 1700000000.0, ...}
+# or a compact frame (lib.compact_payload), the time of receipt is used when the payload has no timestamp
+def parse_speed_payload(payload):
+    dict_of_payload = decode_sample(payload)
+    return float(dict_of_payload["value"]), dict_of_payload.get("timestamp", time.time())
+
+# the (speed, timestamp) of every speed sample of a message, a batch frame ('bike/000001/batch') can hold several of them
+def parse_speed_samples(topic_name, payload):
+    return [(float(sample["value"]), sample.get("timestamp", time.time())) for topic, sample in decode_samples(topic_name, payload) if topic.endswith('/speed')]
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import logging
+import threading
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from lib.constants import LOG_LEVEL_ENV, LOG_LEVELS_ENV, LOG_FORMAT, LOG_RATE_LIMIT, LOG_RATE_WINDOW, LOG_SUMMARY_INTERVAL
+
+LOGGER_PREFIX = 'iot'
+
+# per-category levels from a string like 'kickr=DEBUG,mqtt=WARNING'
+def parse_levels(levels):
+    parsed = {}
+    for entry in (levels or '').split(','):
+        category, separator, level = entry.strip().partition('=')
+        if separator:
+            parsed[category.strip()] = level.strip().upper()
+    return parsed
+
+# log to stdout once (journald keeps it with StandardOutput=journal), with the levels from the environment
+def configure_logging(stream=None):
+    root_logger = logging.getLogger(LOGGER_PREFIX)
+    if root_logger.handlers:
+        return root_logger
+
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    root_logger.addHandler(handler)
+    root_logger.propagate = False
+    root_logger.setLevel(os.getenv(LOG_LEVEL_ENV, 'INFO').upper())
+
+    for category, level in parse_levels(os.getenv(LOG_LEVELS_ENV)).items():
+        logging.getLogger(f"{LOGGER_PREFIX}.{category}").setLevel(level)
+
+    return root_logger
+
+# a logger for a category of messages (e.g. 'kickr', 'mqtt') for the hot callbacks of the drivers:
+# - the level is checked before a message is formatted, so disabled messages cost almost nothing
+# - per-frame messages can be sampled (1 in N) or rate limited (N per window, the number suppressed is reported with the next one)
+# - events can be counted instead of logged, the counters are logged as one summary line every summary_interval seconds
+class DriverLogger:
+    def __init__(self, category, rate_limit=LOG_RATE_LIMIT, rate_window=LOG_RATE_WINDOW, summary_interval=LOG_SUMMARY_INTERVAL, clock=time.monotonic):
+        self.logger = logging.getLogger(f"{LOGGER_PREFIX}.{category}")
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.summary_interval = summary_interval
+        self.clock = clock
+        self.lock = threading.Lock()
+
+        self.sample_counts = {}
+        # key: [window start, logged in the window, suppressed since the last one logged]
+        self.rates = {}
+        self.counters = {}
+        self.last_summary = clock()
+
+    def is_enabled_for(self, level):
+        return self.logger.isEnabledFor(level)
+
+    def log(self, level, message, *args):
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, message, *args)
+
+    def debug(self, message, *args):
+        self.log(logging.DEBUG, message, *args)
+
+    def info(self, message, *args):
+        self.log(logging.INFO, message, *args)
+
+    def warning(self, message, *args):
+        self.log(logging.WARNING, message, *args)
+
+    def error(self, message, *args):
+        self.log(logging.ERROR, message, *args)
+
+    # log only every n-th message of a kind, starting with the first one
+    def sampled(self, level, key, every, message, *args):
+        if not self.logger.isEnabledFor(level):
+            return
+
+        with self.lock:
+            count = self.sample_counts.get(key, 0)
+            self.sample_counts[key] = count + 1
+        if count % every == 0:
+            self.logger.log(level, message + " (1 of every %d)", *args, every)
+
+    # log at most rate_limit messages of a kind per rate_window seconds
+    def limited(self, level, key, message, *args):
+        if not self.logger.isEnabledFor(level):
+            return
+
+        now = self.clock()
+        with self.lock:
+            rate = self.rates.get(key)
+            if rate is None or now - rate[0] >= self.rate_window:
+                suppressed = rate[2] if rate is not None else 0
+                rate = self.rates[key] = [now, 0, suppressed]
+            if rate[1] >= self.rate_limit:
+                rate[2] += 1
+                return
+            rate[1] += 1
+            suppressed = rate[2]
+            rate[2] = 0
+
+        if suppressed:
+            self.logger.log(level, message + " (%d similar messages suppressed)", *args, suppressed)
+        else:
+            self.logger.log(level, message, *args)
+
+    # count an event instead of logging it, the counters are logged every summary_interval seconds
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+        if self.clock() - self.last_summary >= self.summary_interval:
+            self.log_summary()
+
+    # log the counters since the last summary and reset them
+    def log_summary(self):
+        with self.lock:
+            counters = self.counters
+            self.counters = {}
+            elapsed = self.clock() - self.last_summary
+            self.last_summary = self.clock()
+
+        if counters and self.logger.isEnabledFor(logging.INFO):
+            self.logger.info("%s in the last %.0f seconds", ', '.join(f"{name}={value}" for name, value in counters.items()), elapsed)
+
+loggers = {}
+loggers_lock = threading.Lock()
+
+# the logger of a category, shared by every module that uses the category
+def get_logger(category):
+    with loggers_lock:
+        logger = loggers.get(category)
+        if logger is None:
+            configure_logging()
+            logger = loggers[category] = DriverLogger(category)
+        return logger
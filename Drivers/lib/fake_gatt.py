@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+from collections import deque
+
+# a stand-in for the parts of the gatt-python module the drivers use, so a driver class (a gatt.Device subclass) can run without BlueZ
+# the callbacks a real device would get from the GLib main loop are queued on the manager and run by run() or run_pending()
+
+# the full lowercase UUID string gatt-python reports, from a 16-bit number or a custom 128-bit UUID
+def format_uuid(uuid):
+    if isinstance(uuid, int):
+        return f"{uuid:08x}-0000-1000-8000-00805f9b34fb"
+
+    value = uuid.replace('-', '').lower()
+    return f"{value[0:8]}-{value[8:12]}-{value[12:16]}-{value[16:20]}-{value[20:32]}"
+
+class DeviceManager:
+    def __init__(self, adapter_name=None):
+        self.adapter_name = adapter_name
+        self.events = deque()
+        self.discovering = False
+        self.known_devices = {}
+
+    # the services a fake device resolves once it is connected: {service uuid: {characteristic uuid: value}}
+    def add_device(self, mac_address, services, alias=None):
+        self.known_devices[mac_address.lower()] = (alias, services)
+
+    def call_soon(self, callback, *args):
+        self.events.append((callback, args))
+
+    # run the queued callbacks, including the ones they queue
+    def run_pending(self):
+        while self.events:
+            callback, args = self.events.popleft()
+            callback(*args)
+
+    def run(self):
+        self.run_pending()
+
+    def stop(self):
+        self.events.clear()
+
+    def start_discovery(self, service_uuids=None):
+        self.discovering = True
+
+    def stop_discovery(self):
+        self.discovering = False
+
+# a GattCommandQueue scheduler that runs the queued commands from the manager's event queue, timeouts never fire
+class ManagerScheduler:
+    def __init__(self, manager):
+        self.manager = manager
+
+    def call_soon(self, callback):
+        self.manager.call_soon(callback)
+
+    def call_later(self, delay, callback):
+        return None
+
+    def cancel(self, handle):
+        pass
+
+class Service:
+    def __init__(self, device, uuid):
+        self.device = device
+        self.uuid = format_uuid(uuid)
+        self.characteristics = []
+
+# writes and notification changes always succeed, the callbacks come from the manager's event queue like they would from BlueZ
+class Characteristic:
+    def __init__(self, service, uuid, value=None):
+        self.service = service
+        self.uuid = format_uuid(uuid)
+        self.value = value
+        self.notifying = False
+        self.written = []
+
+    def read_value(self, offset=0):
+        return bytearray(self.value[offset:]) if self.value is not None else None
+
+    def write_value(self, value, offset=0):
+        self.written.append(bytes(value))
+        device = self.service.device
+        device.manager.call_soon(device.characteristic_write_value_succeeded, self)
+
+    def enable_notifications(self, enabled=True):
+        self.notifying = enabled
+        device = self.service.device
+        device.manager.call_soon(device.characteristic_enable_notifications_succeeded, self)
+
+class Device:
+    def __init__(self, mac_address, manager, managed=True):
+        self.mac_address = mac_address
+        self.manager = manager
+        self.services = []
+        self.connected = False
+
+    def alias(self):
+        return self.manager.known_devices.get(self.mac_address.lower(), (None, {}))[0]
+
+    def is_connected(self):
+        return self.connected
+
+    def connect(self):
+        self.manager.call_soon(self.connect_succeeded)
+        self.manager.call_soon(self.resolve_services)
+
+    def disconnect(self):
+        self.manager.call_soon(self.disconnect_succeeded)
+
+    def resolve_services(self):
+        _, services = self.manager.known_devices.get(self.mac_address.lower(), (None, {}))
+        self.services = []
+        for service_uuid, characteristics in services.items():
+            service = Service(self, service_uuid)
+            service.characteristics = [Characteristic(service, uuid, value) for uuid, value in characteristics.items()]
+            self.services.append(service)
+        self.services_resolved()
+
+    def connect_succeeded(self):
+        self.connected = True
+
+    def connect_failed(self, error):
+        self.connected = False
+
+    def disconnect_succeeded(self):
+        self.connected = False
+
+    def services_resolved(self):
+        pass
+
+    def characteristic_value_updated(self, characteristic, value):
+        pass
+
+    def characteristic_write_value_succeeded(self, characteristic):
+        pass
+
+    def characteristic_write_value_failed(self, characteristic, error):
+        pass
+
+    def characteristic_enable_notifications_succeeded(self, characteristic):
+        pass
+
+    def characteristic_enable_notifications_failed(self, characteristic, error):
+        pass
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+from array import array
+from itertools import accumulate
+from operator import sub
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from lib.constants import ANALYTICS_SAMPLE_PERIOD, ANALYTICS_MAX_SAMPLE_GAP, BEST_POWER_DURATIONS, NORMALIZED_POWER_WINDOW, FTP_TEST_DURATION, FTP_FACTOR
+
+# resamples the irregular power samples received over MQTT onto a uniform timeline while they arrive,
+# each point holds the latest sample at that time, or 0 W if the latest sample is older than max_gap (e.g. the trainer dropped out)
+class PowerResampler:
+    def __init__(self, period=ANALYTICS_SAMPLE_PERIOD, max_gap=ANALYTICS_MAX_SAMPLE_GAP):
+        self.period = period
+        self.max_gap = max_gap
+        self.series = array('f')
+        self.start_time = None
+        self.last_time = None
+        self.last_value = 0.0
+
+    # fill the timeline points before the given time with the held value
+    def fill_until(self, timestamp, inclusive=False):
+        while True:
+            point_time = self.start_time + len(self.series) * self.period
+            if point_time > timestamp or (point_time == timestamp and not inclusive):
+                return
+            self.series.append(self.last_value if point_time - self.last_time <= self.max_gap else 0.0)
+
+    # late samples are ignored, they have been covered by the held value already
+    def add(self, timestamp, value):
+        if self.start_time is None:
+            self.start_time = timestamp
+        elif timestamp < self.last_time:
+            return
+        else:
+            self.fill_until(timestamp)
+
+        self.last_time = timestamp
+        self.last_value = float(value)
+
+    # the uniform timeline up to the latest sample
+    def get_series(self):
+        if self.start_time is not None:
+            self.fill_until(self.last_time, inclusive=True)
+        return self.series
+
+# resample a list of (timestamp, power) samples onto a uniform timeline
+def resample(samples, period=ANALYTICS_SAMPLE_PERIOD, max_gap=ANALYTICS_MAX_SAMPLE_GAP):
+    resampler = PowerResampler(period, max_gap)
+    for timestamp, value in sorted(samples):
+        resampler.add(timestamp, value)
+    return resampler.get_series()
+
+# the sum of every window of the series with the given length, computed from the prefix sums
+def window_sums(prefix_sums, length):
+    return map(sub, prefix_sums[length:], prefix_sums[:-length])
+
+# the best average power over each duration (in seconds), None for durations longer than the ride
+# the prefix sums are built once and shared by every duration, so each duration costs one pass over the timeline
+def rolling_best(series, durations=BEST_POWER_DURATIONS, period=ANALYTICS_SAMPLE_PERIOD):
+    prefix_sums = list(accumulate(series, initial=0.0))
+    best = {}
+    for duration in durations:
+        length = max(1, round(duration / period))
+        best[duration] = max(window_sums(prefix_sums, length)) / length if length <= len(series) else None
+    return best
+
+# Normalized Power: the 4th root of the mean of the 4th power of the 30 second rolling average
+def normalized_power(series, period=ANALYTICS_SAMPLE_PERIOD, window=NORMALIZED_POWER_WINDOW):
+    if not series:
+        return 0.0
+
+    length = max(1, round(window / period))
+    if length > len(series):
+        return sum(series) / len(series)
+
+    prefix_sums = list(accumulate(series, initial=0.0))
+    rolling_averages = [window_sum / length for window_sum in window_sums(prefix_sums, length)]
+    return (sum(average ** 4 for average in rolling_averages) / len(rolling_averages)) ** 0.25
+
+def intensity_factor(np, ftp):
+    return np / ftp
+
+# Training Stress Score: 100 is one hour at FTP
+def training_stress_score(duration, np, ftp):
+    return duration * np * intensity_factor(np, ftp) / (ftp * 3600) * 100
+
+# FTP is 95% of the best 20 minute power, the best power over the whole ride is used for a shorter test
+def estimate_ftp(series, period=ANALYTICS_SAMPLE_PERIOD, test_duration=FTP_TEST_DURATION):
+    if not series:
+        return 0.0
+
+    duration = min(test_duration, len(series) * period)
+    return rolling_best(series, (duration,), period)[duration] * FTP_FACTOR
+
+# a summary of the power of a ride, IF and TSS need the rider's FTP
+def analyze_power(series, ftp=None, period=ANALYTICS_SAMPLE_PERIOD):
+    duration = len(series) * period
+    np = normalized_power(series, period)
+    summary = {
+        "duration": duration,
+        "averagePower": sum(series) / len(series) if series else 0.0,
+        "normalizedPower": np,
+        "bestPower": rolling_best(series, period=period),
+        "estimatedFtp": estimate_ftp(series, period)
+    }
+
+    if ftp:
+        summary["intensityFactor"] = intensity_factor(np, ftp)
+        summary["trainingStressScore"] = training_stress_score(duration, np, ftp)
+
+    return summary
@@ -0,0 +1,92 @@
+import os
+import sys
+import json
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from lib.constants import GATT_ATTRIBUTE_CACHE_FILE
+
+# the UUIDs of the resolved services and their characteristics, used to check a cached table still matches the device
+def get_attribute_layout(services):
+    return {service.uuid.lower(): sorted(characteristic.uuid.lower() for characteristic in service.characteristics) for service in services}
+
+# read every characteristic value of the resolved services, values are stored as hex strings (None if it can't be read)
+def read_attribute_table(services):
+    attribute_table = {}
+    for service in services:
+        values = attribute_table[service.uuid.lower()] = {}
+        for characteristic in service.characteristics:
+            value = characteristic.read_value()
+            values[characteristic.uuid.lower()] = bytes(value).hex() if value is not None else None
+
+    return attribute_table
+
+# a small local file that keeps the attribute table of each device, keyed by its MAC address and firmware revision,
+# so a reconnect doesn't have to read every characteristic again before the notifications can be enabled
+# without a firmware revision (no or an unreadable Device Information Service) a firmware update can't be noticed, so nothing is cached
+class GattAttributeCache:
+    def __init__(self, path=GATT_ATTRIBUTE_CACHE_FILE):
+        self.path = os.path.expanduser(path)
+        self.entries = self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        # write to a temporary file first so an interrupted write never leaves a broken cache behind
+        temporary_path = self.path + '.tmp'
+        try:
+            with open(temporary_path, 'w') as cache_file:
+                json.dump(self.entries, cache_file)
+            os.replace(temporary_path, self.path)
+        except OSError as error:
+            print(f"Cannot save the GATT attribute cache to {self.path}: {str(error)}")
+
+    # return the cached attribute table, or None if there isn't one for this MAC address, firmware revision and set of attributes
+    def get(self, mac_address, firmware_revision, services):
+        if not firmware_revision:
+            return None
+
+        entry = self.entries.get(mac_address.lower())
+        if entry is None or entry['firmware_revision'] != firmware_revision:
+            return None
+
+        attribute_table = entry['attributes']
+        if {service_uuid: sorted(values) for service_uuid, values in attribute_table.items()} != get_attribute_layout(services):
+            return None
+
+        return attribute_table
+
+    def put(self, mac_address, firmware_revision, attribute_table):
+        if not firmware_revision:
+            return
+
+        self.entries[mac_address.lower()] = {'firmware_revision': firmware_revision, 'attributes': attribute_table}
+        self.save()
+
+    # return the cached attribute table if it is still valid, otherwise read it from the device and cache it
+    def get_or_read(self, mac_address, firmware_revision, services):
+        attribute_table = self.get(mac_address, firmware_revision, services)
+        if attribute_table is not None:
+            return attribute_table, True
+
+        attribute_table = read_attribute_table(services)
+        self.put(mac_address, firmware_revision, attribute_table)
+        return attribute_table, False
+
+# look up a cached characteristic value as a list of ints, like decode_int_bytes returns
+def get_cached_value(attribute_table, characteristic):
+    if characteristic is None:
+        return None
+
+    for values in attribute_table.values():
+        value = values.get(characteristic.uuid.lower())
+        if value is not None:
+            return list(bytes.fromhex(value))
+
+    return None
@@ -0,0 +1,143 @@
+import os
+import sys
+from collections import deque
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from lib.constants import GATT_COMMAND_TIMEOUT, GATT_COMMAND_RETRIES
+
+GATT_WRITE_VALUE = 'write_value'
+GATT_ENABLE_NOTIFICATIONS = 'enable_notifications'
+
+# run callbacks in the GLib main loop that gatt.DeviceManager.run() is running
+class GLibScheduler:
+    def __init__(self):
+        from gi.repository import GLib
+        self.GLib = GLib
+
+    # GLib keeps calling a source while it returns True, so the callbacks are wrapped to run only once
+    def call_soon(self, callback):
+        return self.GLib.idle_add(lambda: callback() and False)
+
+    def call_later(self, delay, callback):
+        return self.GLib.timeout_add(int(delay * 1000), lambda: callback() and False)
+
+    def cancel(self, handle):
+        self.GLib.source_remove(handle)
+
+# a single BLE command (a characteristic write or enabling its notifications) waiting in a GattCommandQueue
+# commands with the same key (eg. 'resistance') are coalesced: only the latest one that hasn't been sent yet is kept
+class GattCommand:
+    def __init__(self, characteristic, action, value=None, on_success=None, on_failure=None, key=None):
+        self.characteristic = characteristic
+        self.action = action
+        self.value = value
+        self.on_success = on_success
+        self.on_failure = on_failure
+        self.key = key
+        self.attempts = 0
+
+    def send(self):
+        self.attempts += 1
+        if self.action == GATT_WRITE_VALUE:
+            self.characteristic.write_value(self.value)
+        else:
+            self.characteristic.enable_notifications()
+
+# a per-device queue that sends one BLE command at a time and sends the next one as soon as
+# the device confirms the previous one (characteristic_write_value_succeeded/failed), instead of sleeping for a fixed time after each write
+# the device has to forward its gatt callbacks to command_succeeded() and command_failed()
+class GattCommandQueue:
+    def __init__(self, name, scheduler=None, timeout=GATT_COMMAND_TIMEOUT, retries=GATT_COMMAND_RETRIES):
+        self.name = name
+        self.scheduler = scheduler or GLibScheduler()
+        self.timeout = timeout
+        self.retries = retries
+
+        self.pending = deque()
+        self.current = None
+        self.timeout_handle = None
+
+        # how many pending commands have been replaced by a newer command with the same key
+        self.coalesced_count = 0
+
+    def write_value(self, characteristic, value, on_success=None, on_failure=None, key=None):
+        self.enqueue(GattCommand(characteristic, GATT_WRITE_VALUE, value, on_success, on_failure, key))
+
+    def enable_notifications(self, characteristic, on_success=None, on_failure=None):
+        self.enqueue(GattCommand(characteristic, GATT_ENABLE_NOTIFICATIONS, None, on_success, on_failure))
+
+    # commands can be queued from any thread (eg. the MQTT thread), they are always sent from the GLib main loop
+    def enqueue(self, command):
+        self.scheduler.call_soon(lambda: self.append(command))
+
+    def append(self, command):
+        if command.key is not None:
+            for index, pending_command in enumerate(self.pending):
+                if pending_command.key == command.key:
+                    # latest wins: the superseded target is dropped and the new one keeps its place in the queue
+                    self.pending[index] = command
+                    self.coalesced_count += 1
+                    print(f"[{self.name}] Superseded a pending {command.key} command ({self.coalesced_count} collapsed so far)")
+                    return
+
+        self.pending.append(command)
+        if self.current is None:
+            self.send_next()
+
+    def is_idle(self):
+        return self.current is None and not self.pending
+
+    def send_next(self):
+        if self.current is not None or not self.pending:
+            return
+
+        self.current = self.pending.popleft()
+        self.send_current()
+
+    def send_current(self):
+        command = self.current
+        self.timeout_handle = self.scheduler.call_later(self.timeout, self.command_timed_out)
+        try:
+            command.send()
+        except Exception as error:
+            self.command_failed(command.characteristic, error)
+
+    def command_succeeded(self, characteristic):
+        if self.current is None or self.current.characteristic != characteristic:
+            return
+
+        self.finish_current(succeeded=True)
+
+    def command_failed(self, characteristic, error):
+        if self.current is None or self.current.characteristic != characteristic:
+            return
+
+        print(f"[{self.name}] {self.current.action} on {characteristic.uuid} failed (attempt {self.current.attempts}): {str(error)}")
+        self.cancel_timeout()
+        if self.current.attempts <= self.retries:
+            self.send_current()
+        else:
+            self.finish_current(succeeded=False)
+
+    def command_timed_out(self):
+        self.timeout_handle = None
+        if self.current is not None:
+            self.command_failed(self.current.characteristic, "timed out")
+
+    def cancel_timeout(self):
+        if self.timeout_handle is not None:
+            self.scheduler.cancel(self.timeout_handle)
+            self.timeout_handle = None
+
+    def finish_current(self, succeeded):
+        self.cancel_timeout()
+        command = self.current
+        self.current = None
+
+        callback = command.on_success if succeeded else command.on_failure
+        if callback:
+            callback()
+
+        self.send_next()
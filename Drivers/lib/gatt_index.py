@@ -0,0 +1,47 @@
+# the Bluetooth Base UUID 00000000-0000-1000-8000-00805f9b34fb, any UUID ending like this is a 16 or 32-bit SIG assigned number
+BLUETOOTH_BASE_UUID = 0x0000000000001000800000805f9b34fb
+BLUETOOTH_BASE_UUID_MASK = (1 << 96) - 1
+
+# normalize a UUID once into an integer key:
+# the 16/32-bit number for a SIG assigned UUID (eg. 0x2ad2 for "00002ad2-0000-1000-8000-00805f9b34fb"),
+# or the full 128-bit number for a custom one (eg. "a026ee0b0a7d4ab397faf1500f9feb8b")
+def normalize_uuid(uuid):
+    if isinstance(uuid, int):
+        value = uuid
+    else:
+        value = int(uuid.replace('-', ''), 16)
+
+    if value > 0xFFFFFFFF and value & BLUETOOTH_BASE_UUID_MASK == BLUETOOTH_BASE_UUID:
+        return value >> 96
+
+    return value
+
+# an index of the resolved services and characteristics of a gatt.Device, keyed by the normalized UUIDs,
+# so finding a characteristic is a dict lookup instead of comparing UUID strings with regular expressions
+class GattIndex:
+    def __init__(self, services):
+        self.services = {}
+        self.characteristics = {}
+
+        for service in services:
+            service_key = normalize_uuid(service.uuid)
+            characteristics = {normalize_uuid(characteristic.uuid): characteristic for characteristic in service.characteristics}
+            self.services[service_key] = (service, characteristics)
+            for characteristic_key, characteristic in characteristics.items():
+                self.characteristics.setdefault(characteristic_key, characteristic)
+
+    # find a service, or one of its characteristics if a characteristic UUID is given too, returns None if it doesn't exist
+    def find(self, service_uuid, characteristic_uuid=None):
+        entry = self.services.get(normalize_uuid(service_uuid))
+        if entry is None:
+            return None
+
+        service, characteristics = entry
+        if characteristic_uuid is None:
+            return service
+
+        return characteristics.get(normalize_uuid(characteristic_uuid))
+
+    # find a characteristic in any service
+    def find_characteristic(self, characteristic_uuid):
+        return self.characteristics.get(normalize_uuid(characteristic_uuid))
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import math
+from array import array
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from lib.constants import RR_INTERVAL_RESOLUTION, HRV_WINDOW, HRV_MIN_RR_INTERVAL, HRV_MAX_RR_INTERVAL, HRV_NN50_THRESHOLD
+
+# the heart rate variability of the last `window` seconds of beats, from the RR intervals of a heart rate strap (in 1/1024 seconds):
+# SDNN (standard deviation of the intervals), RMSSD (root mean square of the successive differences) and pNN50 (share of successive differences over 50 ms)
+# each interval is added in O(1) and the memory is fixed: the intervals are kept in a ring buffer sized for the shortest accepted interval,
+# and the running sums are integers of the raw 1/1024 s units, so removing the intervals that leave the window never drifts
+class RollingHRV:
+    __slots__ = ('window', 'min_interval', 'max_interval', 'nn50_threshold', 'capacity', 'intervals', 'differences', 'has_difference',
+        'start', 'count', 'previous', 'interval_sum', 'interval_square_sum', 'difference_count', 'difference_square_sum', 'nn50_count', 'rejected_count')
+
+    def __init__(self, window=HRV_WINDOW, min_interval=HRV_MIN_RR_INTERVAL, max_interval=HRV_MAX_RR_INTERVAL, nn50_threshold=HRV_NN50_THRESHOLD):
+        self.window = round(window * RR_INTERVAL_RESOLUTION)
+        self.min_interval = round(min_interval * RR_INTERVAL_RESOLUTION)
+        self.max_interval = round(max_interval * RR_INTERVAL_RESOLUTION)
+        self.nn50_threshold = nn50_threshold * RR_INTERVAL_RESOLUTION
+
+        # the window never holds more beats than this, even at the shortest accepted interval
+        self.capacity = self.window // self.min_interval + 1
+        self.intervals = array('H', bytes(2 * self.capacity))
+        # the difference of each interval to the one before it, when that one was accepted and is still in the window
+        self.differences = array('i', bytes(4 * self.capacity))
+        self.has_difference = bytearray(self.capacity)
+        self.start = 0
+        self.count = 0
+        self.previous = None
+
+        self.interval_sum = 0
+        self.interval_square_sum = 0
+        self.difference_count = 0
+        self.difference_square_sum = 0
+        self.nn50_count = 0
+        self.rejected_count = 0
+
+    def __len__(self):
+        return self.count
+
+    # add an RR interval in 1/1024 seconds, intervals out of the accepted range are skipped and break the successive differences
+    def add(self, interval):
+        if not self.min_interval <= interval <= self.max_interval:
+            self.rejected_count += 1
+            self.previous = None
+            return False
+
+        while self.count > 0 and (self.count == self.capacity or self.interval_sum + interval > self.window):
+            self.remove_oldest()
+
+        index = (self.start + self.count) % self.capacity
+        self.intervals[index] = interval
+        self.count += 1
+        self.interval_sum += interval
+        self.interval_square_sum += interval * interval
+
+        if self.previous is not None and self.count > 1:
+            difference = interval - self.previous
+            self.differences[index] = difference
+            self.has_difference[index] = 1
+            self.add_difference(difference, 1)
+        else:
+            self.has_difference[index] = 0
+
+        self.previous = interval
+        return True
+
+    def add_difference(self, difference, sign):
+        self.difference_count += sign
+        self.difference_square_sum += sign * difference * difference
+        if abs(difference) > self.nn50_threshold:
+            self.nn50_count += sign
+
+    # the difference of the next interval to the removed one leaves the window with it
+    def remove_oldest(self):
+        interval = self.intervals[self.start]
+        self.interval_sum -= interval
+        self.interval_square_sum -= interval * interval
+        self.start = (self.start + 1) % self.capacity
+        self.count -= 1
+
+        if self.count > 0 and self.has_difference[self.start]:
+            self.has_difference[self.start] = 0
+            self.add_difference(self.differences[self.start], -1)
+
+    def to_milliseconds(self, value):
+        return value * 1000.0 / RR_INTERVAL_RESOLUTION
+
+    def mean_interval(self):
+        return self.to_milliseconds(self.interval_sum / self.count) if self.count > 0 else None
+
+    def sdnn(self):
+        if self.count < 2:
+            return None
+        return self.to_milliseconds(math.sqrt((self.count * self.interval_square_sum - self.interval_sum * self.interval_sum) / (self.count * (self.count - 1))))
+
+    def rmssd(self):
+        if self.difference_count == 0:
+            return None
+        return self.to_milliseconds(math.sqrt(self.difference_square_sum / self.difference_count))
+
+    def pnn50(self):
+        if self.difference_count == 0:
+            return None
+        return 100.0 * self.nn50_count / self.difference_count
+
+    # the HRV report published by the heart rate driver, the times are in milliseconds and pNN50 in percent
+    def summary(self):
+        mean_interval = self.mean_interval()
+        return {
+            "rmssd": self.rmssd(),
+            "sdnn": self.sdnn(),
+            "pnn50": self.pnn50(),
+            "meanRR": mean_interval,
+            "heartRate": 60000.0 / mean_interval if mean_interval else None,
+            "beats": self.count
+        }
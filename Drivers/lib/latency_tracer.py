@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import math
+import time
+import threading
+from array import array
+from collections import OrderedDict
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from lib.constants import LATENCY_TRACE_ENV, LATENCY_HISTOGRAM_MIN, LATENCY_HISTOGRAM_DECADES, LATENCY_HISTOGRAM_BUCKETS_PER_DECADE, LATENCY_MAX_PENDING_PUBLISHES, LATENCY_REPORT_INTERVAL, LATENCY_PERCENTILES
+
+# a latency histogram with log-spaced buckets, so adding a value and reading a percentile cost the same whatever the number of samples
+class LatencyHistogram:
+    def __init__(self, minimum=LATENCY_HISTOGRAM_MIN, decades=LATENCY_HISTOGRAM_DECADES, buckets_per_decade=LATENCY_HISTOGRAM_BUCKETS_PER_DECADE):
+        self.minimum = minimum
+        self.buckets_per_decade = buckets_per_decade
+        self.counts = array('L', [0]) * (decades * buckets_per_decade + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def add(self, latency):
+        if latency <= self.minimum:
+            index = 0
+        else:
+            index = min(len(self.counts) - 1, 1 + int(math.log10(latency / self.minimum) * self.buckets_per_decade))
+        self.counts[index] += 1
+        self.count += 1
+        self.total += latency
+        if latency > self.maximum:
+            self.maximum = latency
+
+    # the upper edge of the bucket the percentile falls in, capped at the largest latency seen (the last bucket has no upper edge)
+    def percentile(self, percent):
+        if not self.count:
+            return None
+
+        rank = max(1, math.ceil(self.count * percent / 100))
+        seen = 0
+        for index, count in enumerate(self.counts[:-1]):
+            seen += count
+            if seen >= rank:
+                return min(self.minimum * 10 ** (index / self.buckets_per_decade), self.maximum)
+        return self.maximum
+
+    # in milliseconds
+    def summary(self, percents=LATENCY_PERCENTILES):
+        summary = {"count": self.count}
+        if self.count:
+            summary["mean"] = self.total / self.count * 1000
+            summary["max"] = self.maximum * 1000
+            for percent in percents:
+                summary[f"p{percent}"] = self.percentile(percent) * 1000
+        return summary
+
+# times the stages of the path from a BLE notification to the MQTT PUBACK of the samples it produced:
+# notification (handling the notification), payload (building a JSON payload), publish (handing a message to paho),
+# notify_to_publish (notification to publish) and notify_to_puback (notification to the broker's PUBACK)
+# a notification is only followed to its PUBACK when it is published from the same thread (the immediate publish mode)
+class LatencyTracer:
+    def __init__(self, enabled=False, max_pending=LATENCY_MAX_PENDING_PUBLISHES):
+        self.enabled = enabled
+        self.max_pending = max_pending
+        self.histograms = {}
+        self.pending = OrderedDict()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    # a start time for record(), None when tracing is disabled
+    def start(self):
+        return time.perf_counter() if self.enabled else None
+
+    def record(self, stage, start):
+        if start is not None:
+            self.add(stage, time.perf_counter() - start)
+
+    def add(self, stage, latency):
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = LatencyHistogram()
+            histogram.add(latency)
+
+    # a notification arrived, the samples published on this thread until end_notification() are stamped with its time
+    def begin_notification(self):
+        if not self.enabled:
+            return None
+        self.local.notification_start = start = time.perf_counter()
+        return start
+
+    def end_notification(self, start):
+        if start is not None:
+            self.record('notification', start)
+            self.local.notification_start = None
+
+    # a message has been handed to paho with the given mid
+    def published(self, mid):
+        if not self.enabled:
+            return
+        notification_start = getattr(self.local, 'notification_start', None)
+        if notification_start is None:
+            return
+
+        self.add('notify_to_publish', time.perf_counter() - notification_start)
+        with self.lock:
+            self.pending[mid] = notification_start
+            if len(self.pending) > self.max_pending:
+                self.pending.popitem(last=False)
+
+    # the broker acknowledged the message with the given mid
+    def acknowledged(self, mid):
+        if not self.enabled:
+            return
+        with self.lock:
+            notification_start = self.pending.pop(mid, None)
+        if notification_start is not None:
+            self.add('notify_to_puback', time.perf_counter() - notification_start)
+
+    def summary(self):
+        with self.lock:
+            return {stage: histogram.summary() for stage, histogram in self.histograms.items()}
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.pending.clear()
+
+# the tracer used by the drivers and the MQTT client
+tracer = LatencyTracer(enabled=os.getenv(LATENCY_TRACE_ENV) == '1')
+
+# publishes the latency summary to a MQTT topic and writes it to a file every interval seconds
+class LatencyReporter:
+    def __init__(self, latency_tracer, mqtt_client=None, topic_name=None, path=None, interval=LATENCY_REPORT_INTERVAL):
+        self.tracer = latency_tracer
+        self.mqtt_client = mqtt_client
+        self.topic_name = topic_name
+        self.path = path
+        self.interval = interval
+        self.closed = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='latency-reporter', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def report(self):
+        payload = json.dumps({"timestamp": time.time(), "unitName": "ms", "stages": self.tracer.summary()})
+
+        if self.mqtt_client is not None and self.topic_name:
+            self.mqtt_client.publish(self.topic_name, payload)
+
+        if self.path:
+            # write to a temporary file first so a reader never sees a half written report
+            temporary_path = self.path + '.tmp'
+            try:
+                with open(temporary_path, 'w') as report_file:
+                    report_file.write(payload)
+                os.replace(temporary_path, self.path)
+            except OSError as error:
+                print(f"Cannot write the latency report to {self.path}: {str(error)}")
+
+        return payload
+
+    def run(self):
+        while not self.closed.wait(self.interval):
+            self.report()
+
+    def close(self):
+        self.closed.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        self.report()
+
+# enable the tracer and start reporting, used by the drivers when a report interval is configured
+def start_latency_reporting(mqtt_client, topic_name, path, interval=LATENCY_REPORT_INTERVAL):
+    tracer.enabled = True
+    reporter = LatencyReporter(tracer, mqtt_client, topic_name, path, interval)
+    reporter.start()
+    return reporter
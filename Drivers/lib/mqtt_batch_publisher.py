@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import atexit
+import threading
+from collections import deque
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from lib.constants import PUBLISH_MODE_IMMEDIATE, PUBLISH_MODE_BATCH, PUBLISH_MODE_LATEST, PUBLISH_MODES, PUBLISH_WINDOW, PUBLISH_MAX_SAMPLES_PER_TOPIC, PUBLISH_BATCH_TOPIC_SUFFIX, PUBLISH_BUFFERED_CHANNELS
+
+# split a topic like 'bike/000001/speed' into its bike prefix ('bike/000001') and channel ('speed')
+def split_topic(topic_name):
+    prefix, _, channel = topic_name.rpartition('/')
+    return prefix, channel
+
+# build one batch frame from the pending JSON payloads of a bike, e.g.:
+# {"speed": [{"value": 5.2, ...}, {"value": 5.3, ...}], "power": [{"value": 120, ...}]}
+# the payloads are already serialized, so they are spliced in as they are instead of being parsed again
+# compact payloads (lib.compact_payload) carry their channel id, so their batch frame is simply the frames back to back
+def build_batch_payload(samples_by_channel):
+    if any(isinstance(samples[0], bytes) for samples in samples_by_channel.values() if samples):
+        return b''.join(b''.join(samples) for samples in samples_by_channel.values())
+    return '{' + ', '.join(f'"{channel}": [{", ".join(samples)}]' for channel, samples in samples_by_channel.items()) + '}'
+
+# a publisher that sits in front of a MQTTClient and holds back the sensor samples for a short window,
+# so a bike sends one batched frame (or the latest value per topic) per window instead of one QoS 1 message per sample
+class BatchingMQTTPublisher:
+    def __init__(self, mqtt_client, mode=PUBLISH_MODE_BATCH, window=PUBLISH_WINDOW, buffered_channels=PUBLISH_BUFFERED_CHANNELS, max_samples_per_topic=PUBLISH_MAX_SAMPLES_PER_TOPIC, flush_on_exit=True):
+        if mode not in (PUBLISH_MODE_BATCH, PUBLISH_MODE_LATEST):
+            raise Exception("invalid publish mode", mode)
+
+        self.mqtt_client = mqtt_client
+        self.mode = mode
+        self.window = window
+        self.buffered_channels = frozenset(buffered_channels)
+        self.max_samples_per_topic = 1 if mode == PUBLISH_MODE_LATEST else max_samples_per_topic
+
+        # pending samples per topic, each one is bounded by max_samples_per_topic
+        self.pending = {}
+        self.lock = threading.Lock()
+
+        # counters to see how much traffic has been saved
+        self.received_count = 0
+        self.dropped_count = 0
+        self.sent_count = 0
+
+        self.closed = threading.Event()
+        self.flush_thread = threading.Thread(target=self.run, name='mqtt-batch-publisher', daemon=True)
+        self.flush_thread.start()
+
+        if flush_on_exit:
+            atexit.register(self.close)
+
+    # same signature as MQTTClient.publish, so a driver can use either of them
+    # retained messages are always sent straight away, a batch frame would not keep them as the last value of their topic
+    def publish(self, topic_name, payload, retain=False):
+        if retain or self.closed.is_set() or split_topic(topic_name)[1] not in self.buffered_channels:
+            self.mqtt_client.publish(topic_name, payload, retain=retain)
+            return
+
+        with self.lock:
+            self.received_count += 1
+            samples = self.pending.get(topic_name)
+            if samples is None:
+                samples = self.pending[topic_name] = deque(maxlen=self.max_samples_per_topic)
+            elif len(samples) == samples.maxlen:
+                # in the latest mode this is a superseded value, otherwise the oldest sample is dropped to bound the memory
+                self.dropped_count += 1
+            samples.append(payload)
+
+    # send everything that is pending now
+    def flush(self):
+        with self.lock:
+            pending = self.pending
+            self.pending = {}
+
+        if not pending:
+            return
+
+        if self.mode == PUBLISH_MODE_LATEST:
+            for topic_name, samples in pending.items():
+                self.mqtt_client.publish(topic_name, samples[-1])
+                self.sent_count += 1
+            return
+
+        samples_by_bike = {}
+        for topic_name, samples in pending.items():
+            prefix, channel = split_topic(topic_name)
+            samples_by_bike.setdefault(prefix, {})[channel] = samples
+
+        for prefix, samples_by_channel in samples_by_bike.items():
+            self.mqtt_client.publish(f"{prefix}/{PUBLISH_BATCH_TOPIC_SUFFIX}", build_batch_payload(samples_by_channel))
+            self.sent_count += 1
+
+    def run(self):
+        while not self.closed.wait(self.window):
+            self.flush()
+
+    # stop the flushing thread and send whatever is still pending, this is also called when the program exits
+    def close(self):
+        if self.closed.is_set():
+            return
+
+        self.closed.set()
+        self.flush_thread.join()
+        self.flush()
+        print(f"[MQTT publisher] {self.received_count} samples received, {self.dropped_count} dropped, {self.sent_count} messages sent")
+
+# return a publisher for the given mode, the immediate mode simply uses the MQTT client itself
+def create_publisher(mqtt_client, mode=PUBLISH_MODE_IMMEDIATE, window=PUBLISH_WINDOW, buffered_channels=PUBLISH_BUFFERED_CHANNELS):
+    if mode not in PUBLISH_MODES:
+        raise Exception("invalid publish mode", mode)
+
+    if mode == PUBLISH_MODE_IMMEDIATE:
+        return mqtt_client
+
+    return BatchingMQTTPublisher(mqtt_client, mode=mode, window=window, buffered_channels=buffered_channels)
@@ -1,9 +1,19 @@
 #!/usr/bin/env python3
 
+import os
+import sys
 import time
 import paho.mqtt.client as paho
 from paho import mqtt
 
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from lib.latency_tracer import tracer
+from lib.driver_log import get_logger
+
+log = get_logger('mqtt')
+
 # this is a MQTT client that is able to publish to and subscribe from MQTT topics in HiveMQ Cloud
 class MQTTClient:
     def __init__(self, broker_address, username, password):
@@ -32,16 +42,20 @@ class MQTTClient:
         # setting callbacks, use separate functions like above for better visibility
         self.client.on_subscribe = self.on_subscribe
         self.client.on_message = self.on_message
-        self.client.on_publish = self.on_publish
+        self.client.on_publish = self.publish_acknowledged
         self.client.on_disconnect = self.on_disconnect
 
     def subscribe(self, topic_name):
         # subscribe to all topics of encyclopedia by using the wildcard "#"
         self.client.subscribe(topic_name, qos=1)
 
-    def publish(self, topic_name, payload):
+    def publish(self, topic_name, payload, retain=False):
         # a single publish, this can also be done in loops, etc.
-        self.client.publish(topic_name, payload=payload, qos=1)
+        start = tracer.start()
+        message_info = self.client.publish(topic_name, payload=payload, qos=1, retain=retain)
+        tracer.record('publish', start)
+        tracer.published(message_info.mid)
+        return message_info.mid
 
     def loop_forever(self):
         # loop_forever for simplicity, here you need to stop the loop manually
@@ -56,9 +70,15 @@ class MQTTClient:
     def on_connect(self, client, userdata, flags, rc, properties=None):
         print("CONNACK received with code %s." % rc)
 
+    # the PUBACK of a message is timed before it is passed on to on_publish, which subclasses override
+    def publish_acknowledged(self, client, userdata, mid, properties=None):
+        tracer.acknowledged(mid)
+        self.on_publish(client, userdata, mid, properties)
+
     # with this callback you can see if your publish was successful
     def on_publish(self, client, userdata, mid, properties=None):
-        print("[MQTT message published] mid: " + str(mid))
+        log.count('published')
+        log.debug("[MQTT message published] mid: %s", mid)
 
     # print which topic was subscribed to
     def on_subscribe(self, client, userdata, mid, granted_qos, properties=None):
@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import socket
+import struct
+import threading
+import socketserver
+from collections import namedtuple
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from lib.latency_tracer import tracer
+from lib.driver_log import get_logger
+from lib.constants import MQTT_MUX_SOCKET_PATH, MQTT_MUX_SOCKET_ENV
+
+log = get_logger('mqtt')
+
+# the frames sent over the Unix socket between the drivers and the multiplexer:
+# a header (frame type, QoS, topic length, payload length) followed by the UTF-8 topic and the raw payload
+FRAME_HEADER = struct.Struct('>BBHI')
+FRAME_RETAIN_FLAG = 0x80 # set in the QoS byte of a publish frame for a retained message
+FRAME_PUBLISH = 1 # driver -> multiplexer
+FRAME_SUBSCRIBE = 2 # driver -> multiplexer
+FRAME_UNSUBSCRIBE = 3 # driver -> multiplexer
+FRAME_MESSAGE = 4 # multiplexer -> driver, a message received from the broker
+FRAME_PUBACK = 5 # multiplexer -> driver, the broker acknowledged a message of the driver, the payload is its number (PUBACK_NUMBER)
+
+# the publish frames of a driver are numbered from 1 in the order they are sent, on both ends of the socket,
+# so the PUBACK frame only has to carry that number, which the driver uses as the mid of the message
+PUBACK_NUMBER = struct.Struct('>I')
+
+# the same fields paho's MQTTMessage has for the drivers' on_message callbacks
+MuxMessage = namedtuple('MuxMessage', ['topic', 'payload', 'qos'])
+
+# paho accepts str, bytes and numbers as payloads, so this does too
+def payload_to_bytes(payload):
+    if payload is None:
+        return b''
+    if isinstance(payload, (bytes, bytearray)):
+        return bytes(payload)
+    if isinstance(payload, str):
+        return payload.encode('utf-8')
+    if isinstance(payload, (int, float)):
+        return str(payload).encode('ascii')
+    raise TypeError("payload must be a string, bytes, int, float or None", payload)
+
+def encode_frame(frame_type, topic_name, payload=b'', qos=0):
+    topic_bytes = topic_name.encode('utf-8')
+    return FRAME_HEADER.pack(frame_type, qos, len(topic_bytes), len(payload)) + topic_bytes + payload
+
+# read one frame from a binary file (e.g. socket.makefile('rb')), returns (frame_type, qos, topic_name, payload) or None when the connection is closed
+def read_frame(stream):
+    header = stream.read(FRAME_HEADER.size)
+    if len(header) < FRAME_HEADER.size:
+        return None
+
+    frame_type, qos, topic_length, payload_length = FRAME_HEADER.unpack(header)
+    body = stream.read(topic_length + payload_length)
+    if len(body) < topic_length + payload_length:
+        return None
+
+    return frame_type, qos, body[:topic_length].decode('utf-8'), body[topic_length:]
+
+# check if a topic matches a subscription topic filter with the MQTT wildcards, e.g. 'bike/+/speed' or 'bike/#'
+def topic_matches(topic_filter, topic_name):
+    filter_levels = topic_filter.split('/')
+    topic_levels = topic_name.split('/')
+
+    for index, filter_level in enumerate(filter_levels):
+        if filter_level == '#':
+            return True
+        if index >= len(topic_levels):
+            return False
+        if filter_level != '+' and filter_level != topic_levels[index]:
+            return False
+
+    return len(filter_levels) == len(topic_levels)
+
+# the topic filters of a subscribe call, either a single topic or a list of (topic, qos) tuples like paho accepts
+def topic_filters(topic_name):
+    if isinstance(topic_name, str):
+        return [topic_name]
+    return [topic_filter for topic_filter, _ in topic_name]
+
+# a drop-in replacement of MQTTClient that talks to the local multiplexer instead of opening its own TLS connection to HiveMQ Cloud
+# get_client() returns the client itself, which also has the parts of paho's client the drivers use (on_message, loop_start, loop_stop, ...)
+class MuxMQTTClient:
+    def __init__(self, socket_path=MQTT_MUX_SOCKET_PATH):
+        self.socket_path = socket_path
+        self.sock = None
+        self.send_lock = threading.Lock()
+        self.loop_thread = None
+
+        # same callback signatures as paho, on_publish is called with the mid publish() gave the message once the broker acknowledged it
+        self.on_message = self.print_message
+        self.on_publish = self.count_published
+        self.publish_count = 0
+
+        # callbacks for messages of specific topics (like SharedMQTTClient), the others go to on_message
+        self.message_callbacks = []
+
+    def get_client(self):
+        return self
+
+    def setup_mqtt_client(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+    def send(self, frame):
+        with self.send_lock:
+            self.sock.sendall(frame)
+
+    def subscribe(self, topic_name, qos=1):
+        for topic_filter in topic_filters(topic_name):
+            self.send(encode_frame(FRAME_SUBSCRIBE, topic_filter, qos=qos))
+
+    def unsubscribe(self, topic_name):
+        for topic_filter in topic_filters(topic_name):
+            self.send(encode_frame(FRAME_UNSUBSCRIBE, topic_filter))
+
+    def publish(self, topic_name, payload=None, qos=1, retain=False):
+        frame = encode_frame(FRAME_PUBLISH, topic_name, payload_to_bytes(payload), (qos | FRAME_RETAIN_FLAG) if retain else qos)
+        start = tracer.start()
+        with self.send_lock:
+            self.publish_count += 1
+            mid = self.publish_count % (1 << 32)
+            # before the frame is sent, so the PUBACK can't come back before the tracer knows the mid
+            tracer.published(mid)
+            self.sock.sendall(frame)
+        tracer.record('publish', start)
+        return mid
+
+    # the PUBACK of a message is timed before it is passed on to on_publish, like MQTTClient does
+    def publish_acknowledged(self, mid):
+        tracer.acknowledged(mid)
+        if self.on_publish is not None:
+            self.on_publish(self, None, mid)
+
+    def count_published(self, client, userdata, mid, properties=None):
+        log.count('published')
+        log.debug("[MQTT message published] mid: %s", mid)
+
+    # subscribe to a topic (wildcards are allowed) and call the callback with every message received on it
+    def add_message_callback(self, topic_name, callback):
+        self.message_callbacks.append((topic_name, callback))
+        self.subscribe(topic_name)
+
+    def dispatch(self, msg):
+        handled = False
+        for topic_filter, callback in self.message_callbacks:
+            if topic_matches(topic_filter, msg.topic):
+                callback(self, None, msg)
+                handled = True
+
+        if not handled and self.on_message is not None:
+            self.on_message(self, None, msg)
+
+    # receive messages until the connection to the multiplexer is closed
+    def loop_forever(self):
+        stream = self.sock.makefile('rb')
+        while True:
+            frame = read_frame(stream)
+            if frame is None:
+                print("[MQTT multiplexer] Connection closed")
+                return
+
+            frame_type, qos, topic_name, payload = frame
+            if frame_type == FRAME_MESSAGE:
+                self.dispatch(MuxMessage(topic_name, payload, qos))
+            elif frame_type == FRAME_PUBACK:
+                self.publish_acknowledged(PUBACK_NUMBER.unpack(payload)[0])
+
+    def loop_start(self):
+        if self.loop_thread is None:
+            self.loop_thread = threading.Thread(target=self.loop_forever, name='mqtt-mux-client', daemon=True)
+            self.loop_thread.start()
+
+    # this closes the connection to the multiplexer, the drivers only call it when they exit
+    def loop_stop(self):
+        self.disconnect()
+        if self.loop_thread is not None and self.loop_thread is not threading.current_thread():
+            self.loop_thread.join()
+        self.loop_thread = None
+
+    def disconnect(self):
+        if self.sock is not None:
+            self.sock.shutdown(socket.SHUT_RDWR)
+            self.sock.close()
+            self.sock = None
+
+    def print_message(self, client, userdata, msg):
+        print(msg.topic + " " + str(msg.qos) + " " + str(msg.payload))
+
+# return a MuxMQTTClient when the multiplexer's socket is set in the MQTT_MUX_SOCKET environment variable,
+# otherwise a client of the driver's own MQTTClient class with its own connection to the broker
+def create_mqtt_client(mqtt_client_class, broker_address, username, password):
+    socket_path = os.getenv(MQTT_MUX_SOCKET_ENV)
+    if socket_path:
+        return MuxMQTTClient(socket_path)
+
+    return mqtt_client_class(broker_address, username, password)
+
+# a driver connected to the multiplexer, with the topic filters it subscribed to
+class LocalClient:
+    def __init__(self, connection):
+        self.connection = connection
+        self.topic_filters = set()
+        self.send_lock = threading.Lock()
+        # the publish frames received from the driver, their PUBACK frames carry this number
+        self.publish_count = 0
+
+    def send(self, frame):
+        with self.send_lock:
+            self.connection.sendall(frame)
+
+# the local service that keeps the one upstream connection of a Pi and fans the subscriptions in and out to the drivers
+# upstream is a MQTTClient that is already set up, each topic filter is subscribed to upstream once, while any driver needs it
+# the broker only sends the retained messages (e.g. the compact payload descriptors) for that first subscription,
+# so they are kept here and replayed to the drivers that subscribe to the same topic filter later
+class MQTTMultiplexer:
+    def __init__(self, upstream, socket_path=MQTT_MUX_SOCKET_PATH):
+        self.upstream = upstream
+        self.socket_path = socket_path
+        self.lock = threading.Lock()
+        # held while the upstream subscriptions change, so they reach the broker in the order the drivers sent them
+        self.upstream_lock = threading.Lock()
+
+        # topic filter -> the local clients subscribed to it
+        self.subscribers = {}
+        self.local_clients = set()
+
+        # topic -> (payload, qos) of the retained messages
+        self.retained = {}
+
+        # upstream mid -> (local client, number of the message for the local client) of the messages waiting for their PUBACK
+        # paho can call on_publish before publish() has returned the mid, those mids are kept until the message is added
+        self.ack_lock = threading.Lock()
+        self.pending_acks = {}
+        self.early_acks = set()
+
+        self.upstream.get_client().on_message = self.upstream_message
+        self.server = None
+
+    def subscribe(self, local_client, topic_filter):
+        with self.upstream_lock:
+            with self.lock:
+                if topic_filter in local_client.topic_filters:
+                    return
+                local_client.topic_filters.add(topic_filter)
+                subscribers = self.subscribers.setdefault(topic_filter, set())
+                subscribers.add(local_client)
+                first_subscriber = len(subscribers) == 1
+                retained = [] if first_subscriber else [(topic_name, payload, qos) for topic_name, (payload, qos) in self.retained.items() if topic_matches(topic_filter, topic_name)]
+
+            if first_subscriber:
+                self.upstream.subscribe(topic_filter)
+
+        for topic_name, payload, qos in retained:
+            self.forward(local_client, topic_name, encode_frame(FRAME_MESSAGE, topic_name, payload, qos))
+
+    def unsubscribe(self, local_client, topic_filter):
+        with self.upstream_lock:
+            with self.lock:
+                if topic_filter not in local_client.topic_filters:
+                    return
+                local_client.topic_filters.discard(topic_filter)
+                subscribers = self.subscribers[topic_filter]
+                subscribers.discard(local_client)
+                last_subscriber = not subscribers
+                if last_subscriber:
+                    del self.subscribers[topic_filter]
+
+            if last_subscriber:
+                self.upstream.get_client().unsubscribe(topic_filter)
+
+    # subscribe to all the topic filters again, used after the upstream connection was lost
+    def resubscribe(self):
+        with self.upstream_lock:
+            with self.lock:
+                topic_filters = list(self.subscribers)
+
+            for topic_filter in topic_filters:
+                self.upstream.subscribe(topic_filter)
+
+    # keep the latest retained message of a topic, an empty retained payload clears it like on the broker
+    # the broker delivers the updates of a retained topic to existing subscriptions without the retain flag, so those update it too
+    def cache_retained(self, topic_name, payload, qos, retain):
+        with self.lock:
+            if not retain and topic_name not in self.retained:
+                return
+            if payload:
+                self.retained[topic_name] = (payload, qos)
+            else:
+                self.retained.pop(topic_name, None)
+
+    def add_local_client(self, connection):
+        local_client = LocalClient(connection)
+        with self.lock:
+            self.local_clients.add(local_client)
+        return local_client
+
+    def remove_local_client(self, local_client):
+        for topic_filter in list(local_client.topic_filters):
+            self.unsubscribe(local_client, topic_filter)
+
+        with self.lock:
+            self.local_clients.discard(local_client)
+
+    def handle_frame(self, local_client, frame):
+        frame_type, qos, topic_name, payload = frame
+        if frame_type == FRAME_PUBLISH:
+            retain = bool(qos & FRAME_RETAIN_FLAG)
+            self.cache_retained(topic_name, payload, qos & ~FRAME_RETAIN_FLAG, retain)
+            local_client.publish_count += 1
+            mid = self.upstream.publish(topic_name, payload, retain=retain)
+            if mid is not None:
+                self.add_pending_ack(mid, local_client, local_client.publish_count % (1 << 32))
+        elif frame_type == FRAME_SUBSCRIBE:
+            self.subscribe(local_client, topic_name)
+        elif frame_type == FRAME_UNSUBSCRIBE:
+            self.unsubscribe(local_client, topic_name)
+        else:
+            print(f"[MQTT multiplexer] Skip an unknown frame type: {frame_type}")
+
+    def add_pending_ack(self, mid, local_client, number):
+        with self.ack_lock:
+            if mid in self.early_acks:
+                self.early_acks.discard(mid)
+            else:
+                self.pending_acks[mid] = (local_client, number)
+                return
+
+        self.forward(local_client, 'PUBACK', encode_frame(FRAME_PUBACK, '', PUBACK_NUMBER.pack(number)))
+
+    # the broker acknowledged the upstream message with the given mid, the driver that published it gets a PUBACK frame
+    # this is called by the upstream client's on_publish, so it must not wait for paho (e.g. by publishing)
+    def acknowledged(self, mid):
+        with self.ack_lock:
+            pending = self.pending_acks.pop(mid, None)
+            if pending is None:
+                self.early_acks.add(mid)
+                return
+
+        local_client, number = pending
+        self.forward(local_client, 'PUBACK', encode_frame(FRAME_PUBACK, '', PUBACK_NUMBER.pack(number)))
+
+    # a message from the broker is sent once to every driver with a matching topic filter
+    def upstream_message(self, client, userdata, msg):
+        self.cache_retained(msg.topic, msg.payload, msg.qos, getattr(msg, 'retain', False))
+        with self.lock:
+            local_clients = [local_client for local_client in self.local_clients if any(topic_matches(topic_filter, msg.topic) for topic_filter in local_client.topic_filters)]
+
+        if not local_clients:
+            return
+
+        frame = encode_frame(FRAME_MESSAGE, msg.topic, msg.payload, msg.qos)
+        for local_client in local_clients:
+            self.forward(local_client, msg.topic, frame)
+
+    def forward(self, local_client, topic_name, frame):
+        try:
+            local_client.send(frame)
+        except OSError as error:
+            print(f"[MQTT multiplexer] Failed to forward {topic_name}: {str(error)}")
+
+    # serve the drivers on the Unix socket in a thread per driver until shutdown() is called
+    def serve_forever(self):
+        if os.path.exists(self.socket_path):
+            # a socket file left over from a previous run
+            os.remove(self.socket_path)
+
+        multiplexer = self
+        class LocalClientHandler(socketserver.StreamRequestHandler):
+            def handle(self):
+                local_client = multiplexer.add_local_client(self.request)
+                try:
+                    while True:
+                        frame = read_frame(self.rfile)
+                        if frame is None:
+                            return
+                        multiplexer.handle_frame(local_client, frame)
+                finally:
+                    multiplexer.remove_local_client(local_client)
+
+        self.server = socketserver.ThreadingUnixStreamServer(self.socket_path, LocalClientHandler)
+        self.server.daemon_threads = True
+        print(f"[MQTT multiplexer] Listening on {self.socket_path}")
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            os.remove(self.socket_path)
+
+    def shutdown(self):
+        if self.server is not None:
+            self.server.shutdown()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from lib.constants import PUBLISH_IDLE_LIMIT, PUBLISH_DEADBANDS, PUBLISH_HEARTBEAT_INTERVAL, PUBLISH_MAX_HEARTBEAT_INTERVAL
+from lib.mqtt_batch_publisher import split_topic
+
+# parse the deadbands given on the command line or in the environment, e.g. 'speed=0.1,power=5' -> {'speed': 0.1, 'power': 5.0}
+def parse_deadbands(text):
+    deadbands = {}
+    if not text:
+        return deadbands
+
+    for item in text.split(','):
+        channel, separator, deadband = item.partition('=')
+        channel = channel.strip()
+        try:
+            deadband = float(deadband)
+        except ValueError:
+            deadband = None
+        if not separator or not channel or deadband is None or not deadband >= 0:
+            raise Exception("invalid publish deadband", item)
+        deadbands[channel] = deadband
+
+    return deadbands
+
+# what the filter remembers of a topic
+class TopicState:
+    __slots__ = ('deadband', 'last_value', 'last_timestamp', 'idle_count')
+
+    def __init__(self, deadband, timestamp):
+        self.deadband = deadband
+        self.last_value = None
+        self.last_timestamp = timestamp
+        self.idle_count = 0
+
+# decides which sensor samples are worth publishing, per topic:
+# - idle suppression: the first idle_limit zeros in a row are published, so the consumers see the bike stop, the next ones are not
+# - deadband: other values are only published when they differ from the last published one by more than the deadband of their channel
+# - heartbeat: a suppressed sample is published anyway when nothing was published on its topic for heartbeat_interval seconds
+# the drivers call accept() before building the payload, so the suppressed samples cost nothing more
+class PublishFilter:
+    def __init__(self, idle_limit=PUBLISH_IDLE_LIMIT, deadbands=PUBLISH_DEADBANDS, heartbeat_interval=PUBLISH_HEARTBEAT_INTERVAL):
+        self.idle_limit = idle_limit if idle_limit is not None and idle_limit >= 0 else None
+        self.deadbands = dict(deadbands or {})
+        self.heartbeat_interval = heartbeat_interval if heartbeat_interval else None
+        self.topics = {}
+
+        # counters to see how much traffic has been saved
+        self.published_count = 0
+        self.suppressed_count = 0
+
+    # returns True when the sample (a number, timestamp in seconds) should be published to the topic
+    def accept(self, topic_name, value, timestamp):
+        state = self.topics.get(topic_name)
+        if state is None:
+            state = self.topics[topic_name] = TopicState(self.deadbands.get(split_topic(topic_name)[1]), timestamp)
+
+        if value == 0 and self.idle_limit is not None:
+            state.idle_count += 1
+            publish = state.idle_count <= self.idle_limit
+        else:
+            state.idle_count = 0
+            publish = state.last_value is None or state.deadband is None or abs(value - state.last_value) > state.deadband
+
+        if not publish and self.heartbeat_interval is not None:
+            publish = timestamp - state.last_timestamp >= self.heartbeat_interval
+
+        if not publish:
+            self.suppressed_count += 1
+            return False
+
+        state.last_value = value
+        state.last_timestamp = timestamp
+        self.published_count += 1
+        return True
+
+    # whether the topic is suppressing its zeros, i.e. its device is idle
+    def is_idle(self, topic_name):
+        state = self.topics.get(topic_name)
+        return state is not None and self.idle_limit is not None and state.idle_count > self.idle_limit
+
+# return a publish filter, the deadbands can be a dict or the text form of parse_deadbands
+# the ride analytics count a sample older than ANALYTICS_MAX_SAMPLE_GAP as a dropout (0 W), so a steady value held back by a deadband
+# has to be repeated by a heartbeat within that gap
+def create_publish_filter(idle_limit=PUBLISH_IDLE_LIMIT, deadbands=PUBLISH_DEADBANDS, heartbeat_interval=PUBLISH_HEARTBEAT_INTERVAL):
+    if isinstance(deadbands, str):
+        deadbands = parse_deadbands(deadbands)
+
+    if heartbeat_interval and heartbeat_interval > PUBLISH_MAX_HEARTBEAT_INTERVAL:
+        raise Exception("the publish heartbeat interval has to be at most", PUBLISH_MAX_HEARTBEAT_INTERVAL, heartbeat_interval)
+    if deadbands and not heartbeat_interval:
+        raise Exception("the publish deadbands need a heartbeat interval")
+
+    return PublishFilter(idle_limit, deadbands, heartbeat_interval)
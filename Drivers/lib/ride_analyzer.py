@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import csv
+import numpy as np
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from lib.constants import ANALYTICS_SAMPLE_PERIOD, ANALYTICS_MAX_SAMPLE_GAP, SESSION_CHANNELS, POWER_CURVE_DURATIONS, POWER_ZONE_EDGES, HEART_RATE_ZONE_EDGES, CADENCE_HISTOGRAM_EDGES, SESSION_FILE_MAGIC, SESSION_CHANNEL_IDS
+from lib.session_recorder import has_session_header
+
+# the fixed-width records of a session file written by lib.session_recorder
+SESSION_RECORD_DTYPE = np.dtype([('timestamp', '<f8'), ('channel', '<u4'), ('value', '<f4')])
+
+# a recorded ride: the samples of each channel as a pair of numpy arrays (timestamps, values)
+# columns() resamples every channel onto one uniform timeline, so the analytics are whole-array operations
+class RideSession:
+    def __init__(self, channels):
+        self.channels = {}
+        for channel, (timestamps, values) in channels.items():
+            timestamps = np.asarray(timestamps, dtype=np.float64)
+            values = np.asarray(values, dtype=np.float64)
+            order = np.argsort(timestamps, kind='stable')
+            self.channels[channel] = (timestamps[order], values[order])
+
+    # build a session from (timestamp, channel, value) samples
+    @classmethod
+    def from_samples(cls, samples):
+        columns = {}
+        for timestamp, channel, value in samples:
+            timestamps, values = columns.setdefault(channel, ([], []))
+            timestamps.append(timestamp)
+            values.append(value)
+        return cls(columns)
+
+    def start_time(self):
+        return min(timestamps[0] for timestamps, _ in self.channels.values() if len(timestamps))
+
+    def end_time(self):
+        return max(timestamps[-1] for timestamps, _ in self.channels.values() if len(timestamps))
+
+    # every channel on a uniform timeline from the start to the end of the ride, each point holds the latest sample
+    # points without a sample in the last max_gap seconds are 0 (e.g. the sensor dropped out), NaN before a channel's first sample
+    def columns(self, period=ANALYTICS_SAMPLE_PERIOD, max_gap=ANALYTICS_MAX_SAMPLE_GAP):
+        if not any(len(timestamps) for timestamps, _ in self.channels.values()):
+            return np.empty(0), {channel: np.empty(0) for channel in self.channels}
+
+        start = self.start_time()
+        timeline = start + np.arange(int((self.end_time() - start) // period) + 1) * period
+
+        columns = {}
+        for channel, (timestamps, values) in self.channels.items():
+            column = np.full(len(timeline), np.nan)
+            if len(timestamps):
+                latest = np.searchsorted(timestamps, timeline, side='right') - 1
+                has_sample = latest >= 0
+                column[has_sample] = values[latest[has_sample]]
+                column[has_sample & (timeline - timestamps[np.maximum(latest, 0)] > max_gap)] = 0.0
+            columns[channel] = column
+
+        return timeline, columns
+
+# load a session file of the session recorder, the records are memory-mapped instead of read and parsed
+def load_recorded_session(path):
+    count = (os.path.getsize(path) - len(SESSION_FILE_MAGIC)) // SESSION_RECORD_DTYPE.itemsize
+    if count <= 0:
+        return RideSession({})
+
+    records = np.memmap(path, dtype=SESSION_RECORD_DTYPE, mode='r', offset=len(SESSION_FILE_MAGIC), shape=(count,))
+    channels = {}
+    for channel in SESSION_CHANNELS:
+        is_channel = records['channel'] == SESSION_CHANNEL_IDS[channel]
+        if np.any(is_channel):
+            channels[channel] = (records['timestamp'][is_channel], records['value'][is_channel])
+    return RideSession(channels)
+
+# load a session file of the session recorder, a session CSV with one "timestamp,channel,value" row per sample,
+# or a speed log of the workouts with "timestamp,speed" rows
+def load_session(path):
+    if has_session_header(path):
+        return load_recorded_session(path)
+
+    samples = []
+    with open(path, newline='') as csvfile:
+        for row in csv.reader(csvfile):
+            if not row or row[0].startswith('#'):
+                continue
+            if len(row) == 2:
+                samples.append((float(row[0]), 'speed', float(row[1])))
+            else:
+                samples.append((float(row[0]), row[1], float(row[2])))
+
+    return RideSession.from_samples(samples)
+
+# seconds spent in each zone, the edges are absolute values (e.g. watts) in increasing order
+# points without data (NaN) are not counted
+def time_in_zones(values, edges, period=ANALYTICS_SAMPLE_PERIOD):
+    values = values[~np.isnan(values)]
+    zones = np.digitize(values, edges)
+    return np.bincount(zones, minlength=len(edges) + 1) * period
+
+# the best average of every window length over a uniform column, one cumulative sum for all the durations
+def power_curve(power, durations=POWER_CURVE_DURATIONS, period=ANALYTICS_SAMPLE_PERIOD):
+    power = np.nan_to_num(power)
+    cumulative = np.concatenate(([0.0], np.cumsum(power)))
+    curve = {}
+    for duration in durations:
+        length = max(1, int(round(duration / period)))
+        if length <= len(power):
+            curve[duration] = float(np.max(cumulative[length:] - cumulative[:-length]) / length)
+    return curve
+
+# the cadence histogram while pedalling, and the time spent coasting
+def cadence_histogram(cadence, edges=CADENCE_HISTOGRAM_EDGES, period=ANALYTICS_SAMPLE_PERIOD):
+    cadence = cadence[~np.isnan(cadence)]
+    counts, _ = np.histogram(cadence, bins=edges)
+    return {
+        "edges": list(edges),
+        "seconds": (counts * period).tolist(),
+        "coasting": float(np.count_nonzero(cadence < edges[0]) * period)
+    }
+
+# aerobic decoupling: how much the power per heart beat dropped from the first to the second half of the ride, in percent
+# only the points with both power and heart rate are used, a few percent is normal, more than 5% suggests fatigue
+def decoupling(power, heart_rate):
+    valid = ~np.isnan(power) & ~np.isnan(heart_rate) & (heart_rate > 0)
+    power = power[valid]
+    heart_rate = heart_rate[valid]
+    if len(power) < 2:
+        return None
+
+    half = len(power) // 2
+    first = power[:half].mean() / heart_rate[:half].mean()
+    second = power[half:].mean() / heart_rate[half:].mean()
+    if first == 0:
+        return None
+    return float((first - second) / first * 100)
+
+def mean_of(column):
+    return float(np.nanmean(column)) if np.any(~np.isnan(column)) else None
+
+# a summary of one ride, the zones need the rider's FTP and maximum heart rate
+def analyze_session(session, ftp=None, max_heart_rate=None, period=ANALYTICS_SAMPLE_PERIOD):
+    timeline, columns = session.columns(period)
+    empty = np.empty(0)
+    power = columns.get('power', empty)
+    heart_rate = columns.get('heartrate', empty)
+    cadence = columns.get('cadence', empty)
+
+    summary = {
+        "duration": len(timeline) * period,
+        "averages": {channel: mean_of(column) for channel, column in columns.items()},
+        "powerCurve": power_curve(power, period=period),
+        "cadenceHistogram": cadence_histogram(cadence, period=period),
+        "decoupling": decoupling(power, heart_rate) if len(power) and len(heart_rate) else None
+    }
+
+    if ftp:
+        summary["powerZones"] = time_in_zones(power, np.asarray(POWER_ZONE_EDGES) * ftp, period).tolist()
+    if max_heart_rate:
+        summary["heartRateZones"] = time_in_zones(heart_rate, np.asarray(HEART_RATE_ZONE_EDGES) * max_heart_rate, period).tolist()
+
+    return summary
+
+# the best power curve over many rides, e.g. a month of sessions
+def best_power_curve(sessions, durations=POWER_CURVE_DURATIONS, period=ANALYTICS_SAMPLE_PERIOD):
+    best = {}
+    for session in sessions:
+        _, columns = session.columns(period)
+        if 'power' not in columns:
+            continue
+        for duration, power in power_curve(columns['power'], durations, period).items():
+            best[duration] = max(best.get(duration, 0.0), power)
+    return best
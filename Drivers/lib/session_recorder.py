@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import mmap
+import time
+import struct
+import threading
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from lib.compact_payload import topic_channel, decode_sample, decode_batch
+from lib.constants import SESSION_FILE_MAGIC, SESSION_RECORD_FORMAT, SESSION_CHANNEL_IDS, SESSION_BUFFER_RECORDS, SESSION_FSYNC_INTERVAL, PUBLISH_BATCH_TOPIC_SUFFIX
+
+RECORD = struct.Struct(SESSION_RECORD_FORMAT)
+CHANNEL_NAMES = {channel_id: channel for channel, channel_id in SESSION_CHANNEL_IDS.items()}
+
+# records the MQTT samples of a bike to an append-only session file: a header then one fixed-width record per sample,
+# the records are appended in blocks and the file is synced every fsync_interval seconds, which wears the SD card far less than CSV lines
+class SessionRecorder:
+    def __init__(self, path, buffer_records=SESSION_BUFFER_RECORDS, fsync_interval=SESSION_FSYNC_INTERVAL, clock=time.monotonic):
+        self.path = path
+        self.buffer_records = buffer_records
+        self.fsync_interval = fsync_interval
+        self.clock = clock
+        self.buffer = bytearray()
+        self.buffered_count = 0
+        self.record_count = 0
+        self.skipped_count = 0
+        self.lock = threading.Lock()
+
+        # unbuffered, the records are buffered here and written as one block
+        self.file = open(path, 'ab', buffering=0)
+        if self.file.tell() == 0:
+            self.file.write(SESSION_FILE_MAGIC)
+        elif not has_session_header(path):
+            self.file.close()
+            raise Exception("not a session file", path)
+        self.last_sync = self.clock()
+
+    # add one sample, samples of unknown channels or with values that are not numbers are skipped
+    def record(self, timestamp, channel, value):
+        channel_id = SESSION_CHANNEL_IDS.get(channel)
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            channel_id = None
+        if channel_id is None:
+            self.skipped_count += 1
+            return
+
+        with self.lock:
+            self.buffer += RECORD.pack(timestamp, channel_id, value)
+            self.buffered_count += 1
+            self.record_count += 1
+            if self.buffered_count >= self.buffer_records:
+                self.write_buffer()
+            if self.clock() - self.last_sync >= self.fsync_interval:
+                self.sync()
+
+    # record the samples of a MQTT message in either payload encoding, a batch frame ({"speed": [{...}, ...], ...}) is recorded sample by sample
+    def record_message(self, topic_name, payload):
+        channel = topic_channel(topic_name)
+        if channel is None:
+            return
+
+        try:
+            if channel == PUBLISH_BATCH_TOPIC_SUFFIX:
+                dict_of_payload = decode_batch(payload)
+            else:
+                dict_of_payload = decode_sample(payload)
+        except ValueError:
+            # command topics carry a plain number
+            self.record(time.time(), channel, payload.decode('utf-8') if isinstance(payload, bytes) else payload)
+            return
+
+        if channel == PUBLISH_BATCH_TOPIC_SUFFIX:
+            for batch_channel, samples in dict_of_payload.items():
+                for sample in samples:
+                    self.record(sample.get("timestamp", time.time()), batch_channel, sample.get("value"))
+        elif isinstance(dict_of_payload, dict):
+            self.record(dict_of_payload.get("timestamp", time.time()), channel, dict_of_payload.get("value"))
+        else:
+            self.record(time.time(), channel, dict_of_payload)
+
+    # same signature as paho's on_message
+    def on_message(self, client, userdata, msg):
+        self.record_message(msg.topic, msg.payload)
+
+    def write_buffer(self):
+        if self.buffer:
+            self.file.write(self.buffer)
+            self.buffer = bytearray()
+            self.buffered_count = 0
+
+    def sync(self):
+        self.write_buffer()
+        os.fsync(self.file.fileno())
+        self.last_sync = self.clock()
+
+    def close(self):
+        with self.lock:
+            if self.file.closed:
+                return
+            self.sync()
+            self.file.close()
+
+def has_session_header(path):
+    with open(path, 'rb') as session_file:
+        return session_file.read(len(SESSION_FILE_MAGIC)) == SESSION_FILE_MAGIC
+
+# reads a session file through mmap, a record is unpacked only when it is accessed
+# a partly written record at the end (the recorder was killed while writing) is ignored
+class SessionReader:
+    def __init__(self, path):
+        if not has_session_header(path):
+            raise Exception("not a session file", path)
+
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        self.count = (size - len(SESSION_FILE_MAGIC)) // RECORD.size
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.count else None
+
+    def __len__(self):
+        return self.count
+
+    # (timestamp, channel, value) of the record at the given index
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("session record index out of range", index)
+
+        timestamp, channel_id, value = RECORD.unpack_from(self.map, len(SESSION_FILE_MAGIC) + index * RECORD.size)
+        return timestamp, CHANNEL_NAMES.get(channel_id), value
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self[index]
+
+    def timestamp_at(self, index):
+        return RECORD.unpack_from(self.map, len(SESSION_FILE_MAGIC) + index * RECORD.size)[0]
+
+    # the index of the first record at or after the given time, found by binary search (the records are appended in time order)
+    def find(self, timestamp):
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.timestamp_at(middle) < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+import math
+from array import array
+
+# running statistics of a sensor metric (e.g. power or speed) in constant memory:
+# count, mean and variance (Welford's algorithm), min/max and the time-weighted mean, each updated in O(1) per sample
+# the last `capacity` raw samples can optionally be kept in an array('f') ring buffer
+class StreamingStats:
+    __slots__ = ('count', 'mean', 'm2', 'minimum', 'maximum', 'last_value', 'last_time', 'weighted_sum', 'weighted_time', 'samples', 'capacity', 'next_index')
+
+    def __init__(self, capacity=0):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = None
+        self.maximum = None
+
+        # each value holds until the next sample, so the time-weighted mean is not skewed by bursts of samples
+        self.last_value = None
+        self.last_time = None
+        self.weighted_sum = 0.0
+        self.weighted_time = 0.0
+
+        self.capacity = capacity
+        self.samples = array('f', bytes(4 * capacity))
+        self.next_index = 0
+
+    def __len__(self):
+        return self.count
+
+    # add a sample, the timestamp (in seconds) is only needed for the time-weighted mean
+    def add(self, value, timestamp=None):
+        value = float(value)
+
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+        # a late sample (older than the latest one) only counts for the summary, like PowerResampler.add drops it,
+        # otherwise its value would be weighted over the next interval as if it were current
+        if timestamp is None:
+            self.last_value = value
+        elif self.last_time is None or timestamp >= self.last_time:
+            if self.last_time is not None:
+                self.weighted_sum += self.last_value * (timestamp - self.last_time)
+                self.weighted_time += timestamp - self.last_time
+            self.last_time = timestamp
+            self.last_value = value
+
+        if self.capacity:
+            self.samples[self.next_index] = value
+            self.next_index = (self.next_index + 1) % self.capacity
+
+    # the sample variance, 0 until there are two samples
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def stdev(self):
+        return math.sqrt(self.variance())
+
+    # the mean over time, the plain mean is used until the samples cover some time
+    def time_weighted_mean(self):
+        if self.weighted_time > 0:
+            return self.weighted_sum / self.weighted_time
+        return self.mean
+
+    # the duration covered by the timestamped samples, in seconds
+    def duration(self):
+        return self.weighted_time
+
+    # the raw samples kept in the ring buffer, from the oldest to the newest
+    def get_samples(self):
+        if self.count < self.capacity:
+            return self.samples[:self.count].tolist()
+        return (self.samples[self.next_index:] + self.samples[:self.next_index]).tolist()
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "stdev": self.stdev(),
+            "min": self.minimum,
+            "max": self.maximum,
+            "timeWeightedMean": self.time_weighted_mean()
+        }
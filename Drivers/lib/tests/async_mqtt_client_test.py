@@ -0,0 +1,101 @@
+import unittest
+import asyncio
+import os
+import sys
+from collections import namedtuple
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+try:
+    import paho.mqtt.client as paho
+    from async_mqtt_client import AsyncMQTTClient, reconnect_delay
+except ImportError:
+    paho = None
+
+MessageInfo = namedtuple('MessageInfo', ['rc', 'mid'])
+
+# stands in for the paho client once connected, every publish gets the next message id
+class FakePahoClient:
+    def __init__(self):
+        self.published = []
+        self.calls = []
+
+    def publish(self, topic_name, payload=None, qos=0, retain=False):
+        self.published.append((topic_name, payload, retain))
+        return MessageInfo(paho.MQTT_ERR_SUCCESS, len(self.published))
+
+    def disconnect(self):
+        self.calls.append('disconnect')
+
+    def loop_write(self):
+        self.calls.append('loop_write')
+
+@unittest.skipIf(paho is None, "paho-mqtt is not installed")
+class AsyncMQTTClientTesting(unittest.TestCase):
+    def test_reconnect_delay_backoff_and_jitter(self):
+        for attempt in range(12):
+            upper = min(60, 1 * 2 ** attempt)
+            for _ in range(50):
+                delay = reconnect_delay(attempt, min_delay=1, max_delay=60)
+                self.assertGreaterEqual(delay, 1)
+                self.assertLessEqual(delay, upper)
+
+    def test_publish_before_connect(self):
+        client = AsyncMQTTClient('broker', 'user', 'password')
+        self.assertRaises(Exception, client.publish, 'bike/000001/speed', '1')
+
+    def test_messages_are_dropped_when_the_queue_is_full(self):
+        async def run():
+            client = AsyncMQTTClient('broker', 'user', 'password', queue_size=2)
+            client.create_queue()
+            results = [client.publish('bike/000001/speed', str(value)) for value in range(3)]
+            return results, client.dropped_count, client.queue.qsize()
+
+        self.assertEqual(asyncio.run(run()), ([True, True, False], 1, 2))
+
+    def test_puback_releases_the_inflight_slot(self):
+        async def run():
+            client = AsyncMQTTClient('broker', 'user', 'password', max_inflight=2)
+            client.create_queue()
+            client.client = FakePahoClient()
+            client.connected.set()
+            sender = asyncio.get_running_loop().create_task(client.send_queued_messages())
+
+            for value in range(3):
+                client.publish('bike/000001/power', str(value), retain=value == 0)
+            await asyncio.sleep(0.01)
+            before_puback = list(client.client.published)
+
+            client.on_publish(None, None, 1)
+            await client.flush()
+            sender.cancel()
+            return before_puback, client.client.published, client.inflight_mids
+
+        before_puback, published, inflight_mids = asyncio.run(run())
+        self.assertEqual(before_puback, [('bike/000001/power', '0', True), ('bike/000001/power', '1', False)])
+        self.assertEqual(len(published), 3)
+        self.assertEqual(inflight_mids, {2, 3})
+
+    def test_disconnect_is_written_before_the_tasks_are_cancelled(self):
+        async def run():
+            client = AsyncMQTTClient('broker', 'user', 'password')
+            client.create_queue()
+            client.client = FakePahoClient()
+
+            async def task():
+                try:
+                    await asyncio.sleep(60)
+                except asyncio.CancelledError:
+                    client.client.calls.append('cancelled')
+                    raise
+
+            client.tasks = [asyncio.get_running_loop().create_task(task())]
+            await asyncio.sleep(0)
+            await client.disconnect()
+            return client.client.calls
+
+        self.assertEqual(asyncio.run(run()), ['disconnect', 'loop_write', 'cancelled'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,7 +6,7 @@ import sys
 root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.append(root_folder)
 
-from ble_helper import convert_incline_to_op_value, covert_hex_values_to_readable_string
+from ble_helper import convert_incline_to_op_value, convert_op_value_to_incline, encode_incline_op_value, decode_incline_op_value, covert_hex_values_to_readable_string, decode_indoor_bike_data, decode_heart_rate_measurement, decode_csc_measurement
 
 class ConvertInclineTesting(unittest.TestCase):
     def test_invalid_incline(self):
@@ -35,9 +35,119 @@ class ConvertInclineTesting(unittest.TestCase):
         # # -1% incline
         self.assertEqual(covert_hex_values_to_readable_string(convert_incline_to_op_value(-1)), '9dff')        
         # # -5% incline
-        self.assertEqual(covert_hex_values_to_readable_string(convert_incline_to_op_value(-5)), '00fe')
+        self.assertEqual(covert_hex_values_to_readable_string(convert_incline_to_op_value(-5)), '0dfe')
         # -10% incline
-        self.assertEqual(covert_hex_values_to_readable_string(convert_incline_to_op_value(-10)), '00fc')
+        self.assertEqual(covert_hex_values_to_readable_string(convert_incline_to_op_value(-10)), '19fc')
+
+class InclineOpValueRoundTripTesting(unittest.TestCase):
+    # every 0.5% step from -10% to 19%
+    inclines = [steps / 2 for steps in range(-20, 39)]
+
+    def test_known_op_values(self):
+        self.assertEqual(covert_hex_values_to_readable_string([0x66] + convert_incline_to_op_value(19)), '666c07')
+        self.assertEqual(covert_hex_values_to_readable_string([0x66] + convert_incline_to_op_value(0)), '660000')
+        self.assertEqual(covert_hex_values_to_readable_string([0x66] + convert_incline_to_op_value(-10)), '6619fc')
+        self.assertEqual(convert_op_value_to_incline([0x66, 0x6c, 0x07]), 19)
+        self.assertEqual(convert_op_value_to_incline([0x66, 0x00, 0x00]), 0)
+        self.assertEqual(convert_op_value_to_incline([0x66, 0x19, 0xfc]), -10)
+
+    def test_round_trip(self):
+        for incline in self.inclines:
+            op_value = convert_incline_to_op_value(incline)
+            self.assertEqual(op_value, encode_incline_op_value(incline))
+            self.assertEqual(convert_op_value_to_incline(op_value), incline)
+            self.assertEqual(decode_incline_op_value(op_value), incline)
+
+    def test_sniffed_op_values_decode_to_half_percent_steps(self):
+        sniffed_file = os.path.join(os.path.dirname(root_folder), 'kickr_climb_and_smart_trainer', 'sample_data', 'sample_sniffed_values_for_incline.txt')
+        with open(sniffed_file, 'r') as sniffed:
+            for line in sniffed:
+                if line.startswith('Value: '):
+                    op_value = bytes.fromhex(line[len('Value: '):].split('=>')[0].replace(' ', ''))
+                    self.assertIn(convert_op_value_to_incline(op_value), self.inclines)
+
+    def test_rounds_to_the_nearest_step(self):
+        self.assertEqual(convert_incline_to_op_value(2.4), convert_incline_to_op_value(2.5))
+        self.assertEqual(convert_incline_to_op_value(-0.6), convert_incline_to_op_value(-0.5))
+
+    def test_invalid_op_value(self):
+        self.assertRaises(Exception, convert_op_value_to_incline, [0x66, 0x01, 0x00])
+
+class DecodeIndoorBikeDataTesting(unittest.TestCase):
+    def test_decode_kickr_speed_cadence_and_power(self):
+        # flags 0x0044: instantaneous speed 36 km/h, cadence 90 (in 0.1 unit), power 250 W
+        record = decode_indoor_bike_data(bytes.fromhex('4400100e8403fa00'))
+        self.assertEqual(record.flags, 0x0044)
+        self.assertAlmostEqual(record.instantaneous_speed, 10.0)
+        self.assertAlmostEqual(record.instantaneous_cadence, 90.0)
+        self.assertEqual(record.instantaneous_power, 250)
+        self.assertIsNone(record.average_speed)
+        self.assertIsNone(record.heart_rate)
+
+    def test_decode_all_fields(self):
+        # flags 0x1fff: every field except the instantaneous speed ("More Data" bit set)
+        record = decode_indoor_bike_data(bytes.fromhex('ff1f' + '2003' + '8403' + '8403' + '102700' + '0a00' + 'fa00' + 'c800' + 'ffff' + '6400' + 'ff' + '8c' + '32' + '3c00' + 'b004'))
+        self.assertIsNone(record.instantaneous_speed)
+        self.assertAlmostEqual(record.average_speed, 8 * 100 / 360)
+        self.assertAlmostEqual(record.average_cadence, 90.0)
+        self.assertEqual(record.total_distance, 10000)
+        self.assertEqual(record.resistance_level, 10)
+        self.assertEqual(record.average_power, 200)
+        self.assertIsNone(record.expended_energy_total)
+        self.assertEqual(record.expended_energy_per_hour, 100)
+        self.assertIsNone(record.expended_energy_per_minute)
+        self.assertEqual(record.heart_rate, 140)
+        self.assertAlmostEqual(record.metabolic_equivalent, 5.0)
+        self.assertEqual(record.elapsed_time, 60)
+        self.assertEqual(record.remaining_time, 1200)
+
+    def test_decode_uint24_total_distance(self):
+        # flags 0x0011: only the total distance
+        self.assertEqual(decode_indoor_bike_data(bytes.fromhex('1100010203')).total_distance, 0x030201)
+
+    def test_decode_dbus_like_byte_list(self):
+        self.assertEqual(decode_indoor_bike_data([0x44, 0x00, 0x10, 0x0e, 0x84, 0x03, 0xfa, 0x00]).instantaneous_power, 250)
+
+    def test_invalid_payload_length(self):
+        self.assertRaises(ValueError, decode_indoor_bike_data, bytes.fromhex('4400100e8403'))
+        self.assertRaises(ValueError, decode_indoor_bike_data, bytes.fromhex('44'))
+
+class DecodeHeartRateMeasurementTesting(unittest.TestCase):
+    def test_decode_8_bit_heart_rate(self):
+        # flags 0x06: contact reported and detected, 72 BPM
+        self.assertEqual(decode_heart_rate_measurement(bytes.fromhex('0648')), (72, True, None, ()))
+        self.assertEqual(decode_heart_rate_measurement([0x00, 0x48]), (72, None, None, ()))
+
+    def test_decode_rr_intervals(self):
+        # flags 0x14: contact reported but not detected, 150 BPM, RR intervals of 410/1024 s and 420/1024 s
+        self.assertEqual(decode_heart_rate_measurement(bytes.fromhex('1496' + '9a01' + 'a401')), (150, False, None, (410, 420)))
+
+    def test_decode_16_bit_heart_rate_and_energy(self):
+        # flags 0x19: 16 bit heart rate 300, energy expended 500 kJ, one RR interval of 1024/1024 s
+        self.assertEqual(decode_heart_rate_measurement(bytes.fromhex('19' + '2c01' + 'f401' + '0004')), (300, None, 500, (1024,)))
+
+    def test_invalid_payload_length(self):
+        self.assertRaises(ValueError, decode_heart_rate_measurement, bytes.fromhex('06'))
+        self.assertRaises(ValueError, decode_heart_rate_measurement, bytes.fromhex('0148'))
+        self.assertRaises(ValueError, decode_heart_rate_measurement, bytes.fromhex('08480a'))
+        self.assertRaises(ValueError, decode_heart_rate_measurement, bytes.fromhex('10489a01a4'))
+
+class DecodeCSCMeasurementTesting(unittest.TestCase):
+    def test_decode_crank_data(self):
+        # flags 0x02: 300 crank revolutions, last event at 2048/1024 s
+        self.assertEqual(tuple(decode_csc_measurement(bytes.fromhex('022c010008'))), (None, None, 300, 2048))
+
+    def test_decode_wheel_and_crank_data(self):
+        measurement = decode_csc_measurement([0x03, 0x10, 0x27, 0x00, 0x00, 0x00, 0x04, 0xff, 0xff, 0x01, 0x00])
+        self.assertEqual((measurement.wheel_revolutions, measurement.last_wheel_event_time), (10000, 1024))
+        self.assertEqual((measurement.crank_revolutions, measurement.last_crank_event_time), (65535, 1))
+
+    def test_reserved_flags_are_ignored(self):
+        self.assertEqual(decode_csc_measurement(bytes.fromhex('fe2c010008')).crank_revolutions, 300)
+
+    def test_invalid_payload_length(self):
+        self.assertRaises(ValueError, decode_csc_measurement, b'')
+        self.assertRaises(ValueError, decode_csc_measurement, bytes.fromhex('022c0100'))
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,128 @@
+import unittest
+import os
+import sys
+import tempfile
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+import fake_gatt
+from ble_replay import ReplayFrame, LocalMQTTSink, Replayer, create_replay_device, load_capture, percentile
+from constants import BLE_RECONNECT_DELAY
+
+# the Kickr driver imports lib.mqtt_client, which needs paho-mqtt
+try:
+    import paho.mqtt.client as paho
+except ImportError:
+    paho = None
+
+SAMPLE_FRAMES = os.path.join(os.path.dirname(root_folder), 'kickr_climb_and_smart_trainer', 'sample_data', 'indoor_bike_data_sample_frames.txt')
+
+# publishes the first byte of every notification, and writes to the control point once its notifications are enabled
+class EchoDevice(fake_gatt.Device):
+    def __init__(self, mac_address, manager, sink):
+        super().__init__(mac_address, manager)
+        self.sink = sink
+        self.events = []
+
+    def services_resolved(self):
+        super().services_resolved()
+        self.services[0].characteristics[0].enable_notifications()
+
+    def characteristic_enable_notifications_succeeded(self, characteristic):
+        self.events.append('enabled')
+        characteristic.write_value(b'\x00')
+
+    def characteristic_write_value_succeeded(self, characteristic):
+        self.events.append('written')
+
+    def characteristic_value_updated(self, characteristic, value):
+        self.sink.publish('bike/replay/value', str(value[0]))
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, delay):
+        self.sleeps.append(delay)
+        self.now += delay
+
+# keeps the delayed callbacks instead of running them, so a test can check what was scheduled
+class RecordingScheduler:
+    def __init__(self):
+        self.delayed = []
+
+    def call_soon(self, callback):
+        callback()
+
+    def call_later(self, delay, callback):
+        self.delayed.append((delay, callback))
+
+    def cancel(self, handle):
+        pass
+
+class BLEReplayTesting(unittest.TestCase):
+    def setUp(self):
+        self.sink = LocalMQTTSink()
+        self.manager = fake_gatt.DeviceManager()
+        self.manager.add_device('00:00:00:00:00:01', {0x1826: {0x2ad2: None, 0x2ad6: b'\x00\x00'}})
+        self.device = EchoDevice('00:00:00:00:00:01', self.manager, self.sink)
+        self.device.connect()
+
+    def test_fake_device_resolves_its_profile(self):
+        self.manager.run()
+        self.assertTrue(self.device.is_connected())
+        characteristics = self.device.services[0].characteristics
+        self.assertEqual(self.device.services[0].uuid, '00001826-0000-1000-8000-00805f9b34fb')
+        self.assertEqual(characteristics[1].read_value(), bytearray(b'\x00\x00'))
+        self.assertEqual(self.device.events, ['enabled', 'written'])
+        self.assertEqual(characteristics[0].written, [b'\x00'])
+
+    def test_replay_at_maximum_speed(self):
+        frames = [ReplayFrame(0.0, 0x2ad2, b'\x01'), ReplayFrame(0.5, '00002ad2-0000-1000-8000-00805f9b34fb', b'\x02'), ReplayFrame(1.0, 0x2a37, b'\x03')]
+        result = Replayer(self.device, frames, speed=0, sink=self.sink).run()
+
+        self.assertEqual(self.sink.messages, [('bike/replay/value', '1'), ('bike/replay/value', '2')])
+        self.assertEqual((result.frame_count, result.skipped_count, result.publish_count), (2, 1, 2))
+        self.assertEqual(len(result.publish_latencies), 2)
+        self.assertEqual(set(result.latency_percentiles()), {50, 95, 99})
+
+    def test_replay_keeps_the_captured_pace(self):
+        clock = FakeClock()
+        frames = [ReplayFrame(10.0, 0x2ad2, b'\x01'), ReplayFrame(10.5, 0x2ad2, b'\x02'), ReplayFrame(12.0, 0x2ad2, b'\x03')]
+        result = Replayer(self.device, frames, speed=2, sink=self.sink, clock=clock, sleep=clock.sleep).run()
+        self.assertEqual(clock.sleeps, [0.25, 0.75])
+        self.assertEqual(result.elapsed, 1.0)
+        self.assertEqual(result.frames_per_second(), 3)
+
+    def test_load_capture(self):
+        frames = load_capture(SAMPLE_FRAMES, 0x2ad2)
+        self.assertEqual(frames[1], ReplayFrame(0.25, 0x2ad2, bytes.fromhex('4400aa0028000a00')))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'capture.txt')
+            with open(path, 'w') as capture_file:
+                capture_file.write("# heart rate\n0.0 2a37 0048\n")
+            self.assertEqual(load_capture(path, 0x2ad2), [ReplayFrame(0.0, '2a37', b'\x00\x48')])
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual((percentile(values, 50), percentile(values, 95), percentile(values, 99)), (50, 95, 99))
+        self.assertEqual(percentile([7], 99), 7)
+        self.assertIsNone(percentile([], 50))
+
+    @unittest.skipIf(paho is None, "paho-mqtt is not installed")
+    def test_kickr_retries_a_failed_connection(self):
+        device = create_replay_device('kickr', self.sink)
+        device.scheduler = RecordingScheduler()
+        device.connect_failed(Exception("le-connection-abort-by-local"))
+
+        self.assertFalse(device.is_connected())
+        self.assertEqual(device.scheduler.delayed, [(BLE_RECONNECT_DELAY, device.connect)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+import json
+import os
+import sys
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from compact_payload import JSONPayloadEncoder, CompactPayloadEncoder, create_payload_encoder, decode_sample, decode_samples, decode_batch, decode_frames, batch_topic, descriptor_topic, is_compact_payload
+from mqtt_batch_publisher import build_batch_payload
+
+class FakeMQTTClient:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, topic_name, payload, retain=False):
+        self.published.append((topic_name, payload, retain))
+
+class CompactPayloadTesting(unittest.TestCase):
+    def setUp(self):
+        self.mqtt_client = FakeMQTTClient()
+        self.encoder = CompactPayloadEncoder(self.mqtt_client, device_name='bike-pi')
+
+    def test_json_payload(self):
+        payload = JSONPayloadEncoder(device_name='bike-pi').encode('bike/000001/speed', 'm/s', 5.2, 1700000000.5)
+        self.assertEqual(json.loads(payload), {"value": 5.2, "unitName": "m/s", "timestamp": 1700000000.5, "metadata": {"deviceName": "bike-pi"}})
+        self.assertEqual(decode_sample(payload), json.loads(payload))
+
+    def test_cached_json_payload_is_the_same_as_json_dumps(self):
+        encoder = JSONPayloadEncoder(device_name='bike "01"')
+        for unit_name, value, timestamp in (('m/s', 8.277777777777779, 1700000000.123456), ('W', 212, 1700000000), ('BPM', float('nan'), 1.0), ('percentage', None, 1e-7), ('RPM', True, 2.5)):
+            expected = json.dumps({"value": value, "unitName": unit_name, "timestamp": timestamp, "metadata": {"deviceName": 'bike "01"'}})
+            self.assertEqual(encoder.encode('bike/000001/speed', unit_name, value, timestamp), expected)
+
+    def test_compact_frames_round_trip(self):
+        payload = self.encoder.encode('bike/000001/speed', 'm/s', 5.2, 1700000000.5)
+        self.assertEqual(len(payload), 14)
+        self.assertTrue(is_compact_payload(payload))
+        self.assertEqual(decode_sample(payload), {"value": 5.2, "timestamp": 1700000000.5})
+        self.assertEqual(decode_frames(self.encoder.encode('bike/000001/power', 'W', 250, 1700000001.0)), [('power', 1700000001.0, 250.0)])
+
+    def test_descriptor_is_retained_once_per_topic(self):
+        for value in (1, 2, 3):
+            self.encoder.encode('bike/000001/heartrate', 'BPM', value, 1700000000.0)
+
+        self.assertEqual(len(self.mqtt_client.published), 1)
+        topic_name, payload, retain = self.mqtt_client.published[0]
+        self.assertEqual(topic_name, 'bike/000001/descriptor/heartrate')
+        self.assertTrue(retain)
+        descriptor = json.loads(payload)
+        self.assertEqual((descriptor['channel'], descriptor['unitName'], descriptor['metadata']), ('heartrate', 'BPM', {"deviceName": "bike-pi"}))
+
+    def test_topics_without_a_channel_id_stay_json(self):
+        payload = self.encoder.encode('bike/000001/hrv', 'ms', 10, 1700000000.0)
+        self.assertEqual(json.loads(payload)['value'], 10)
+        self.assertEqual(self.mqtt_client.published, [])
+
+    def test_kickr_report_topics_have_a_channel_id(self):
+        # the report topics of scripts/start_kickr.sh and lib.ble_hub.kickr_args
+        for topic_name in ('bike/000001/resistance', 'bike/000001/incline'):
+            self.assertEqual(decode_frames(self.encoder.encode(topic_name, 'percentage', 10, 1.0)), [(topic_name.split('/')[2], 1.0, 10.0)])
+
+    def test_batch_frames(self):
+        speed = [self.encoder.encode('bike/000001/speed', 'm/s', value, 10.0 + value) for value in (1, 2)]
+        power = [self.encoder.encode('bike/000001/power', 'W', 120, 11.0)]
+        batch = decode_batch(build_batch_payload({'speed': speed, 'power': power}))
+        self.assertEqual(batch, {'speed': [{"value": 1.0, "timestamp": 11.0}, {"value": 2.0, "timestamp": 12.0}], 'power': [{"value": 120.0, "timestamp": 11.0}]})
+        self.assertEqual(decode_batch('{"speed": [{"value": 1}]}'), {'speed': [{"value": 1}]})
+
+    def test_batch_frames_are_split_into_channel_topics(self):
+        speed = [self.encoder.encode('bike/000001/speed', 'm/s', value, 10.0 + value) for value in (1, 2)]
+        power = [self.encoder.encode('bike/000001/power', 'W', 120, 11.0)]
+        self.assertEqual(decode_samples('bike/000001/batch', build_batch_payload({'speed': speed, 'power': power})), [
+            ('bike/000001/speed', {"value": 1.0, "timestamp": 11.0}), ('bike/000001/speed', {"value": 2.0, "timestamp": 12.0}),
+            ('bike/000001/power', {"value": 120.0, "timestamp": 11.0})])
+        self.assertEqual(decode_samples('bike/000001/batch', '{"speed": [{"value": 1}]}'), [('bike/000001/speed', {"value": 1})])
+        self.assertEqual(decode_samples('bike/000001/speed', speed[0]), [('bike/000001/speed', {"value": 1.0, "timestamp": 11.0})])
+        self.assertEqual(batch_topic('bike/000001/speed'), 'bike/000001/batch')
+
+    def test_invalid_compact_payload(self):
+        payload = self.encoder.encode('bike/000001/speed', 'm/s', 5.2, 1.0)
+        self.assertRaises(ValueError, decode_sample, payload[:-1])
+        self.assertRaises(ValueError, decode_frames, payload + b'\x00' * len(payload))
+
+    def test_descriptor_topic(self):
+        self.assertEqual(descriptor_topic('bike/000001/incline/report'), 'bike/000001/descriptor/incline/report')
+
+    def test_create_payload_encoder(self):
+        self.assertIsInstance(create_payload_encoder('json'), JSONPayloadEncoder)
+        self.assertIsInstance(create_payload_encoder('compact', self.mqtt_client), CompactPayloadEncoder)
+        self.assertRaises(Exception, create_payload_encoder, 'cbor')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+import os
+import sys
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from ble_helper import CSCMeasurement
+from csc import CSCCalculator
+
+def crank(revolutions, event_time):
+    return CSCMeasurement(None, None, revolutions & 0xFFFF, event_time & 0xFFFF)
+
+class CSCCalculatorTesting(unittest.TestCase):
+    def setUp(self):
+        self.calculator = CSCCalculator(smoothing_events=4, stop_timeout=3)
+
+    # one crank revolution every `period` 1/1024 s, notified once a second
+    def pedal(self, revolutions, event_time, timestamp, period, count):
+        cadences = []
+        for _ in range(count):
+            revolutions += 1
+            event_time += period
+            timestamp += 1
+            cadences.append(self.calculator.update(crank(revolutions, event_time), timestamp)[0])
+        return revolutions, event_time, timestamp, cadences
+
+    def test_steady_cadence(self):
+        self.assertEqual(self.calculator.update(crank(0, 0), 0), (None, None))
+        _, _, _, cadences = self.pedal(0, 0, 0, 683, 6)
+        for cadence in cadences:
+            self.assertAlmostEqual(cadence, 60 * 1024 / 683)
+
+    def test_counters_rolling_over(self):
+        self.calculator.update(crank(65534, 65000), 0)
+        # 2 revolutions in 1024/1024 s across both rollovers
+        cadence, _ = self.calculator.update(crank(65536, 65000 + 1024), 1)
+        self.assertAlmostEqual(cadence, 120.0)
+
+    def test_smoothing_over_the_last_events(self):
+        self.calculator.update(crank(0, 0), 0)
+        revolutions, event_time, timestamp, _ = self.pedal(0, 0, 0, 1024, 4)
+        _, _, _, cadences = self.pedal(revolutions, event_time, timestamp, 512, 4)
+        # 60 rpm then 120 rpm, the average of the events in the window
+        self.assertAlmostEqual(cadences[0], 60 * 4 / 3.5)
+        self.assertAlmostEqual(cadences[-1], 120.0)
+
+    def test_repeated_event_keeps_the_cadence_until_the_stop_timeout(self):
+        self.calculator.update(crank(0, 0), 0)
+        revolutions, event_time, timestamp, _ = self.pedal(0, 0, 0, 1024, 2)
+        self.assertAlmostEqual(self.calculator.update(crank(revolutions, event_time), timestamp + 1)[0], 60.0)
+        self.assertEqual(self.calculator.update(crank(revolutions, event_time), timestamp + 3)[0], 0.0)
+
+        # the first revolution after the stop covers the whole pause
+        self.assertIsNone(self.calculator.update(crank(revolutions + 1, event_time + 5 * 1024), timestamp + 5)[0])
+        self.assertAlmostEqual(self.calculator.update(crank(revolutions + 2, event_time + 6 * 1024), timestamp + 6)[0], 60.0)
+
+    def test_implausible_cadence_is_dropped(self):
+        self.calculator.update(crank(0, 0), 0)
+        self.assertIsNone(self.calculator.update(crank(50, 1024), 1)[0])
+        self.assertAlmostEqual(self.calculator.update(crank(51, 2048), 2)[0], 60.0)
+
+    def test_wheel_speed(self):
+        calculator = CSCCalculator(wheel_circumference=2.0)
+        calculator.update(CSCMeasurement(0xFFFFFFFE, 0, None, None), 0)
+        cadence, speed = calculator.update(CSCMeasurement(3, 1024, None, None), 1)
+        self.assertIsNone(cadence)
+        self.assertAlmostEqual(speed, 10.0)
+
+if __name__ == '__main__':
+    unittest.main()
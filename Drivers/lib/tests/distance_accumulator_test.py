@@ -0,0 +1,60 @@
+import unittest
+import csv
+import os
+import sys
+import tempfile
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from distance_accumulator import DistanceAccumulator, parse_speed_payload, parse_speed_samples
+
+class DistanceAccumulatorTesting(unittest.TestCase):
+    def test_trapezoidal_distance(self):
+        accumulator = DistanceAccumulator()
+        accumulator.add_sample(10, 0)
+        self.assertEqual(accumulator.get_distance(), 0)
+
+        # 10 -> 20 km/h over one hour is 15 km, then 20 km/h for half an hour is 10 km
+        accumulator.add_sample(20, 3600)
+        accumulator.add_sample(20, 5400)
+        self.assertAlmostEqual(accumulator.get_distance(), 25)
+        self.assertEqual(accumulator.sample_count, 3)
+
+    def test_late_samples_are_skipped(self):
+        accumulator = DistanceAccumulator()
+        accumulator.add_sample(36, 10)
+        accumulator.add_sample(36, 20)
+        accumulator.add_sample(100, 15)
+        accumulator.add_sample(100, 20)
+        self.assertAlmostEqual(accumulator.get_distance(), 0.1)
+        self.assertEqual(accumulator.sample_count, 2)
+
+    def test_buffered_csv_log(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        log_file = os.path.join(directory.name, 'speed_data.csv')
+
+        accumulator = DistanceAccumulator(log_file=log_file, buffer_rows=2)
+        accumulator.add_sample(5.5, 1)
+        self.assertFalse(os.path.exists(log_file))
+        accumulator.add_sample(6, 2)
+        accumulator.add_sample(6.5, 3)
+        accumulator.close()
+
+        with open(log_file, 'r') as csvfile:
+            self.assertEqual([[float(v) for v in row] for row in csv.reader(csvfile)], [[1, 5.5], [2, 6], [3, 6.5]])
+
+    def test_parse_speed_payload(self):
+        self.assertEqual(parse_speed_payload('{"value": 5.2, "unitName": "m/s", "timestamp": 1700000000.5}'), (5.2, 1700000000.5))
+        speed, timestamp = parse_speed_payload('{"value": 3}')
+        self.assertEqual(speed, 3.0)
+        self.assertIsInstance(timestamp, float)
+
+    def test_parse_speed_samples_of_a_batch(self):
+        batch = '{"speed": [{"value": 5, "timestamp": 1.0}, {"value": 6, "timestamp": 2.0}], "power": [{"value": 120, "timestamp": 1.5}]}'
+        self.assertEqual(parse_speed_samples('bike/000001/batch', batch), [(5.0, 1.0), (6.0, 2.0)])
+        self.assertEqual(parse_speed_samples('bike/000001/speed', '{"value": 5.2, "timestamp": 3.0}'), [(5.2, 3.0)])
+
+if __name__ == '__main__':
+    unittest.main()
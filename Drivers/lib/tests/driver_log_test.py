@@ -0,0 +1,72 @@
+import unittest
+import io
+import os
+import sys
+import logging
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from driver_log import DriverLogger, parse_levels
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+class DriverLoggerTesting(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.log = DriverLogger('test', rate_limit=2, rate_window=10, summary_interval=60, clock=self.clock)
+        self.output = io.StringIO()
+        handler = logging.StreamHandler(self.output)
+        handler.setFormatter(logging.Formatter('%(levelname)s %(message)s'))
+        self.log.logger.addHandler(handler)
+        self.log.logger.propagate = False
+        self.log.logger.setLevel(logging.INFO)
+        self.addCleanup(self.log.logger.removeHandler, handler)
+
+    def lines(self):
+        return self.output.getvalue().splitlines()
+
+    def test_levels(self):
+        self.log.debug("hidden %d", 1)
+        self.log.info("shown %d", 2)
+        self.assertEqual(self.lines(), ['INFO shown 2'])
+
+    def test_sampled(self):
+        for frame in range(7):
+            self.log.sampled(logging.INFO, 'frame', 3, "frame %d", frame)
+        self.assertEqual(self.lines(), ['INFO frame 0 (1 of every 3)', 'INFO frame 3 (1 of every 3)', 'INFO frame 6 (1 of every 3)'])
+
+    def test_limited(self):
+        for _ in range(5):
+            self.log.limited(logging.WARNING, 'idle', "idle")
+        self.assertEqual(self.lines(), ['WARNING idle', 'WARNING idle'])
+
+        self.clock.now = 10
+        self.log.limited(logging.WARNING, 'idle', "idle")
+        self.assertEqual(self.lines()[-1], 'WARNING idle (3 similar messages suppressed)')
+
+    def test_counter_summary(self):
+        self.log.count('frames')
+        self.log.count('frames', 2)
+        self.log.count('idle')
+        self.assertEqual(self.lines(), [])
+
+        self.clock.now = 60
+        self.log.count('frames')
+        self.assertEqual(self.lines(), ['INFO frames=4, idle=1 in the last 60 seconds'])
+
+        self.clock.now = 120
+        self.log.log_summary()
+        self.assertEqual(len(self.lines()), 1)
+
+    def test_parse_levels(self):
+        self.assertEqual(parse_levels('kickr=debug, mqtt=WARNING'), {'kickr': 'DEBUG', 'mqtt': 'WARNING'})
+        self.assertEqual(parse_levels(None), {})
+
+if __name__ == '__main__':
+    unittest.main()
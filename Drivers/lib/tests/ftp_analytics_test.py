@@ -0,0 +1,62 @@
+import unittest
+import os
+import sys
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from ftp_analytics import PowerResampler, resample, rolling_best, normalized_power, training_stress_score, estimate_ftp, analyze_power
+
+class FTPAnalyticsTesting(unittest.TestCase):
+    def test_resample_holds_the_latest_sample(self):
+        # a burst of samples, then a 2.5 second gap
+        samples = [(100.0, 150), (100.2, 160), (100.4, 170), (102.9, 200), (104.0, 210)]
+        self.assertEqual(list(resample(samples, max_gap=5)), [150, 170, 170, 200, 210])
+
+    def test_resample_counts_dropouts_as_zero(self):
+        samples = [(0, 200), (1, 200), (10, 250)]
+        self.assertEqual(list(resample(samples, max_gap=3)), [200, 200, 200, 200, 200, 0, 0, 0, 0, 0, 250])
+
+    def test_resampler_ignores_late_samples(self):
+        resampler = PowerResampler(max_gap=5)
+        resampler.add(0, 100)
+        resampler.add(2, 200)
+        resampler.add(1, 900)
+        self.assertEqual(list(resampler.get_series()), [100, 100, 200])
+        resampler.add(3, 300)
+        self.assertEqual(list(resampler.get_series()), [100, 100, 200, 300])
+
+    def test_rolling_best(self):
+        series = [100] * 60 + [400] * 5 + [200] * 60
+        best = rolling_best(series, (5, 60, 300))
+        self.assertEqual(best[5], 400)
+        self.assertAlmostEqual(best[60], (400 * 5 + 200 * 55) / 60)
+        self.assertIsNone(best[300])
+
+    def test_normalized_power(self):
+        self.assertAlmostEqual(normalized_power([250] * 120), 250)
+        # a variable ride has a higher normalized power than its average power
+        series = ([100] * 60 + [300] * 60) * 5
+        self.assertGreater(normalized_power(series), sum(series) / len(series))
+        self.assertEqual(normalized_power([]), 0)
+
+    def test_an_hour_at_ftp_is_100_tss(self):
+        self.assertAlmostEqual(training_stress_score(3600, 250, 250), 100)
+
+    def test_estimate_ftp(self):
+        series = [150] * 300 + [260] * 1200 + [100] * 300
+        self.assertAlmostEqual(estimate_ftp(series), 260 * 0.95)
+        # a shorter test uses the average of the whole test
+        self.assertAlmostEqual(estimate_ftp([200] * 600), 190)
+        self.assertEqual(estimate_ftp([]), 0)
+
+    def test_analyze_power(self):
+        summary = analyze_power([200] * 3600, ftp=200)
+        self.assertEqual(summary["duration"], 3600)
+        self.assertAlmostEqual(summary["intensityFactor"], 1)
+        self.assertAlmostEqual(summary["trainingStressScore"], 100)
+        self.assertEqual(summary["bestPower"][1200], 200)
+        self.assertNotIn("intensityFactor", analyze_power([200] * 10))
+
+if __name__ == '__main__':
+    unittest.main()
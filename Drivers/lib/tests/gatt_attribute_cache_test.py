@@ -0,0 +1,80 @@
+import unittest
+import os
+import sys
+import tempfile
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from gatt_attribute_cache import GattAttributeCache, get_cached_value
+
+class FakeCharacteristic:
+    def __init__(self, uuid, value):
+        self.uuid = uuid
+        self.value = value
+        self.read_count = 0
+
+    def read_value(self):
+        self.read_count += 1
+        return self.value
+
+class FakeService:
+    def __init__(self, uuid, characteristics):
+        self.uuid = uuid
+        self.characteristics = characteristics
+
+class GattAttributeCacheTesting(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'cache.json')
+
+        self.resistance_level_range = FakeCharacteristic('00002ad6-0000-1000-8000-00805f9b34fb', [0, 0, 100, 0, 1, 0])
+        self.indoor_bike_data = FakeCharacteristic('00002ad2-0000-1000-8000-00805f9b34fb', None)
+        self.services = [FakeService('00001826-0000-1000-8000-00805f9b34fb', [self.resistance_level_range, self.indoor_bike_data])]
+
+    def test_reads_on_the_first_connection_and_uses_the_cache_afterwards(self):
+        attribute_table, cached = GattAttributeCache(self.path).get_or_read('D9:07:E8:1C:DB:94', '4.2.1', self.services)
+        self.assertFalse(cached)
+        self.assertEqual(self.resistance_level_range.read_count, 1)
+        self.assertEqual(get_cached_value(attribute_table, self.resistance_level_range), [0, 0, 100, 0, 1, 0])
+        self.assertIsNone(get_cached_value(attribute_table, self.indoor_bike_data))
+
+        # a new process loads the cache from the file
+        attribute_table, cached = GattAttributeCache(self.path).get_or_read('d9:07:e8:1c:db:94', '4.2.1', self.services)
+        self.assertTrue(cached)
+        self.assertEqual(self.resistance_level_range.read_count, 1)
+        self.assertEqual(get_cached_value(attribute_table, self.resistance_level_range), [0, 0, 100, 0, 1, 0])
+
+    def test_reads_again_after_a_firmware_update(self):
+        GattAttributeCache(self.path).get_or_read('d9:07:e8:1c:db:94', '4.2.1', self.services)
+        _, cached = GattAttributeCache(self.path).get_or_read('d9:07:e8:1c:db:94', '4.3.0', self.services)
+        self.assertFalse(cached)
+        self.assertEqual(self.resistance_level_range.read_count, 2)
+
+    def test_reads_every_time_without_a_firmware_revision(self):
+        for _ in range(2):
+            _, cached = GattAttributeCache(self.path).get_or_read('d9:07:e8:1c:db:94', None, self.services)
+            self.assertFalse(cached)
+        self.assertEqual(self.resistance_level_range.read_count, 2)
+        self.assertFalse(os.path.exists(self.path))
+
+        # an entry cached without a firmware revision by an older version is not used either
+        cache = GattAttributeCache(self.path)
+        cache.entries['d9:07:e8:1c:db:94'] = {'firmware_revision': None, 'attributes': {'00001826-0000-1000-8000-00805f9b34fb': {
+            '00002ad6-0000-1000-8000-00805f9b34fb': '000064000100', '00002ad2-0000-1000-8000-00805f9b34fb': None}}}
+        self.assertIsNone(cache.get('d9:07:e8:1c:db:94', None, self.services))
+
+    def test_reads_again_when_the_attributes_changed(self):
+        GattAttributeCache(self.path).get_or_read('d9:07:e8:1c:db:94', '4.2.1', self.services)
+        self.services[0].characteristics.append(FakeCharacteristic('00002ad9-0000-1000-8000-00805f9b34fb', None))
+        _, cached = GattAttributeCache(self.path).get_or_read('d9:07:e8:1c:db:94', '4.2.1', self.services)
+        self.assertFalse(cached)
+
+    def test_ignores_a_broken_cache_file(self):
+        with open(self.path, 'w') as cache_file:
+            cache_file.write('{not json')
+        self.assertEqual(GattAttributeCache(self.path).entries, {})
+
+if __name__ == '__main__':
+    unittest.main()
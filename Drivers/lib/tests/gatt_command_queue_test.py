@@ -0,0 +1,112 @@
+import unittest
+import os
+import sys
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from gatt_command_queue import GattCommandQueue
+
+# runs the queued callbacks straight away and lets the test fire the timeouts
+class FakeScheduler:
+    def __init__(self):
+        self.timers = {}
+        self.next_handle = 0
+
+    def call_soon(self, callback):
+        callback()
+
+    def call_later(self, delay, callback):
+        self.next_handle += 1
+        self.timers[self.next_handle] = callback
+        return self.next_handle
+
+    def cancel(self, handle):
+        del self.timers[handle]
+
+    def fire_timers(self):
+        for handle, callback in list(self.timers.items()):
+            del self.timers[handle]
+            callback()
+
+class FakeCharacteristic:
+    def __init__(self, uuid):
+        self.uuid = uuid
+        self.sent = []
+
+    def write_value(self, value):
+        self.sent.append(bytes(value))
+
+    def enable_notifications(self):
+        self.sent.append('enable_notifications')
+
+class GattCommandQueueTesting(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = FakeScheduler()
+        self.queue = GattCommandQueue('test', scheduler=self.scheduler, timeout=1, retries=1)
+        self.control_point = FakeCharacteristic('00002ad9-0000-1000-8000-00805f9b34fb')
+        self.results = []
+
+    def test_sends_the_next_command_only_after_the_previous_one_succeeded(self):
+        self.queue.write_value(self.control_point, bytearray([0x00]), on_success=lambda: self.results.append('control'))
+        self.queue.write_value(self.control_point, bytearray([0x04, 10]), on_success=lambda: self.results.append('resistance'))
+        self.assertEqual(self.control_point.sent, [b'\x00'])
+
+        self.queue.command_succeeded(self.control_point)
+        self.assertEqual(self.control_point.sent, [b'\x00', b'\x04\x0a'])
+        self.assertEqual(self.results, ['control'])
+
+        self.queue.command_succeeded(self.control_point)
+        self.assertEqual(self.results, ['control', 'resistance'])
+        self.assertTrue(self.queue.is_idle())
+        self.assertEqual(self.scheduler.timers, {})
+
+    def test_retries_a_failed_command_then_gives_up(self):
+        self.queue.write_value(self.control_point, bytearray([0x01]), on_failure=lambda: self.results.append('failed'))
+        self.queue.enable_notifications(self.control_point, on_success=lambda: self.results.append('enabled'))
+
+        self.queue.command_failed(self.control_point, 'error')
+        self.assertEqual(self.control_point.sent, [b'\x01', b'\x01'])
+
+        self.queue.command_failed(self.control_point, 'error')
+        self.assertEqual(self.results, ['failed'])
+        self.assertEqual(self.control_point.sent[-1], 'enable_notifications')
+
+        self.queue.command_succeeded(self.control_point)
+        self.assertEqual(self.results, ['failed', 'enabled'])
+
+    def test_retries_a_timed_out_command(self):
+        self.queue.write_value(self.control_point, bytearray([0x00]), on_failure=lambda: self.results.append('failed'))
+
+        self.scheduler.fire_timers()
+        self.assertEqual(self.control_point.sent, [b'\x00', b'\x00'])
+
+        self.scheduler.fire_timers()
+        self.assertEqual(self.results, ['failed'])
+        self.assertTrue(self.queue.is_idle())
+
+    def test_ignores_callbacks_for_other_characteristics(self):
+        other = FakeCharacteristic('a026e0370a7d4ab397faf1500f9feb8b')
+        self.queue.write_value(self.control_point, bytearray([0x00]), on_success=lambda: self.results.append('control'))
+
+        self.queue.command_succeeded(other)
+        self.assertEqual(self.results, [])
+
+    def test_coalesces_pending_commands_with_the_same_key(self):
+        incline = FakeCharacteristic('a026e0370a7d4ab397faf1500f9feb8b')
+        self.queue.write_value(self.control_point, bytearray([0x04, 10]), on_success=lambda: self.results.append(10), key='resistance')
+        for value in (20, 30, 40):
+            self.queue.write_value(self.control_point, bytearray([0x04, value]), on_success=lambda value=value: self.results.append(value), key='resistance')
+        self.queue.write_value(incline, bytearray([0x66, 0x00, 0x00]), key='incline')
+        self.queue.write_value(self.control_point, bytearray([0x04, 50]), on_success=lambda: self.results.append(50), key='resistance')
+
+        # 10 is already being sent, 20, 30 and 40 are superseded by 50 which keeps the place of 20 in front of the incline command
+        self.assertEqual(self.queue.coalesced_count, 3)
+        self.queue.command_succeeded(self.control_point)
+        self.queue.command_succeeded(self.control_point)
+        self.assertEqual(self.results, [10, 50])
+        self.assertEqual(self.control_point.sent, [b'\x04\x0a', b'\x04\x32'])
+        self.assertEqual(incline.sent, [b'\x66\x00\x00'])
+
+if __name__ == '__main__':
+    unittest.main()
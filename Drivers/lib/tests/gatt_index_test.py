@@ -0,0 +1,48 @@
+import unittest
+import os
+import sys
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from gatt_index import GattIndex, normalize_uuid
+
+class FakeAttribute:
+    def __init__(self, uuid, characteristics=()):
+        self.uuid = uuid
+        self.characteristics = list(characteristics)
+
+class NormalizeUUIDTesting(unittest.TestCase):
+    def test_sig_assigned_uuids_become_16_bit_keys(self):
+        self.assertEqual(normalize_uuid("00002ad2-0000-1000-8000-00805f9b34fb"), 0x2ad2)
+        self.assertEqual(normalize_uuid("00001826-0000-1000-8000-00805F9B34FB"), 0x1826)
+        self.assertEqual(normalize_uuid("2ad9"), 0x2ad9)
+        self.assertEqual(normalize_uuid(0x2ad9), 0x2ad9)
+
+    def test_custom_uuids_keep_128_bits(self):
+        self.assertEqual(normalize_uuid("a026ee0b-0a7d-4ab3-97fa-f1500f9feb8b"), 0xa026ee0b0a7d4ab397faf1500f9feb8b)
+        self.assertEqual(normalize_uuid("a026ee0b0a7d4ab397faf1500f9feb8b"), normalize_uuid("A026EE0B-0A7D-4AB3-97FA-F1500F9FEB8B"))
+
+class GattIndexTesting(unittest.TestCase):
+    def setUp(self):
+        self.indoor_bike_data = FakeAttribute("00002ad2-0000-1000-8000-00805f9b34fb")
+        self.control_point = FakeAttribute("00002ad9-0000-1000-8000-00805f9b34fb")
+        self.ftms = FakeAttribute("00001826-0000-1000-8000-00805f9b34fb", [self.indoor_bike_data, self.control_point])
+        self.incline_characteristic = FakeAttribute("a026e037-0a7d-4ab3-97fa-f1500f9feb8b")
+        self.incline_service = FakeAttribute("a026ee0b-0a7d-4ab3-97fa-f1500f9feb8b", [self.incline_characteristic])
+        self.gatt_index = GattIndex([self.ftms, self.incline_service])
+
+    def test_find_services_and_characteristics(self):
+        self.assertIs(self.gatt_index.find(0x1826), self.ftms)
+        self.assertIs(self.gatt_index.find(0x1826, 0x2ad2), self.indoor_bike_data)
+        self.assertIs(self.gatt_index.find(0x1826, 0x2ad9), self.control_point)
+        self.assertIs(self.gatt_index.find("a026ee0b0a7d4ab397faf1500f9feb8b", "a026e0370a7d4ab397faf1500f9feb8b"), self.incline_characteristic)
+        self.assertIs(self.gatt_index.find_characteristic(0x2ad2), self.indoor_bike_data)
+
+    def test_missing_services_and_characteristics(self):
+        self.assertIsNone(self.gatt_index.find(0x180d))
+        self.assertIsNone(self.gatt_index.find(0x180d, 0x2a37))
+        self.assertIsNone(self.gatt_index.find(0x1826, 0x2a37))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+import math
+import random
+import os
+import sys
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from hrv import RollingHRV
+
+# the HRV of a list of RR intervals (in 1/1024 s) computed from scratch, in milliseconds
+def reference_hrv(intervals):
+    milliseconds = [interval * 1000.0 / 1024 for interval in intervals]
+    mean = sum(milliseconds) / len(milliseconds)
+    differences = [b - a for a, b in zip(milliseconds, milliseconds[1:])]
+    return {
+        "sdnn": math.sqrt(sum((value - mean) ** 2 for value in milliseconds) / (len(milliseconds) - 1)),
+        "rmssd": math.sqrt(sum(difference ** 2 for difference in differences) / len(differences)),
+        "pnn50": 100.0 * sum(1 for difference in differences if abs(difference) > 50) / len(differences)
+    }
+
+class RollingHRVTesting(unittest.TestCase):
+    def assertHRV(self, hrv, intervals):
+        expected = reference_hrv(intervals)
+        summary = hrv.summary()
+        for name in ('sdnn', 'rmssd', 'pnn50'):
+            self.assertAlmostEqual(summary[name], expected[name], places=6)
+        self.assertEqual(summary["beats"], len(intervals))
+
+    def test_matches_the_reference_before_the_window_is_full(self):
+        hrv = RollingHRV(window=60)
+        intervals = [800, 850, 790, 900, 760, 820]
+        for interval in intervals:
+            self.assertTrue(hrv.add(interval))
+        self.assertHRV(hrv, intervals)
+        self.assertAlmostEqual(hrv.summary()["meanRR"], sum(intervals) / len(intervals) * 1000 / 1024)
+
+    def test_rolling_window_matches_the_reference(self):
+        generator = random.Random(7)
+        hrv = RollingHRV(window=10)
+        intervals = []
+        for _ in range(2000):
+            interval = generator.randint(400, 1100)
+            hrv.add(interval)
+            intervals.append(interval)
+
+        # the window keeps the most recent intervals that fit in 10 seconds
+        in_window = []
+        for interval in reversed(intervals):
+            if sum(in_window) + interval > 10 * 1024:
+                break
+            in_window.insert(0, interval)
+        self.assertHRV(hrv, in_window)
+
+    def test_rejected_intervals_break_the_successive_differences(self):
+        hrv = RollingHRV(window=60)
+        for interval in (800, 850, 3000, 900, 960):
+            hrv.add(interval)
+
+        self.assertEqual(hrv.rejected_count, 1)
+        self.assertEqual(len(hrv), 4)
+        # only 800 -> 850 and 900 -> 960 are successive beats
+        self.assertEqual(hrv.difference_count, 2)
+        self.assertAlmostEqual(hrv.rmssd(), math.sqrt((50 ** 2 + 60 ** 2) / 2) * 1000 / 1024)
+
+    def test_memory_is_bounded_by_the_shortest_interval(self):
+        hrv = RollingHRV(window=5, min_interval=0.25)
+        for _ in range(1000):
+            hrv.add(256)
+        self.assertEqual(len(hrv), 20)
+        self.assertEqual(len(hrv.intervals), hrv.capacity)
+        self.assertEqual(hrv.rmssd(), 0.0)
+
+    def test_empty(self):
+        hrv = RollingHRV()
+        self.assertEqual(hrv.summary(), {"rmssd": None, "sdnn": None, "pnn50": None, "meanRR": None, "heartRate": None, "beats": 0})
+
+if __name__ == '__main__':
+    unittest.main()
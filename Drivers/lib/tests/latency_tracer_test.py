@@ -0,0 +1,107 @@
+import unittest
+import json
+import os
+import sys
+import tempfile
+import threading
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from latency_tracer import LatencyHistogram, LatencyTracer, LatencyReporter
+
+class FakeMQTTClient:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, topic_name, payload):
+        self.published.append((topic_name, payload))
+
+class LatencyHistogramTesting(unittest.TestCase):
+    def test_percentiles_are_within_a_bucket(self):
+        histogram = LatencyHistogram()
+        for millisecond in range(1, 101):
+            histogram.add(millisecond / 1000)
+
+        for percent in (50, 95, 99):
+            self.assertGreaterEqual(histogram.percentile(percent), percent / 1000)
+            self.assertLessEqual(histogram.percentile(percent), percent / 1000 * 1.13)
+        self.assertEqual(histogram.percentile(100), 0.1)
+
+    def test_out_of_range_latencies(self):
+        histogram = LatencyHistogram()
+        histogram.add(0)
+        histogram.add(1000)
+        self.assertEqual(histogram.percentile(50), histogram.minimum)
+        self.assertEqual(histogram.percentile(99), 1000)
+
+    def test_summary_in_milliseconds(self):
+        histogram = LatencyHistogram()
+        self.assertEqual(histogram.summary(), {"count": 0})
+        histogram.add(0.002)
+        histogram.add(0.004)
+        summary = histogram.summary()
+        self.assertEqual(summary["count"], 2)
+        self.assertAlmostEqual(summary["mean"], 3)
+        self.assertAlmostEqual(summary["max"], 4)
+        self.assertAlmostEqual(summary["p99"], 4)
+
+class LatencyTracerTesting(unittest.TestCase):
+    def test_disabled_tracer_records_nothing(self):
+        tracer = LatencyTracer(enabled=False)
+        start = tracer.begin_notification()
+        self.assertIsNone(start)
+        tracer.record('payload', tracer.start())
+        tracer.published(1)
+        tracer.acknowledged(1)
+        tracer.end_notification(start)
+        self.assertEqual(tracer.summary(), {})
+
+    def test_follows_a_notification_to_its_puback(self):
+        tracer = LatencyTracer(enabled=True)
+        start = tracer.begin_notification()
+        tracer.record('payload', tracer.start())
+        tracer.published(7)
+        tracer.end_notification(start)
+        # a message published outside of a notification (e.g. a command report) is not followed
+        tracer.published(8)
+
+        tracer.acknowledged(7)
+        tracer.acknowledged(8)
+        summary = tracer.summary()
+        self.assertEqual({stage: values["count"] for stage, values in summary.items()}, {'payload': 1, 'notify_to_publish': 1, 'notification': 1, 'notify_to_puback': 1})
+
+    def test_notifications_are_followed_per_thread(self):
+        tracer = LatencyTracer(enabled=True)
+        tracer.begin_notification()
+        other_thread = threading.Thread(target=tracer.published, args=(1,))
+        other_thread.start()
+        other_thread.join()
+        self.assertEqual(tracer.summary(), {})
+
+    def test_pending_publishes_are_bounded(self):
+        tracer = LatencyTracer(enabled=True, max_pending=2)
+        tracer.begin_notification()
+        for mid in range(5):
+            tracer.published(mid)
+        self.assertEqual(list(tracer.pending), [3, 4])
+
+class LatencyReporterTesting(unittest.TestCase):
+    def test_report_is_published_and_saved(self):
+        tracer = LatencyTracer(enabled=True)
+        tracer.add('publish', 0.001)
+        mqtt_client = FakeMQTTClient()
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'latency.json')
+            reporter = LatencyReporter(tracer, mqtt_client, 'bike/000001/latency', path, interval=60)
+            reporter.start()
+            reporter.close()
+
+            with open(path, 'r') as report_file:
+                report = json.load(report_file)
+            self.assertEqual(report["stages"]["publish"]["count"], 1)
+            self.assertEqual(mqtt_client.published[0][0], 'bike/000001/latency')
+
+if __name__ == '__main__':
+    unittest.main()
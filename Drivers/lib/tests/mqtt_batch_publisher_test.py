@@ -0,0 +1,97 @@
+import unittest
+import json
+import os
+import sys
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from mqtt_batch_publisher import BatchingMQTTPublisher, create_publisher
+
+class FakeMQTTClient:
+    def __init__(self):
+        self.published = []
+
+        self.retained = []
+
+    def publish(self, topic_name, payload, retain=False):
+        self.published.append((topic_name, payload))
+        if retain:
+            self.retained.append(topic_name)
+
+def sample(value):
+    return json.dumps({"value": value, "unitName": "m/s"})
+
+class BatchingMQTTPublisherTesting(unittest.TestCase):
+    def setUp(self):
+        self.mqtt_client = FakeMQTTClient()
+
+    def create(self, mode, **kwargs):
+        # a long window so the samples are only sent when the test flushes them
+        publisher = BatchingMQTTPublisher(self.mqtt_client, mode=mode, window=60, flush_on_exit=False, **kwargs)
+        self.addCleanup(publisher.close)
+        return publisher
+
+    def test_batch_mode_sends_one_frame_per_bike(self):
+        publisher = self.create('batch')
+        publisher.publish('bike/000001/speed', sample(1))
+        publisher.publish('bike/000001/speed', sample(2))
+        publisher.publish('bike/000001/power', sample(120))
+        publisher.publish('bike/000002/speed', sample(3))
+        self.assertEqual(self.mqtt_client.published, [])
+
+        publisher.flush()
+        published = dict(self.mqtt_client.published)
+        self.assertEqual(len(self.mqtt_client.published), 2)
+        bike_01 = json.loads(published['bike/000001/batch'])
+        self.assertEqual([s['value'] for s in bike_01['speed']], [1, 2])
+        self.assertEqual([s['value'] for s in bike_01['power']], [120])
+        self.assertEqual([s['value'] for s in json.loads(published['bike/000002/batch'])['speed']], [3])
+
+    def test_latest_mode_keeps_only_the_latest_value_per_topic(self):
+        publisher = self.create('latest')
+        for value in range(5):
+            publisher.publish('bike/000001/speed', sample(value))
+        publisher.publish('bike/000001/cadence', sample(80))
+
+        publisher.flush()
+        self.assertEqual(dict(self.mqtt_client.published), {'bike/000001/speed': sample(4), 'bike/000001/cadence': sample(80)})
+        self.assertEqual(publisher.dropped_count, 4)
+
+    def test_pending_samples_are_bounded(self):
+        publisher = self.create('batch', max_samples_per_topic=3)
+        for value in range(10):
+            publisher.publish('bike/000001/speed', sample(value))
+
+        publisher.flush()
+        self.assertEqual([s['value'] for s in json.loads(self.mqtt_client.published[0][1])['speed']], [7, 8, 9])
+        self.assertEqual(publisher.dropped_count, 7)
+
+    def test_unbuffered_topics_are_published_straight_away(self):
+        publisher = self.create('batch')
+        publisher.publish('bike/000001/resistance', sample(10))
+        self.assertEqual(self.mqtt_client.published, [('bike/000001/resistance', sample(10))])
+
+    def test_retained_messages_are_published_straight_away(self):
+        publisher = self.create('batch')
+        publisher.publish('bike/000001/speed', sample(1), retain=True)
+        publisher.publish('bike/000001/resistance', sample(10), retain=True)
+        self.assertEqual(self.mqtt_client.published, [('bike/000001/speed', sample(1)), ('bike/000001/resistance', sample(10))])
+        self.assertEqual(self.mqtt_client.retained, ['bike/000001/speed', 'bike/000001/resistance'])
+
+        publisher.close()
+        publisher.publish('bike/000001/power', sample(200), retain=True)
+        self.assertEqual(self.mqtt_client.retained[-1], 'bike/000001/power')
+
+    def test_close_flushes_pending_samples(self):
+        publisher = self.create('latest')
+        publisher.publish('bike/000001/power', sample(200))
+        publisher.close()
+        self.assertEqual(self.mqtt_client.published, [('bike/000001/power', sample(200))])
+
+    def test_create_publisher(self):
+        self.assertIs(create_publisher(self.mqtt_client, 'immediate'), self.mqtt_client)
+        self.assertRaises(Exception, create_publisher, self.mqtt_client, 'unknown')
+
+if __name__ == '__main__':
+    unittest.main()
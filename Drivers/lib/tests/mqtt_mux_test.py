@@ -0,0 +1,193 @@
+import unittest
+import io
+import os
+import sys
+import queue
+import tempfile
+import threading
+from collections import namedtuple
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from mqtt_mux import encode_frame, read_frame, topic_matches, payload_to_bytes, MuxMQTTClient, MQTTMultiplexer, MuxMessage, FRAME_PUBLISH, FRAME_SUBSCRIBE
+
+# paho's MQTTMessage with the retain flag the broker sets on retained messages
+PahoMessage = namedtuple('PahoMessage', ['topic', 'payload', 'qos', 'retain'])
+
+class FakePahoClient:
+    def __init__(self, upstream):
+        self.upstream = upstream
+        self.on_message = None
+
+    def unsubscribe(self, topic_name):
+        self.upstream.calls.put(('unsubscribe', topic_name))
+
+# stands in for the MQTTClient connected to the broker, every call is put on a queue for the test to wait for
+class FakeUpstream:
+    def __init__(self):
+        self.calls = queue.Queue()
+        self.client = FakePahoClient(self)
+        # paho's mids, which have nothing to do with the numbers of the drivers' messages
+        self.mid = 100
+
+    def get_client(self):
+        return self.client
+
+    def subscribe(self, topic_name):
+        self.calls.put(('subscribe', topic_name))
+
+    def publish(self, topic_name, payload, retain=False):
+        self.mid += 1
+        self.calls.put(('publish', topic_name, payload, retain))
+        return self.mid
+
+    # deliver a message from the broker
+    def receive(self, topic_name, payload, retain=False):
+        self.client.on_message(self.client, None, PahoMessage(topic_name, payload, 1, retain))
+
+class FrameTesting(unittest.TestCase):
+    def test_frames_round_trip(self):
+        stream = io.BytesIO(encode_frame(FRAME_PUBLISH, 'bike/000001/speed', b'{"value": 5.2}', 1) + encode_frame(FRAME_SUBSCRIBE, 'bike/+/incline'))
+        self.assertEqual(read_frame(stream), (FRAME_PUBLISH, 1, 'bike/000001/speed', b'{"value": 5.2}'))
+        self.assertEqual(read_frame(stream), (FRAME_SUBSCRIBE, 0, 'bike/+/incline', b''))
+        self.assertIsNone(read_frame(stream))
+
+    def test_truncated_frame(self):
+        self.assertIsNone(read_frame(io.BytesIO(encode_frame(FRAME_PUBLISH, 'bike/000001/speed', b'12')[:-1])))
+
+    def test_payload_to_bytes(self):
+        self.assertEqual(payload_to_bytes('10'), b'10')
+        self.assertEqual(payload_to_bytes(10), b'10')
+        self.assertEqual(payload_to_bytes(None), b'')
+        self.assertRaises(TypeError, payload_to_bytes, [1])
+
+    def test_topic_matches(self):
+        self.assertTrue(topic_matches('bike/000001/speed', 'bike/000001/speed'))
+        self.assertTrue(topic_matches('bike/+/speed', 'bike/000002/speed'))
+        self.assertTrue(topic_matches('bike/#', 'bike/000001/incline/control'))
+        self.assertTrue(topic_matches('bike/000001/#', 'bike/000001'))
+        self.assertFalse(topic_matches('bike/+/speed', 'bike/000001/speed/extra'))
+        self.assertFalse(topic_matches('bike/000001/speed', 'bike/000001'))
+        self.assertFalse(topic_matches('bike/000001/incline', 'bike/000001/incline/control'))
+
+class MQTTMultiplexerTesting(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.upstream = FakeUpstream()
+        self.multiplexer = MQTTMultiplexer(self.upstream, os.path.join(directory.name, 'mux.sock'))
+
+        server_thread = threading.Thread(target=self.multiplexer.serve_forever, daemon=True)
+        server_thread.start()
+        self.addCleanup(server_thread.join)
+        self.addCleanup(self.multiplexer.shutdown)
+        while self.multiplexer.server is None or not os.path.exists(self.multiplexer.socket_path):
+            threading.Event().wait(0.01)
+
+    def connect(self):
+        client = MuxMQTTClient(self.multiplexer.socket_path)
+        client.setup_mqtt_client()
+        messages = queue.Queue()
+        client.get_client().on_message = lambda client, userdata, msg: messages.put((msg.topic, msg.payload))
+        client.get_client().loop_start()
+        self.addCleanup(client.loop_stop)
+        return client, messages
+
+    def next_call(self):
+        return self.upstream.calls.get(timeout=5)
+
+    def test_subscriptions_are_shared_upstream(self):
+        heartrate, heartrate_messages = self.connect()
+        workout, workout_messages = self.connect()
+
+        heartrate.subscribe('bike/000001/speed')
+        self.assertEqual(self.next_call(), ('subscribe', 'bike/000001/speed'))
+        workout.subscribe([('bike/+/speed', 0), ('bike/000001/speed', 0)])
+        self.assertEqual(self.next_call(), ('subscribe', 'bike/+/speed'))
+
+        # the broker sends the message once per upstream subscription, each driver gets it once
+        workout.publish('bike/000001/done', 'sync')
+        self.assertEqual(self.next_call(), ('publish', 'bike/000001/done', b'sync', False))
+        heartrate.publish('bike/000001/descriptor/heartrate', '{}', retain=True)
+        self.assertEqual(self.next_call(), ('publish', 'bike/000001/descriptor/heartrate', b'{}', True))
+        self.upstream.receive('bike/000001/speed', b'5.2')
+        self.assertEqual(heartrate_messages.get(timeout=5), ('bike/000001/speed', b'5.2'))
+        self.assertEqual(workout_messages.get(timeout=5), ('bike/000001/speed', b'5.2'))
+
+        # the upstream subscription is only removed once the last driver does not need it anymore
+        heartrate.loop_stop()
+        workout.unsubscribe('bike/000001/speed')
+        self.assertEqual(self.next_call(), ('unsubscribe', 'bike/000001/speed'))
+        self.assertTrue(workout_messages.empty())
+
+    def test_retained_messages_are_replayed_to_later_subscribers(self):
+        recorder, recorder_messages = self.connect()
+        recorder.subscribe('bike/000001/descriptor/#')
+        self.assertEqual(self.next_call(), ('subscribe', 'bike/000001/descriptor/#'))
+        self.upstream.receive('bike/000001/descriptor/speed', b'{"channel": "speed"}', retain=True)
+        self.assertEqual(recorder_messages.get(timeout=5), ('bike/000001/descriptor/speed', b'{"channel": "speed"}'))
+
+        # the broker does not send the retained messages again, the multiplexer does
+        workout, workout_messages = self.connect()
+        workout.subscribe('bike/000001/descriptor/#')
+        self.assertEqual(workout_messages.get(timeout=5), ('bike/000001/descriptor/speed', b'{"channel": "speed"}'))
+        self.assertTrue(self.upstream.calls.empty())
+
+        # a retained message published by a driver is cached too, an empty one clears it
+        recorder.publish('bike/000001/descriptor/power', '{"channel": "power"}', retain=True)
+        self.assertEqual(self.next_call(), ('publish', 'bike/000001/descriptor/power', b'{"channel": "power"}', True))
+        recorder.publish('bike/000001/descriptor/speed', '', retain=True)
+        self.assertEqual(self.next_call(), ('publish', 'bike/000001/descriptor/speed', b'', True))
+        fan, fan_messages = self.connect()
+        fan.subscribe('bike/000001/descriptor/#')
+        self.assertEqual(fan_messages.get(timeout=5), ('bike/000001/descriptor/power', b'{"channel": "power"}'))
+        self.assertTrue(fan_messages.empty())
+
+    def test_upstream_subscriptions_keep_their_order(self):
+        fan, _ = self.connect()
+        for _ in range(20):
+            fan.subscribe('bike/000001/speed')
+            fan.unsubscribe('bike/000001/speed')
+        calls = [self.next_call() for _ in range(40)]
+        self.assertEqual(calls, [('subscribe', 'bike/000001/speed'), ('unsubscribe', 'bike/000001/speed')] * 20)
+
+    def test_pubacks_are_passed_on_to_the_driver_that_published(self):
+        heartrate, _ = self.connect()
+        fan, _ = self.connect()
+        heartrate_acks = queue.Queue()
+        fan_acks = queue.Queue()
+        heartrate.get_client().on_publish = lambda client, userdata, mid, properties=None: heartrate_acks.put(mid)
+        fan.get_client().on_publish = lambda client, userdata, mid, properties=None: fan_acks.put(mid)
+
+        self.assertEqual([heartrate.publish('bike/000001/heartrate', '70'), heartrate.publish('bike/000001/heartrate', '71')], [1, 2])
+        self.assertEqual([self.next_call()[1] for _ in range(2)], ['bike/000001/heartrate'] * 2)
+        self.assertEqual(fan.publish('bike/000001/fan', '40'), 1)
+        self.next_call()
+
+        # upstream mids 101 and 102 are the heart rate's messages 1 and 2, 103 is the fan's message 1
+        self.multiplexer.acknowledged(102)
+        self.multiplexer.acknowledged(103)
+        self.multiplexer.acknowledged(101)
+        self.assertEqual([heartrate_acks.get(timeout=5), heartrate_acks.get(timeout=5)], [2, 1])
+        self.assertEqual(fan_acks.get(timeout=5), 1)
+
+        # paho can acknowledge a message before publish() has returned its mid
+        self.multiplexer.acknowledged(104)
+        self.assertEqual(fan.publish('bike/000001/fan', '60'), 2)
+        self.next_call()
+        self.assertEqual(fan_acks.get(timeout=5), 2)
+        self.assertEqual((self.multiplexer.pending_acks, self.multiplexer.early_acks), ({}, set()))
+
+    def test_message_callbacks(self):
+        kickr, messages = self.connect()
+        received = queue.Queue()
+        kickr.add_message_callback('bike/000001/incline/control', lambda client, userdata, msg: received.put(msg.payload))
+        self.assertEqual(self.next_call(), ('subscribe', 'bike/000001/incline/control'))
+
+        self.upstream.receive('bike/000001/incline/control', b'5')
+        self.assertEqual(received.get(timeout=5), b'5')
+        self.assertTrue(messages.empty())
+
+if __name__ == '__main__':
+    unittest.main()
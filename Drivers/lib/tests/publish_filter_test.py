@@ -0,0 +1,74 @@
+import unittest
+import os
+import sys
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from publish_filter import PublishFilter, create_publish_filter, parse_deadbands
+from ftp_analytics import resample, rolling_best
+
+class PublishFilterTesting(unittest.TestCase):
+    # the values of the samples that are published, one sample per second
+    def published(self, publish_filter, topic_name, values, start=0):
+        return [value for second, value in enumerate(values, start) if publish_filter.accept(topic_name, value, second)]
+
+    def test_idle_samples_are_suppressed_after_the_limit(self):
+        publish_filter = PublishFilter(idle_limit=3, heartbeat_interval=0)
+        self.assertEqual(self.published(publish_filter, 'bike/000001/speed', [5, 0, 0, 0, 0, 0, 4, 0]), [5, 0, 0, 0, 4, 0])
+        self.assertEqual((publish_filter.published_count, publish_filter.suppressed_count), (6, 2))
+
+    def test_idle_state_per_topic(self):
+        publish_filter = PublishFilter(idle_limit=1, heartbeat_interval=0)
+        self.assertEqual(self.published(publish_filter, 'bike/000001/speed', [0, 0]), [0])
+        self.assertTrue(publish_filter.is_idle('bike/000001/speed'))
+        self.assertFalse(publish_filter.is_idle('bike/000001/power'))
+        self.assertEqual(self.published(publish_filter, 'bike/000001/power', [0]), [0])
+
+    def test_negative_idle_limit_publishes_every_zero(self):
+        publish_filter = PublishFilter(idle_limit=-1, heartbeat_interval=0)
+        self.assertEqual(self.published(publish_filter, 'bike/000001/fan', [0] * 20), [0] * 20)
+
+    def test_deadband(self):
+        publish_filter = PublishFilter(deadbands={'power': 5}, heartbeat_interval=0)
+        self.assertEqual(self.published(publish_filter, 'bike/000001/power', [200, 203, 205, 206, 199, 212, 0]), [200, 206, 199, 212, 0])
+        # the channels without a deadband publish every value
+        self.assertEqual(self.published(publish_filter, 'bike/000001/speed', [5.0, 5.0, 5.0]), [5.0, 5.0, 5.0])
+
+    def test_zero_deadband_only_publishes_changes(self):
+        publish_filter = PublishFilter(deadbands={'heartrate': 0}, heartbeat_interval=0)
+        self.assertEqual(self.published(publish_filter, 'bike/000001/heartrate', [140, 140, 141, 141, 140]), [140, 141, 140])
+
+    def test_heartbeat(self):
+        publish_filter = PublishFilter(idle_limit=1, deadbands={'cadence': 2}, heartbeat_interval=3)
+        self.assertEqual(self.published(publish_filter, 'bike/000001/cadence', [90, 90, 91, 90, 90, 91, 90]), [90, 90, 90])
+        # an idle topic still sends a zero every heartbeat interval
+        self.assertEqual(self.published(publish_filter, 'bike/000001/speed', [0] * 8), [0, 0, 0])
+
+    def test_create_publish_filter(self):
+        publish_filter = create_publish_filter(10, 'speed=0.1, power=5', 2)
+        self.assertEqual(publish_filter.deadbands, {'speed': 0.1, 'power': 5.0})
+        self.assertIsNone(create_publish_filter(10, '', 0).heartbeat_interval)
+        # the heartbeat has to repeat a steady value before the ride analytics count it as a dropout
+        self.assertRaises(Exception, create_publish_filter, 10, 'power=5', 10)
+        self.assertRaises(Exception, create_publish_filter, 10, 'power=5', 0)
+
+    def test_steady_power_behind_a_deadband_is_not_a_dropout(self):
+        publish_filter = create_publish_filter(deadbands={'power': 5})
+        # 10 minutes of steady 200 W at about 1 Hz, with a little jitter in the notification times
+        samples = [(second + (second % 3) * 0.1, 200 + second % 3) for second in range(600)]
+        published = [(timestamp, value) for timestamp, value in samples if publish_filter.accept('bike/000001/power', value, timestamp)]
+        self.assertLess(len(published), len(samples) / 3)
+
+        series = resample(published)
+        self.assertGreater(min(series), 199)
+        self.assertGreater(rolling_best(series, durations=(300,))[300], 199)
+
+    def test_parse_deadbands(self):
+        self.assertEqual(parse_deadbands(''), {})
+        self.assertEqual(parse_deadbands('heartrate=0'), {'heartrate': 0.0})
+        for text in ('speed', 'speed=fast', '=1', 'power=-5', 'power=nan'):
+            self.assertRaises(Exception, parse_deadbands, text)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+import os
+import sys
+import tempfile
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+try:
+    import numpy as np
+    from session_recorder import SessionRecorder
+    from ride_analyzer import RideSession, load_session, time_in_zones, power_curve, cadence_histogram, decoupling, analyze_session, best_power_curve
+except ImportError:
+    np = None
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class RideAnalyzerTesting(unittest.TestCase):
+    def test_columns_resample_every_channel_onto_one_timeline(self):
+        session = RideSession.from_samples([
+            (10.0, 'power', 100), (10.5, 'power', 150), (12.2, 'power', 200),
+            (11.0, 'heartrate', 120), (20.0, 'heartrate', 130)
+        ])
+        timeline, columns = session.columns(max_gap=5)
+        self.assertEqual(timeline.tolist(), [float(t) for t in range(10, 21)])
+        self.assertEqual(columns['power'][:4].tolist(), [100, 150, 150, 200])
+        # the power samples stopped, so the power drops to 0 after the maximum gap
+        self.assertEqual(columns['power'][-1], 0)
+        self.assertTrue(np.isnan(columns['heartrate'][0]))
+        self.assertEqual(columns['heartrate'][1], 120)
+
+    def test_load_session(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'session.csv')
+            with open(path, 'w') as session_file:
+                session_file.write("0,power,100\n1,cadence,80\n2,power,110\n")
+            session = load_session(path)
+            self.assertEqual(session.channels['power'][1].tolist(), [100, 110])
+
+            speed_log = os.path.join(directory, 'speed.csv')
+            with open(speed_log, 'w') as session_file:
+                session_file.write("0,20.5\n1,21\n")
+            self.assertEqual(load_session(speed_log).channels['speed'][1].tolist(), [20.5, 21])
+
+    def test_load_recorded_session(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'session.bin')
+            recorder = SessionRecorder(path)
+            for second in range(3):
+                recorder.record(second, 'power', 200 + second)
+                recorder.record(second, 'heartrate', 130)
+            recorder.record(3, 'fan', 50)
+            recorder.close()
+
+            session = load_session(path)
+            self.assertEqual(session.channels['power'][1].tolist(), [200, 201, 202])
+            self.assertEqual(session.channels['heartrate'][0].tolist(), [0, 1, 2])
+            self.assertNotIn('fan', session.channels)
+
+    def test_time_in_zones(self):
+        power = np.array([50, 150, 250, 400, np.nan])
+        self.assertEqual(time_in_zones(power, np.array([100, 200, 300])).tolist(), [1, 1, 1, 1])
+
+    def test_power_curve(self):
+        power = np.array([100.0] * 60 + [400.0] * 5 + [200.0] * 60)
+        curve = power_curve(power, (5, 60, 300))
+        self.assertEqual(curve[5], 400)
+        self.assertAlmostEqual(curve[60], (400 * 5 + 200 * 55) / 60)
+        self.assertNotIn(300, curve)
+
+    def test_cadence_histogram(self):
+        histogram = cadence_histogram(np.array([0, 0, 85, 88, 92, np.nan]))
+        self.assertEqual(histogram['coasting'], 2)
+        self.assertEqual(histogram['seconds'][histogram['edges'].index(80)], 2)
+        self.assertEqual(sum(histogram['seconds']), 3)
+
+    def test_decoupling(self):
+        power = np.array([200.0] * 100)
+        self.assertAlmostEqual(decoupling(power, np.array([140.0] * 100)), 0)
+        # the heart rate drifts up for the same power in the second half
+        self.assertAlmostEqual(decoupling(power, np.array([140.0] * 50 + [154.0] * 50)), (1 - 140 / 154) * 100)
+
+    def test_analyze_session(self):
+        samples = [(t, 'power', 250) for t in range(600)] + [(t, 'heartrate', 150) for t in range(600)]
+        summary = analyze_session(RideSession.from_samples(samples), ftp=250, max_heart_rate=190)
+        self.assertEqual(summary['duration'], 600)
+        self.assertEqual(summary['averages']['power'], 250)
+        self.assertEqual(summary['powerZones'][3], 600)
+        self.assertEqual(summary['heartRateZones'][2], 600)
+        self.assertEqual(best_power_curve([RideSession.from_samples(samples)], (60,)), {60: 250})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import unittest
+import json
+import os
+import sys
+import tempfile
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from session_recorder import SessionRecorder, SessionReader, topic_channel
+from compact_payload import CompactPayloadEncoder
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+class FakeMQTTClient:
+    def publish(self, topic_name, payload, retain=False):
+        pass
+
+def sample(value, timestamp):
+    return json.dumps({"value": value, "unitName": "W", "timestamp": timestamp}).encode('utf-8')
+
+class SessionRecorderTesting(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'session.bin')
+        self.clock = FakeClock()
+
+    def read_all(self):
+        with SessionReader(self.path) as reader:
+            return list(reader)
+
+    def test_records_are_appended_in_blocks(self):
+        recorder = SessionRecorder(self.path, buffer_records=2, fsync_interval=60, clock=self.clock)
+        recorder.record_message('bike/000001/power', sample(200, 10.0))
+        self.assertEqual(self.read_all(), [])
+
+        recorder.record_message('bike/000001/speed', sample(5.5, 10.5))
+        self.assertEqual(self.read_all(), [(10.0, 'power', 200), (10.5, 'speed', 5.5)])
+
+        recorder.record_message('bike/000001/resistance/control', b'30')
+        recorder.close()
+        self.assertEqual(self.read_all()[-1][1:], ('resistance/control', 30))
+
+    def test_buffer_is_synced_periodically(self):
+        recorder = SessionRecorder(self.path, buffer_records=100, fsync_interval=10, clock=self.clock)
+        recorder.record(1.0, 'power', 100)
+        self.clock.now = 10
+        recorder.record(2.0, 'power', 110)
+        self.assertEqual(len(self.read_all()), 2)
+        recorder.close()
+
+    def test_batch_frames_and_unknown_channels(self):
+        recorder = SessionRecorder(self.path, clock=self.clock)
+        batch = {"speed": [{"value": 5, "timestamp": 1.0}, {"value": 6, "timestamp": 2.0}], "power": [{"value": 150, "timestamp": 1.5}]}
+        recorder.record_message('bike/000001/batch', json.dumps(batch).encode('utf-8'))
+        recorder.record_message('bike/000001/unknown', sample(1, 3.0))
+        recorder.record_message('bike/000001/power', sample("n/a", 3.0))
+        recorder.close()
+
+        self.assertEqual(self.read_all(), [(1.0, 'speed', 5), (2.0, 'speed', 6), (1.5, 'power', 150)])
+        self.assertEqual(recorder.skipped_count, 2)
+
+    def test_reader_random_access(self):
+        recorder = SessionRecorder(self.path, clock=self.clock)
+        for second in range(100):
+            recorder.record(1000.0 + second, 'cadence', second)
+        recorder.close()
+
+        # a record cut short by a crash is ignored
+        with open(self.path, 'ab') as session_file:
+            session_file.write(b'\x00' * 5)
+
+        with SessionReader(self.path) as reader:
+            self.assertEqual(len(reader), 100)
+            self.assertEqual(reader[-1], (1099.0, 'cadence', 99))
+            self.assertEqual(reader.find(1042.5), 43)
+            self.assertEqual(reader.find(0), 0)
+            self.assertEqual(reader.find(2000), 100)
+            self.assertRaises(IndexError, reader.__getitem__, 100)
+
+    def test_appends_to_an_existing_session(self):
+        recorder = SessionRecorder(self.path, clock=self.clock)
+        recorder.record(1.0, 'power', 100)
+        recorder.close()
+        recorder = SessionRecorder(self.path, clock=self.clock)
+        recorder.record(2.0, 'power', 110)
+        recorder.close()
+        self.assertEqual(len(self.read_all()), 2)
+
+    def test_compact_payloads_are_recorded(self):
+        encoder = CompactPayloadEncoder(FakeMQTTClient(), device_name='bike-pi')
+        recorder = SessionRecorder(self.path, fsync_interval=60, clock=self.clock)
+        recorder.record_message('bike/000001/power', encoder.encode('bike/000001/power', 'W', 200, 10.0))
+        recorder.record_message('bike/000001/batch', encoder.encode('bike/000001/speed', 'm/s', 5.5, 10.5) + encoder.encode('bike/000001/cadence', 'RPM', 80, 10.5))
+        recorder.close()
+        self.assertEqual(self.read_all(), [(10.0, 'power', 200), (10.5, 'speed', 5.5), (10.5, 'cadence', 80)])
+
+    def test_kickr_reports_are_recorded(self):
+        recorder = SessionRecorder(self.path, fsync_interval=60, clock=self.clock)
+        # the report topics of scripts/start_kickr.sh and lib.ble_hub.kickr_args
+        recorder.record_message('bike/000001/resistance', sample(40, 10.0))
+        recorder.record_message('bike/000001/incline', sample(-2, 10.5))
+        recorder.record_message('bike/000001/resistance/control', b'45')
+        recorder.close()
+        records = self.read_all()
+        self.assertEqual(records[:2], [(10.0, 'resistance', 40), (10.5, 'incline', -2)])
+        self.assertEqual(records[2][1:], ('resistance/control', 45))
+
+    def test_topic_channel(self):
+        self.assertEqual(topic_channel('bike/000001/incline/report'), 'incline/report')
+        self.assertIsNone(topic_channel('bike/000001'))
+
+if __name__ == '__main__':
+    unittest.main()
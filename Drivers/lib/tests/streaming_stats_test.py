@@ -0,0 +1,65 @@
+import unittest
+import os
+import sys
+import statistics
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from streaming_stats import StreamingStats
+
+class StreamingStatsTesting(unittest.TestCase):
+    def test_running_summary_matches_the_full_list(self):
+        values = [120, 180, 95.5, 240, 210, 0, 305]
+        stats = StreamingStats()
+        for value in values:
+            stats.add(value)
+
+        self.assertEqual(len(stats), len(values))
+        self.assertAlmostEqual(stats.mean, statistics.mean(values))
+        self.assertAlmostEqual(stats.variance(), statistics.variance(values))
+        self.assertAlmostEqual(stats.stdev(), statistics.stdev(values))
+        self.assertEqual((stats.minimum, stats.maximum), (0, 305))
+
+    def test_empty_stats(self):
+        stats = StreamingStats(capacity=4)
+        self.assertEqual((stats.mean, stats.variance(), stats.time_weighted_mean()), (0, 0, 0))
+        self.assertIsNone(stats.minimum)
+        self.assertEqual(stats.get_samples(), [])
+
+    def test_time_weighted_mean(self):
+        stats = StreamingStats()
+        # 100 W for 10 seconds, then a burst of 300 W samples over 1 second, then 200 W for 9 seconds
+        stats.add(100, 0)
+        stats.add(300, 10)
+        stats.add(300, 10.5)
+        stats.add(200, 11)
+        stats.add(200, 20)
+        self.assertAlmostEqual(stats.time_weighted_mean(), (100 * 10 + 300 * 1 + 200 * 9) / 20)
+        self.assertEqual(stats.duration(), 20)
+        self.assertAlmostEqual(stats.mean, 220)
+
+        # a late sample counts for the summary but not for the time-weighted mean
+        stats.add(1000, 15)
+        self.assertAlmostEqual(stats.time_weighted_mean(), (100 * 10 + 300 * 1 + 200 * 9) / 20)
+        self.assertEqual(stats.maximum, 1000)
+
+        # and the 200 W of the latest sample still holds until the next one
+        stats.add(200, 30)
+        self.assertAlmostEqual(stats.time_weighted_mean(), (100 * 10 + 300 * 1 + 200 * 19) / 30)
+
+    def test_ring_buffer_keeps_the_latest_samples(self):
+        stats = StreamingStats(capacity=3)
+        stats.add(1)
+        stats.add(2)
+        self.assertEqual(stats.get_samples(), [1, 2])
+        for value in (3, 4, 5):
+            stats.add(value)
+        self.assertEqual(stats.get_samples(), [3, 4, 5])
+        self.assertEqual(stats.mean, 3)
+
+    def test_slots(self):
+        self.assertRaises(AttributeError, setattr, StreamingStats(), 'extra', 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+import os
+import sys
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from workout_schedule import compile_schedule
+from workout_engine import WorkoutEngine
+
+# a clock that only moves forward when the engine waits
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+        self.waits = []
+
+    def __call__(self):
+        return self.now
+
+class FakeClockEngine(WorkoutEngine):
+    def wait(self, delay):
+        self.clock.waits.append(delay)
+        self.clock.now += delay
+        return self.stopped.is_set()
+
+class WorkoutEngineTesting(unittest.TestCase):
+    def setUp(self):
+        self.timeline = compile_schedule({'steps': [
+            {'type': 'step', 'label': 'Warm up', 'duration': 60, 'resistance': 20},
+            {'type': 'ramp', 'label': 'Ramp', 'duration': 240, 'step_duration': 120, 'resistance': [40, 50]},
+            {'type': 'rest', 'label': 'Rest', 'duration': 30}
+        ]})
+        self.clock = FakeClock()
+        self.events = []
+
+    def send_setpoint(self, target, value):
+        self.events.append((self.clock.now - 100, target, value))
+
+    def on_phase(self, phase):
+        self.events.append((self.clock.now - 100, phase.label))
+
+    def test_wakes_up_only_for_phases_and_setpoint_changes(self):
+        engine = FakeClockEngine(self.timeline, self.send_setpoint, on_phase=self.on_phase, clock=self.clock)
+        self.assertTrue(engine.run())
+        self.assertEqual(self.events, [
+            (0, 'Warm up'), (0, 'resistance', 20),
+            (60, 'Ramp'), (60, 'resistance', 40),
+            (180, 'resistance', 50),
+            (300, 'Rest')
+        ])
+        self.assertEqual(self.clock.waits, [60, 120, 120, 30])
+        self.assertEqual(engine.setpoints, {'resistance': 50})
+        self.assertTrue(engine.is_finished())
+
+    def test_stop(self):
+        def stop_at_the_ramp(target, value):
+            self.send_setpoint(target, value)
+            if value == 40:
+                engine.stop()
+
+        engine = FakeClockEngine(self.timeline, stop_at_the_ramp, clock=self.clock)
+        self.assertFalse(engine.run())
+        self.assertEqual(self.events, [(0, 'resistance', 20), (60, 'resistance', 40)])
+
+    def test_background_thread(self):
+        timeline = compile_schedule({'steps': [{'duration': 0.05, 'resistance': 10}, {'duration': 0.05, 'resistance': 20}]})
+        sent = []
+        engine = WorkoutEngine(timeline, lambda target, value: sent.append(value))
+        engine.start().join(5)
+        self.assertTrue(engine.is_finished())
+        self.assertEqual(sent, [10, 20])
+
+if __name__ == '__main__':
+    unittest.main()
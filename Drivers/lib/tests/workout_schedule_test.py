@@ -0,0 +1,93 @@
+import unittest
+import glob
+import os
+import sys
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from workout_schedule import compile_schedule, load_schedule, resolve_value, ramp_setpoints, SetpointEvent
+
+SCHEDULES_FOLDER = os.path.join(os.path.dirname(root_folder), 'workout_engine', 'schedules')
+
+def setpoint_values(timeline, target):
+    return [(setpoint.time, setpoint.value) for setpoint in timeline.setpoints if setpoint.target == target]
+
+class WorkoutScheduleTesting(unittest.TestCase):
+    def test_resolve_value(self):
+        params = {'resistance': 20, 'time': 2}
+        self.assertEqual(resolve_value(15, params), 15)
+        self.assertEqual(resolve_value('$resistance', params), 20)
+        self.assertEqual(resolve_value('$resistance+45', params), 65)
+        self.assertEqual(resolve_value('$time*60', params), 120)
+        self.assertEqual(resolve_value('$time*60-30', params), 90)
+        self.assertRaises(ValueError, resolve_value, '$missing', params)
+        self.assertRaises(ValueError, resolve_value, 'resistance', params)
+
+    def test_stair_ramp_replaces_the_strength_workout_loop(self):
+        timeline = compile_schedule(load_schedule(os.path.join(SCHEDULES_FOLDER, 'strength.json')), {'resistance': 60, 'time': 20})
+        # +5 every 2 minutes, capped at 100%
+        self.assertEqual(setpoint_values(timeline, 'resistance'), [(i * 120, value) for i, value in enumerate([60, 65, 70, 75, 80, 85, 90, 95, 100])])
+        self.assertEqual(timeline.duration, 1200)
+
+    def test_stair_increment_does_not_depend_on_the_workout_length(self):
+        strength = compile_schedule(load_schedule(os.path.join(SCHEDULES_FOLDER, 'strength.json')), {'resistance': 20, 'time': 10})
+        self.assertEqual(setpoint_values(strength, 'resistance'), [(0, 20), (120, 25), (240, 30), (360, 35), (480, 40)])
+        # +1% every 4 minutes, the incline topic only accepts whole percents
+        endurance = compile_schedule(load_schedule(os.path.join(SCHEDULES_FOLDER, 'endurance.json')), {'incline': 0, 'time': 10})
+        self.assertEqual(setpoint_values(endurance, 'incline'), [(0, 0), (240, 1), (480, 2)])
+        self.assertRaises(ValueError, compile_schedule, {'steps': [{'type': 'ramp', 'duration': 60, 'resistance': {'start': 10, 'increment': 5}}]})
+        self.assertRaises(ValueError, compile_schedule, {'steps': [{'type': 'ramp', 'duration': 600, 'step_duration': 120, 'incline': {'start': 0, 'increment': 0.5}}]})
+
+    def test_every_endurance_stair_changes_the_incline(self):
+        endurance = compile_schedule(load_schedule(os.path.join(SCHEDULES_FOLDER, 'endurance.json')), {'incline': 2, 'time': 60})
+        stairs = setpoint_values(endurance, 'incline')
+        self.assertEqual(len(stairs), 15)
+        for (previous_time, previous_value), (time, value) in zip(stairs, stairs[1:]):
+            self.assertEqual(time - previous_time, 240)
+            self.assertEqual(value - previous_value, 1)
+
+    def test_linear_ramp_only_emits_changed_setpoints(self):
+        self.assertEqual(list(ramp_setpoints('incline', 0, 4, 80)), [(0, 0), (10, 1), (30, 2), (50, 3), (70, 4)])
+        self.assertEqual(list(ramp_setpoints('incline', 2, 0, 40)), [(0, 2), (10, 1), (30, 0)])
+
+    def test_repeat_rest_and_unchanged_setpoints(self):
+        schedule = {'steps': [
+            {'type': 'step', 'duration': 60, 'resistance': 30, 'incline': 2},
+            {'type': 'repeat', 'count': 2, 'steps': [
+                {'type': 'step', 'label': 'Work', 'duration': 120, 'resistance': 60, 'incline': 2},
+                {'type': 'rest', 'duration': 30, 'resistance': 30}
+            ]},
+            {'type': 'rest', 'duration': 60}
+        ]}
+        timeline = compile_schedule(schedule)
+        self.assertEqual(timeline.setpoints, [
+            SetpointEvent(0, 'resistance', 30), SetpointEvent(0, 'incline', 2),
+            SetpointEvent(60, 'resistance', 60), SetpointEvent(180, 'resistance', 30),
+            SetpointEvent(210, 'resistance', 60), SetpointEvent(330, 'resistance', 30)
+        ])
+        self.assertEqual([(phase.start, phase.label) for phase in timeline.phases], [(0, 'step'), (60, 'Work'), (180, 'rest'), (210, 'Work'), (330, 'rest'), (360, 'rest')])
+        self.assertEqual(timeline.duration, 420)
+
+    def test_between_steps_are_not_added_after_the_last_repetition(self):
+        timeline = compile_schedule(load_schedule(os.path.join(SCHEDULES_FOLDER, 'threshold.json')), {'interval': 3, 'duration': 5, 'rest': 60})
+        self.assertEqual([(phase.start, phase.type) for phase in timeline.phases], [(0, 'step'), (300, 'rest'), (360, 'step'), (660, 'rest'), (720, 'step')])
+        self.assertEqual(timeline.duration, 1020)
+
+    def test_setpoints_are_clamped_to_the_trainer_range(self):
+        timeline = compile_schedule({'steps': [{'duration': 10, 'resistance': 150, 'incline': -15.4}]})
+        self.assertEqual([setpoint.value for setpoint in timeline.setpoints], [100, -10])
+
+    def test_invalid_steps(self):
+        self.assertRaises(ValueError, compile_schedule, {'steps': [{'type': 'sprint', 'duration': 10}]})
+        self.assertRaises(ValueError, compile_schedule, {'steps': [{'duration': 0}]})
+
+    def test_all_schedules_compile(self):
+        paths = glob.glob(os.path.join(SCHEDULES_FOLDER, '*.json'))
+        self.assertTrue(paths)
+        for path in paths:
+            timeline = compile_schedule(load_schedule(path))
+            self.assertGreater(timeline.duration, 0, path)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+import time
+import heapq
+import threading
+
+# drive the trainer through a compiled WorkoutTimeline (lib.workout_schedule) with the monotonic clock:
+# it sleeps until the next setpoint change or phase boundary instead of waking up every second,
+# send_setpoint(target, value) is only called when a setpoint changes and on_phase(phase) when a phase starts
+class WorkoutEngine:
+    def __init__(self, timeline, send_setpoint, on_phase=None, clock=time.monotonic):
+        self.timeline = timeline
+        self.send_setpoint = send_setpoint
+        self.on_phase = on_phase
+        self.clock = clock
+
+        self.setpoints = {}
+        self.current_phase = None
+        self.start_time = None
+        self.stopped = threading.Event()
+        self.finished = threading.Event()
+
+    # wait for the given seconds, returns True when the workout was stopped in the meantime
+    def wait(self, delay):
+        return self.stopped.wait(delay)
+
+    def elapsed(self):
+        return 0 if self.start_time is None else self.clock() - self.start_time
+
+    # run the whole workout, returns False when it was stopped before the end
+    def run(self):
+        try:
+            return self.run_timeline()
+        finally:
+            self.finished.set()
+
+    def run_timeline(self):
+        self.start_time = self.clock()
+
+        # the phases first, so a setpoint at a phase boundary is sent after the phase has been announced
+        events = [(phase.start, 0, index, phase) for index, phase in enumerate(self.timeline.phases)]
+        events += [(setpoint.time, 1, index, setpoint) for index, setpoint in enumerate(self.timeline.setpoints)]
+        heapq.heapify(events)
+
+        while events:
+            event_time, kind, _, event = heapq.heappop(events)
+            delay = self.start_time + event_time - self.clock()
+            if delay > 0 and self.wait(delay):
+                return False
+            if self.stopped.is_set():
+                return False
+
+            if kind == 0:
+                self.current_phase = event
+                if self.on_phase is not None:
+                    self.on_phase(event)
+            else:
+                self.setpoints[event.target] = event.value
+                self.send_setpoint(event.target, event.value)
+
+        delay = self.start_time + self.timeline.duration - self.clock()
+        if delay > 0 and self.wait(delay):
+            return False
+        return not self.stopped.is_set()
+
+    # run the workout in a background thread, so the caller can keep handling the sensor data
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='workout-engine', daemon=True)
+        self.thread.start()
+        return self.thread
+
+    def stop(self):
+        self.stopped.set()
+
+    def is_finished(self):
+        return self.finished.is_set()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import sys
+import json
+import math
+from collections import namedtuple
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from lib.constants import WORKOUT_TARGETS, WORKOUT_TARGET_RANGES, WORKOUT_TARGET_RESOLUTION
+
+# A workout schedule is a JSON file with a list of steps, e.g.:
+# {
+#   "name": "Strength",
+#   "params": {"resistance": 20, "time": 20},
+#   "steps": [
+#     {"type": "step", "label": "Warm up", "duration": 60, "resistance": 10},
+#     {"type": "ramp", "duration": "$time*60", "step_duration": 120, "resistance": ["$resistance", "$resistance+45"]},
+#     {"type": "ramp", "duration": "$time*60", "step_duration": 120, "incline": {"start": "$incline", "increment": 0.5}},
+#     {"type": "repeat", "count": 3, "steps": [{"type": "step", "duration": 300, "incline": 5}], "between": [{"type": "rest", "duration": 60, "incline": 0}]}
+#   ]
+# }
+# step/rest: hold the given resistance and/or incline targets for duration seconds (a rest without targets keeps the current ones)
+# ramp: go from the first to the second value linearly, or in stairs of step_duration seconds
+#       with {"start": ..., "increment": ...} instead of the two values, each stair adds the increment, whatever the duration of the ramp
+# repeat: run the nested steps count times, with the optional between steps in between them (not after the last one)
+# numbers can be given as "$name", "$name*60" or "$resistance+45", which are taken from the params (the CLI arguments can override them)
+
+SetpointEvent = namedtuple('SetpointEvent', ['time', 'target', 'value'])
+Phase = namedtuple('Phase', ['start', 'end', 'type', 'label'])
+
+# the setpoint changes and the phases of a schedule, with their times in seconds from the start of the workout
+WorkoutTimeline = namedtuple('WorkoutTimeline', ['name', 'setpoints', 'phases', 'duration'])
+
+STEP_TYPES = ('step', 'rest', 'ramp', 'repeat')
+PARAM_EXPRESSION = re.compile(r'^\$(\w+)(?:\*(-?\d+(?:\.\d+)?))?(?:([+-])(\d+(?:\.\d+)?))?$')
+
+def load_schedule(path):
+    with open(path, 'r') as schedule_file:
+        return json.load(schedule_file)
+
+# resolve a number or a "$name*factor+offset" expression
+def resolve_value(value, params):
+    if isinstance(value, (int, float)):
+        return value
+
+    match = PARAM_EXPRESSION.match(str(value))
+    if match is None:
+        raise ValueError("invalid schedule value", value)
+
+    name, factor, sign, offset = match.groups()
+    if name not in params:
+        raise ValueError("missing schedule param", name)
+
+    result = float(params[name])
+    if factor is not None:
+        result *= float(factor)
+    if offset is not None:
+        result += float(offset) if sign == '+' else -float(offset)
+    return result
+
+# round a setpoint to what the trainer accepts and keep it in the target's range
+def quantize_setpoint(target, value):
+    low, high = WORKOUT_TARGET_RANGES[target]
+    value = math.floor(value / WORKOUT_TARGET_RESOLUTION + 0.5) * WORKOUT_TARGET_RESOLUTION
+    return int(min(max(value, low), high))
+
+# the times (relative to the start of the ramp) and values of the setpoint changes of a ramp
+# with a step_increment, the value of each stair is start_value plus the increments of the stairs before it and end_value is not used
+# the increment has to be a multiple of the setpoint resolution, otherwise rounding would repeat some of the stairs
+def ramp_setpoints(target, start_value, end_value, duration, step_duration=None, step_increment=None):
+    if step_increment is not None:
+        if not step_duration:
+            raise ValueError("a ramp with an increment needs a step duration")
+        if step_increment % WORKOUT_TARGET_RESOLUTION:
+            raise ValueError("the increment of a ramp has to be a multiple of the setpoint resolution", step_increment)
+        stair_count = max(1, int(math.ceil(duration / step_duration)))
+        for stair in range(stair_count):
+            yield stair * step_duration, quantize_setpoint(target, start_value + stair * step_increment)
+        return
+
+    if step_duration:
+        # stairs: the value of each stair is on the line from start_value to end_value
+        stair_count = max(1, int(math.ceil(duration / step_duration)))
+        for stair in range(stair_count):
+            fraction = stair / (stair_count - 1) if stair_count > 1 else 0
+            yield stair * step_duration, quantize_setpoint(target, start_value + (end_value - start_value) * fraction)
+        return
+
+    # linear: the value changes whenever the line crosses the rounding boundary between two setpoints
+    yield 0, quantize_setpoint(target, start_value)
+    if start_value == end_value or duration <= 0:
+        return
+
+    first = quantize_setpoint(target, start_value)
+    last = quantize_setpoint(target, end_value)
+    direction = 1 if last > first else -1
+    for value in range(first + direction, last + direction, direction):
+        boundary = value - direction * WORKOUT_TARGET_RESOLUTION / 2
+        yield min(max((boundary - start_value) / (end_value - start_value) * duration, 0), duration), value
+
+# flatten the steps of a schedule into its setpoint changes and phases, only the setpoints that change are kept
+def compile_schedule(schedule, params=None):
+    all_params = dict(schedule.get('params', {}))
+    all_params.update(params or {})
+
+    setpoints = []
+    phases = []
+    current = {}
+
+    def set_target(time, target, value):
+        if current.get(target) != value:
+            current[target] = value
+            setpoints.append(SetpointEvent(time, target, value))
+
+    def add_steps(steps, time):
+        for step in steps:
+            step_type = step.get('type', 'step')
+            if step_type not in STEP_TYPES:
+                raise ValueError("invalid schedule step type", step_type)
+
+            if step_type == 'repeat':
+                count = int(resolve_value(step['count'], all_params))
+                for repetition in range(count):
+                    time = add_steps(step['steps'], time)
+                    if repetition < count - 1:
+                        time = add_steps(step.get('between', []), time)
+                continue
+
+            duration = resolve_value(step['duration'], all_params)
+            if duration <= 0:
+                raise ValueError("the duration of a schedule step has to be positive", step)
+
+            for target in WORKOUT_TARGETS:
+                if target not in step:
+                    continue
+
+                if step_type == 'ramp':
+                    step_duration = resolve_value(step['step_duration'], all_params) if 'step_duration' in step else None
+                    if isinstance(step[target], dict):
+                        start_value = resolve_value(step[target]['start'], all_params)
+                        end_value = None
+                        step_increment = resolve_value(step[target]['increment'], all_params)
+                    else:
+                        start_value, end_value = (resolve_value(value, all_params) for value in step[target])
+                        step_increment = None
+                    for offset, value in ramp_setpoints(target, start_value, end_value, duration, step_duration, step_increment):
+                        set_target(time + offset, target, value)
+                else:
+                    set_target(time, target, quantize_setpoint(target, resolve_value(step[target], all_params)))
+
+            phases.append(Phase(time, time + duration, step_type, step.get('label', step_type)))
+            time += duration
+
+        return time
+
+    duration = add_steps(schedule['steps'], 0)
+    setpoints.sort(key=lambda setpoint: setpoint.time)
+    return WorkoutTimeline(schedule.get('name', 'Workout'), setpoints, phases, duration)
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+from argparse import ArgumentParser
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from lib.mqtt_client import MQTTClient
+from lib.mqtt_mux import MQTTMultiplexer
+from lib.constants import MQTT_MUX_SOCKET_PATH
+
+# the one connection to HiveMQ Cloud of the Pi, the subscriptions of the drivers are restored after a reconnect
+class UpstreamMQTTClient(MQTTClient):
+    def __init__(self, broker_address, username, password):
+        super().__init__(broker_address, username, password)
+        self.multiplexer = None
+
+    def on_connect(self, client, userdata, flags, rc, properties=None):
+        super().on_connect(client, userdata, flags, rc, properties)
+        if rc == 0 and self.multiplexer is not None:
+            self.multiplexer.resubscribe()
+
+    # every message of every driver goes through this client, so the PUBACKs are only passed on to the drivers
+    def on_publish(self, client, userdata, mid, properties=None):
+        if self.multiplexer is not None:
+            self.multiplexer.acknowledged(mid)
+
+    # keep the network loop running, so paho reconnects by itself
+    def on_disconnect(self, client, userdata, rc=0, properties=None):
+        print(f"Disconnected result code: {str(rc)}")
+
+# define CLI parse arguments, the defaults are read from the same environment variables (~/.env) the drivers use
+parser = ArgumentParser(description="Share one MQTT connection to HiveMQ Cloud between the drivers and workouts of a Pi, over a local Unix socket")
+
+parser.add_argument('--socket_path', dest='socket_path', type=str, help='the Unix socket the drivers connect to, set MQTT_MUX_SOCKET to the same path for the drivers', default=MQTT_MUX_SOCKET_PATH)
+parser.add_argument('--broker_address', dest='broker_address', type=str, help='The MQTT broker address getting from HiveMQ Cloud', default=os.getenv('MQTT_HOSTNAME'))
+parser.add_argument('--username', dest='username', type=str, help='HiveMQ Cloud username', default=os.getenv('MQTT_USERNAME'))
+parser.add_argument('--password', dest='password', type=str, help='HiveMQ Cloud password', default=os.getenv('MQTT_PASSWORD'))
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    upstream = UpstreamMQTTClient(args.broker_address, args.username, args.password)
+    upstream.setup_mqtt_client()
+    multiplexer = MQTTMultiplexer(upstream, args.socket_path)
+    upstream.multiplexer = multiplexer
+    upstream.loop_start()
+
+    try:
+        multiplexer.serve_forever()
+    except KeyboardInterrupt:
+        print('Exit the program.')
+    upstream.get_client().loop_stop()
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+from argparse import ArgumentParser
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from lib.ride_analyzer import load_session, analyze_session, best_power_curve
+
+# define CLI parse arguments
+parser = ArgumentParser(description="Analyze recorded ride sessions: zones, time in zone, HR/power decoupling, cadence histogram and power curve")
+parser.add_argument('sessions', nargs='+', help='session files of the session recorder, session CSV files with "timestamp,channel,value" rows, or speed logs of the workouts')
+parser.add_argument('--ftp', dest='ftp', type=float, help='FTP in watts for the power zones, FTP_SCORE by default', default=os.environ.get('FTP_SCORE'))
+parser.add_argument('--max_heart_rate', dest='max_heart_rate', type=float, help='maximum heart rate in BPM for the heart rate zones', default=os.environ.get('MAX_HEART_RATE'))
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    ftp = float(args.ftp) if args.ftp else None
+    max_heart_rate = float(args.max_heart_rate) if args.max_heart_rate else None
+
+    sessions = []
+    for path in args.sessions:
+        session = load_session(path)
+        sessions.append(session)
+        print(json.dumps({"session": path, **analyze_session(session, ftp, max_heart_rate)}))
+
+    if len(sessions) > 1:
+        print(json.dumps({"bestPowerCurve": best_power_curve(sessions)}))
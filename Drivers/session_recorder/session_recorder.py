@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+from argparse import ArgumentParser
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from lib.mqtt_client import MQTTClient
+from lib.mqtt_mux import create_mqtt_client
+from lib.session_recorder import SessionRecorder
+from lib.constants import SESSION_FOLDER, SESSION_FSYNC_INTERVAL
+
+# define CLI parse arguments, the defaults are read from the same environment variables (~/.env) the drivers use
+parser = ArgumentParser(description="Record every MQTT sample of a bike to a compact binary session file")
+
+parser.add_argument('--output', dest='output', type=str, help='the session file, a new file named after the start time in the sessions folder by default')
+parser.add_argument('--sessions_folder', dest='sessions_folder', type=str, help='the folder of the session files', default=SESSION_FOLDER)
+parser.add_argument('--fsync_interval', dest='fsync_interval', type=float, help='seconds between fsyncs of the session file', default=SESSION_FSYNC_INTERVAL)
+parser.add_argument('--device_id', dest='device_id', type=str, help='the bike to record', default=os.getenv('DEVICE_ID'))
+parser.add_argument('--broker_address', dest='broker_address', type=str, help='The MQTT broker address getting from HiveMQ Cloud', default=os.getenv('MQTT_HOSTNAME'))
+parser.add_argument('--username', dest='username', type=str, help='HiveMQ Cloud username', default=os.getenv('MQTT_USERNAME'))
+parser.add_argument('--password', dest='password', type=str, help='HiveMQ Cloud password', default=os.getenv('MQTT_PASSWORD'))
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    output = args.output
+    if output is None:
+        sessions_folder = os.path.expanduser(args.sessions_folder)
+        os.makedirs(sessions_folder, exist_ok=True)
+        output = os.path.join(sessions_folder, time.strftime('%Y%m%d-%H%M%S') + '.bin')
+
+    recorder = SessionRecorder(output, fsync_interval=args.fsync_interval)
+    print(f"Recording bike/{args.device_id} to {output}")
+
+    mqtt_client = create_mqtt_client(MQTTClient, args.broker_address, args.username, args.password)
+    mqtt_client.setup_mqtt_client()
+    mqtt_client.get_client().on_message = recorder.on_message
+    mqtt_client.subscribe(f"bike/{args.device_id}/#")
+
+    try:
+        mqtt_client.loop_forever()
+    except KeyboardInterrupt:
+        print('Exit the program.')
+    recorder.close()
+    print(f"{recorder.record_count} samples recorded, {recorder.skipped_count} skipped")
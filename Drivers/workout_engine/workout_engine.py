@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+from argparse import ArgumentParser
+from dotenv import load_dotenv
+
+root_folder = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(root_folder)
+
+from lib.mqtt_client import MQTTClient
+from lib.mqtt_mux import create_mqtt_client
+from lib.workout_schedule import load_schedule, compile_schedule
+from lib.workout_engine import WorkoutEngine
+
+SCHEDULES_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schedules')
+
+# a schedule name (e.g. 'strength') is looked up in the schedules folder, anything else is used as a path
+def schedule_path(schedule):
+    path = os.path.join(SCHEDULES_FOLDER, f"{schedule}.json")
+    return path if os.path.exists(path) else schedule
+
+# "name=value" CLI arguments to override the params of the schedule
+def parse_params(param_arguments):
+    params = {}
+    for param in param_arguments:
+        name, separator, value = param.partition('=')
+        if not separator:
+            raise ValueError("a param has to be given as name=value", param)
+        params[name] = float(value)
+    return params
+
+# define CLI parse arguments
+parser = ArgumentParser(description="Run a workout from a declarative schedule of steps, ramps and rests")
+parser.add_argument('schedule', type=str, help='a schedule name from the schedules folder (e.g. strength, endurance, threshold, ftp, ramped) or the path to a schedule JSON file')
+parser.add_argument('--param', dest='params', action='append', default=[], help='override a param of the schedule, e.g. --param resistance=30 --param time=10')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    # Load environment variables from the .env file
+    load_dotenv('/home/pi/.env')
+    deviceId = os.getenv('DEVICE_ID')
+
+    timeline = compile_schedule(load_schedule(schedule_path(args.schedule)), parse_params(args.params))
+    print(f"{timeline.name}: {len(timeline.phases)} phases, {len(timeline.setpoints)} setpoint changes, {timeline.duration / 60:.1f} minutes")
+
+    mqtt_client = create_mqtt_client(MQTTClient, os.getenv('MQTT_HOSTNAME'), os.getenv('MQTT_USERNAME'), os.getenv('MQTT_PASSWORD'))
+    mqtt_client.setup_mqtt_client()
+    mqtt_client.get_client().loop_start()
+
+    def send_setpoint(target, value):
+        print(f"Setting {target} to {value}")
+        mqtt_client.publish(f"bike/{deviceId}/{target}/control", str(value))
+
+    def print_phase(phase):
+        print(f"[{phase.start / 60:.1f} min] {phase.label} for {(phase.end - phase.start) / 60:.1f} minutes")
+
+    engine = WorkoutEngine(timeline, send_setpoint, on_phase=print_phase)
+    try:
+        if engine.run():
+            print("Workout complete.")
+    except KeyboardInterrupt:
+        engine.stop()
+        print("Workout stopped")
+    mqtt_client.get_client().loop_stop()
@@ -1,8 +1,29 @@
 source ~/.env
-~/iot/Drivers/kickr_climb_and_smart_trainer/incline_and_resistance_control.py --mac_address ${KICKR_MAC_ADDRESS} --broker_address ${MQTT_HOSTNAME} --username ${MQTT_USERNAME} --password ${MQTT_PASSWORD} --resistance_command_topic bike/${DEVICE_ID}/resistance/control --resistance_report_topic bike/${DEVICE_ID}/resistance --incline_command_topic bike/${DEVICE_ID}/incline/control --incline_report_topic bike/${DEVICE_ID}/incline --speed_report_topic bike/${DEVICE_ID}/speed --cadence_report_topic bike/${DEVICE_ID}/cadence --power_report_topic bike/${DEVICE_ID}/power &
-~/iot/Drivers/fan/fan.py &
+# one MQTT connection to HiveMQ Cloud for the drivers and the workouts, they connect to it over a local socket
+export MQTT_MUX_SOCKET=/tmp/iot_mqtt_mux.sock
+# a socket left over from a previous run would look like the multiplexer is already up
+rm -f ${MQTT_MUX_SOCKET}
+~/iot/Drivers/mqtt_mux/mqtt_mux.py --socket_path ${MQTT_MUX_SOCKET} &
+MQTT_MUX_PID=$!
 
-~/iot/Drivers/heart_rate_sensor/heartrate.py &
+# wait up to 10 seconds for the multiplexer's socket, stop if it exited (e.g. bad credentials) or never came up
+tries=0
+while [ ! -S ${MQTT_MUX_SOCKET} ]; do
+    if ! kill -0 ${MQTT_MUX_PID} 2>/dev/null; then
+        echo "The MQTT multiplexer exited before it was listening on ${MQTT_MUX_SOCKET}" >&2
+        exit 1
+    fi
+    tries=$((tries + 1))
+    if [ ${tries} -gt 20 ]; then
+        echo "The MQTT multiplexer is not listening on ${MQTT_MUX_SOCKET} after 10 seconds" >&2
+        kill ${MQTT_MUX_PID} 2>/dev/null
+        exit 1
+    fi
+    sleep 0.5
+done
+
+# one process for the Kickr, fan and heart rate sensor: one BLE device manager and one MQTT connection
+~/iot/Drivers/ble_hub/ble_hub.py --drivers kickr fan heartrate &
 cd ~/iot/Drivers/workout
 
 cd ~/iot/Tests_T3_2023
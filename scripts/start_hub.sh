@@ -0,0 +1,2 @@
+source ~/.env
+~/iot/Drivers/ble_hub/ble_hub.py
\ No newline at end of file
@@ -0,0 +1,2 @@
+source ~/.env
+~/iot/Drivers/mqtt_mux/mqtt_mux.py
\ No newline at end of file
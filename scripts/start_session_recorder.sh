@@ -0,0 +1,2 @@
+source ~/.env
+~/iot/Drivers/session_recorder/session_recorder.py